@@ -0,0 +1,432 @@
+"""
+Benchmarks for the hot paths in gamestate.py.
+
+Times FEN parsing, FEN serialization, board rendering, move application,
+perft and the local search over a fixed corpus of FEN files, and prints
+the results as JSON. The parallel search can also be timed with each
+number of worker processes up to a maximum, to see how it scales, and
+when NumPy is installed, the batch evaluation in position_arrays.py is
+timed against evaluating one position at a time. The games of the PGN
+files in the corpus are replayed to time move application from SAN, in
+plies per second. Each benchmark reports operations per second and the
+bytes each operation allocates (measured with tracemalloc in a separate,
+untimed run), and can optionally write a cProfile dump for closer
+inspection.
+
+Usage: python bench.py [--rounds N] [--number N] [--perft-depth N]
+                       [--search-depth N] [--parallel-workers N]
+                       [--pgn FILE] [--only NAME] [--profile DIR]
+                       [--output FILE]
+                       [fen-file ...]
+"""
+
+import argparse
+import cProfile
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from evaluation import evaluate
+from gamestate import GameState
+from parallel_search import ParallelSearchMoveSource
+from search import SearchMoveSource
+import perft
+import pgn
+import position_arrays
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'corpus')
+
+
+def load_corpus(paths):
+    """
+    Reads a FEN string from each of the given files and returns a list
+    of (path, FEN string) pairs.
+    """
+    corpus = []
+    for path in paths:
+        with open(path) as fen_file:
+            corpus.append((path, fen_file.read().strip()))
+    return corpus
+
+
+def _game_states(corpus):
+    states = []
+    for _, fen in corpus:
+        game_state = GameState()
+        game_state._parse_fen_str(fen)
+        states.append(game_state)
+    return states
+
+
+def bench_parse_fen_str(corpus):
+    game_state = GameState()
+    return game_state._parse_fen_str, lambda: [fen for _, fen in corpus]
+
+
+def bench_fen(corpus):
+    states = _game_states(corpus)
+    return lambda game_state: game_state.fen, lambda: states
+
+
+def bench_board_text(corpus):
+    states = _game_states(corpus)
+    return lambda game_state: game_state.board_text, lambda: states
+
+
+def bench_to_bytes(corpus):
+    states = _game_states(corpus)
+    return lambda game_state: game_state.to_bytes(), lambda: states
+
+
+def bench_from_bytes(corpus):
+    records = [game_state.to_bytes() for game_state in _game_states(corpus)]
+    return GameState.from_bytes, lambda: records
+
+
+def bench_make_move(corpus):
+    states = _game_states(corpus)
+    pairs = [(game_state, move) for game_state in states
+             for move in game_state.legal_moves()]
+
+    def setup():
+        # every move needs a fresh position to be made on, and copying
+        # it is left out of the timing
+        return [(game_state.copy(), move) for game_state, move in pairs]
+
+    return lambda pair: pair[0]._make_move(pair[1]), setup
+
+
+def bench_legal_moves(corpus):
+    states = _game_states(corpus)
+    return lambda game_state: list(game_state.legal_moves()), lambda: states
+
+
+def bench_legal_move_codes(corpus):
+    states = _game_states(corpus)
+    return lambda game_state: game_state.legal_move_codes(), lambda: states
+
+
+# Each entry maps a benchmark name to a function that takes the corpus
+# and returns an operation to time and a setup function. The setup
+# function returns the list of items the operation is called on once
+# each, and is called again before every round.
+BENCHMARKS = {
+    '_parse_fen_str': bench_parse_fen_str,
+    'fen': bench_fen,
+    'board_text': bench_board_text,
+    'to_bytes': bench_to_bytes,
+    'from_bytes': bench_from_bytes,
+    '_make_move': bench_make_move,
+    'legal_moves': bench_legal_moves,
+    'legal_move_codes': bench_legal_move_codes,
+}
+
+
+def _time_round(operation, items):
+    start = time.perf_counter()
+    for item in items:
+        operation(item)
+    return time.perf_counter() - start
+
+
+def _trace_allocations(operation, items):
+    """
+    Calls the operation on each item with tracemalloc running, and
+    returns the mean bytes allocated by a call, taken as how far the
+    traced memory peaks above what was in use when the call started,
+    and the highest peak of the whole run.
+    """
+    allocated = peak = 0
+    tracemalloc.start()
+    try:
+        for item in items:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            operation(item)
+            call_peak = tracemalloc.get_traced_memory()[1]
+            allocated += call_peak - before
+            peak = max(peak, call_peak)
+    finally:
+        tracemalloc.stop()
+    return allocated / len(items) if items else 0.0, peak
+
+
+def run_benchmark(name, corpus, rounds, number, profile_dir=None):
+    """
+    Runs one of the benchmarks in `BENCHMARKS` and returns a dict of
+    its results. Each timed round goes over the corpus `number` times,
+    and the best of `rounds` rounds is reported. Allocations are
+    measured over a single pass.
+    """
+    operation, setup = BENCHMARKS[name](corpus)
+    best = None
+    ops = 0
+    for _ in range(rounds):
+        items = [item for _ in range(number) for item in setup()]
+        ops = len(items)
+        seconds = _time_round(operation, items)
+        best = seconds if best is None else min(best, seconds)
+
+    allocated, peak = _trace_allocations(operation, setup())
+    result = {
+        'ops': ops,
+        'seconds': best,
+        'ops_per_second': ops / best if best else 0.0,
+        'allocated_bytes_per_op': allocated,
+        'peak_allocated_bytes': peak,
+    }
+    if profile_dir:
+        result['profile'] = _profile(name, operation, setup(), profile_dir)
+    return result
+
+
+def _profile(name, operation, items, profile_dir):
+    path = os.path.join(profile_dir, '{}.prof'.format(name.strip('_')))
+    profiler = cProfile.Profile()
+    profiler.runcall(_time_round, operation, items)
+    profiler.dump_stats(path)
+    return path
+
+
+def run_perft_benchmark(depth, profile_dir=None):
+    """
+    Runs the perft suite to the given depth and returns a dict with the
+    per-position results and the overall nodes per second.
+    """
+    profiler = cProfile.Profile() if profile_dir else None
+    if profiler:
+        profiler.enable()
+    results = list(perft.run_suite(depth))
+    if profiler:
+        profiler.disable()
+    nodes = sum(result['nodes'] for result in results)
+    seconds = sum(result['seconds'] for result in results)
+    ret = {
+        'depth': depth,
+        'nodes': nodes,
+        'seconds': seconds,
+        'nodes_per_second': nodes / seconds if seconds else 0.0,
+        'ok': all(result['ok'] for result in results),
+        'positions': [{key: result[key] for key in
+                       ('name', 'depth', 'nodes', 'nodes_per_second', 'ok')}
+                      for result in results if result['depth'] == depth],
+    }
+    if profiler:
+        ret['profile'] = os.path.join(profile_dir, 'perft.prof')
+        profiler.dump_stats(ret['profile'])
+    return ret
+
+
+def run_search_benchmark(corpus, depth, profile_dir=None):
+    """
+    Searches each position of the corpus to the given depth, with no
+    time limit and a fresh transposition table, and returns a dict with
+    the time each took to reach the depth and the overall nodes per
+    second.
+    """
+    profiler = cProfile.Profile() if profile_dir else None
+    positions = []
+    for path, fen in corpus:
+        game_state = GameState.from_fen(fen)
+        source = SearchMoveSource(max_depth=depth, time_limit=None)
+        if profiler:
+            profiler.enable()
+        result = source.search(game_state)
+        if profiler:
+            profiler.disable()
+        positions.append({
+            'name': os.path.basename(path),
+            'move': result.move.uci,
+            'score': result.score,
+            'nodes': result.nodes,
+            'seconds': result.seconds,
+            'nodes_per_second': (result.nodes / result.seconds
+                                 if result.seconds else 0.0),
+        })
+    nodes = sum(position['nodes'] for position in positions)
+    seconds = sum(position['seconds'] for position in positions)
+    ret = {
+        'depth': depth,
+        'nodes': nodes,
+        'seconds': seconds,
+        'nodes_per_second': nodes / seconds if seconds else 0.0,
+        'positions': positions,
+    }
+    if profiler:
+        ret['profile'] = os.path.join(profile_dir, 'search.prof')
+        profiler.dump_stats(ret['profile'])
+    return ret
+
+
+def run_parallel_benchmark(corpus, depth, max_workers):
+    """
+    Searches every position of the corpus to the given depth with the
+    parallel search, once for each number of worker processes from 1 to
+    `max_workers`, and returns a dict with the time and nodes per second
+    of each run and its speedup over a single worker.
+    """
+    states = [GameState.from_fen(fen) for _, fen in corpus]
+    runs = []
+    for workers in range(1, max_workers + 1):
+        source = ParallelSearchMoveSource(workers, time_limit=None,
+                                          max_depth=depth)
+        try:
+            nodes = 0
+            start = time.perf_counter()
+            for game_state in states:
+                nodes += source.search(game_state).nodes
+            seconds = time.perf_counter() - start
+        finally:
+            source.close()
+        runs.append({
+            'workers': workers,
+            'nodes': nodes,
+            'seconds': seconds,
+            'nodes_per_second': nodes / seconds if seconds else 0.0,
+            'speedup': runs[0]['seconds'] / seconds if runs else 1.0,
+        })
+    return {'depth': depth, 'cpus': os.cpu_count(), 'runs': runs}
+
+
+def run_batch_benchmark(corpus, number):
+    """
+    Evaluates the corpus repeated `number` times, first one GameState at
+    a time with `evaluation.evaluate()` and then as one batch, from
+    packing the boards into arrays to the scores, with
+    `position_arrays.evaluate_batch()`, and returns a dict with the
+    positions per second of each.
+    """
+    states = [GameState.from_fen(fen) for _, fen in corpus] * number
+    start = time.perf_counter()
+    for game_state in states:
+        evaluate(game_state)
+    scalar = time.perf_counter() - start
+    start = time.perf_counter()
+    position_arrays.evaluate_batch(position_arrays.encode_boards(states),
+                                   position_arrays.encode_players(states))
+    batch = time.perf_counter() - start
+    return {
+        'positions': len(states),
+        'scalar_positions_per_second': len(states) / scalar if scalar else 0.0,
+        'batch_positions_per_second': len(states) / batch if batch else 0.0,
+        'speedup': scalar / batch if batch else 0.0,
+    }
+
+
+def _replay_files(paths, fen):
+    plies = 0
+    for path in paths:
+        for _, game_state in pgn.iter_positions(path):
+            if fen:
+                game_state.fen
+            plies += 1
+    return plies
+
+
+def run_replay_benchmark(paths, rounds):
+    """
+    Replays every game of the given PGN files, reading and parsing them
+    each time, and returns a dict with the number of plies and the best
+    plies per second over `rounds` rounds, both for the replay alone and
+    for also writing every position's FEN string, as `pgn.py` does. The
+    rate at which `pgn.PGNFile` indexes the files is also given, in
+    bytes per second.
+    """
+    ret = {'files': paths, 'plies': 0}
+    best = None
+    for _ in range(rounds):
+        size = 0
+        start = time.perf_counter()
+        for path in paths:
+            pgn_file = pgn.PGNFile(path)
+            size += pgn_file.size
+            pgn_file.close()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    ret['index_bytes_per_second'] = size / best if best else 0.0
+    for name, fen in [('plies_per_second', False),
+                      ('fen_plies_per_second', True)]:
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            ret['plies'] = _replay_files(paths, fen)
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        ret[name] = ret['plies'] / best if best else 0.0
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('fen_files', nargs='*', metavar='fen-file',
+                        help='FEN files to benchmark on (default: the files '
+                        'in corpus/)')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='timed rounds per benchmark (default: 5)')
+    parser.add_argument('--number', type=int, default=100,
+                        help='passes over the corpus per round (default: 100)')
+    parser.add_argument('--perft-depth', type=int, default=3,
+                        help='perft depth, or 0 to skip perft (default: 3)')
+    parser.add_argument('--search-depth', type=int, default=3,
+                        help='search depth, or 0 to skip the search '
+                        '(default: 3)')
+    parser.add_argument('--parallel-workers', type=int, default=0,
+                        help='time the parallel search at the search depth '
+                        'with 1 to N workers (default: 0, skip)')
+    parser.add_argument('--pgn', action='append', metavar='FILE',
+                        help='PGN file to time replaying; may be repeated '
+                        '(default: the PGN files in corpus/)')
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS),
+                        help='run only the named benchmark; may be repeated')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='write a cProfile dump for each benchmark here')
+    parser.add_argument('--output', metavar='FILE',
+                        help='write the JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    paths = args.fen_files or sorted(glob.glob(os.path.join(CORPUS_DIR,
+                                                            '*.fen')))
+    corpus = load_corpus(paths)
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+
+    results = {
+        'python': platform.python_version(),
+        'corpus': [path for path, _ in corpus],
+        'benchmarks': {},
+    }
+    for name in args.only or BENCHMARKS:
+        results['benchmarks'][name] = run_benchmark(name, corpus, args.rounds,
+                                                    args.number, args.profile)
+    if args.perft_depth > 0 and not args.only:
+        results['perft'] = run_perft_benchmark(args.perft_depth, args.profile)
+    if args.search_depth > 0 and not args.only:
+        results['search'] = run_search_benchmark(corpus, args.search_depth,
+                                                 args.profile)
+    if args.parallel_workers > 0 and args.search_depth > 0 and not args.only:
+        results['parallel_search'] = run_parallel_benchmark(
+            corpus, args.search_depth, args.parallel_workers)
+    if not args.only:
+        pgn_paths = args.pgn or sorted(glob.glob(os.path.join(CORPUS_DIR,
+                                                              '*.pgn')))
+        results['replay'] = run_replay_benchmark(pgn_paths, args.rounds)
+    if position_arrays.numpy is not None and not args.only:
+        results['batch_evaluation'] = run_batch_benchmark(corpus,
+                                                          args.number)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+Bitboard helpers and precomputed attack tables.
+
+A bitboard is a Python int used as a 64-bit set of squares, where bit
+`n` stands for square `n` as numbered by the GameState board array (a1
+is bit 0, h1 is bit 7 and h8 is bit 63). Sliding piece attacks are
+found with kindergarten bitboards: the occupancy of the line through a
+square is folded down to a six bit index by a multiplication, and the
+index is looked up in a small table of first-rank attacks.
+"""
+
+WHITE = 0
+BLACK = 1
+
+# Piece letters in bitboard index order. The index of a piece of either
+# colour is its colour times six plus its kind.
+PIECES = 'PNBRQKpnbrqk'
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+FULL = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_B = FILE_A << 1
+FILE_H = FILE_A << 7
+RANK_1 = 0xFF
+RANK_8 = RANK_1 << 56
+# The c2-h7 diagonal, used to fold a file onto the top six bits.
+DIAGONAL_C2_H7 = 0x0080402010080400
+
+# Maps the ASCII code of a board letter to its bitboard index, or -1 for
+# empty squares and letters that are not pieces.
+PIECE_INDEX = [-1] * 256
+for _index, _letter in enumerate(PIECES):
+    PIECE_INDEX[ord(_letter)] = _index
+
+
+def square_bit(square):
+    """Returns a bitboard with only the given square set."""
+    return 1 << square
+
+
+def iter_squares(bitboard):
+    """Yields the squares set in the given bitboard, lowest first."""
+    while bitboard:
+        low_bit = bitboard & -bitboard
+        yield low_bit.bit_length() - 1
+        bitboard ^= low_bit
+
+
+def lowest_square(bitboard):
+    """Returns the lowest square set in a non-empty bitboard."""
+    return (bitboard & -bitboard).bit_length() - 1
+
+
+def popcount(bitboard):
+    """Returns the number of squares set in the given bitboard."""
+    return bin(bitboard).count('1')
+
+
+def _step_attacks(steps):
+    """
+    Builds a table of attacks for a piece that moves by fixed
+    (file, rank) steps, such as a knight or a king.
+    """
+    table = []
+    for square in range(64):
+        file, rank = square & 7, square >> 3
+        attacks = 0
+        for file_step, rank_step in steps:
+            to_file, to_rank = file + file_step, rank + rank_step
+            if 0 <= to_file < 8 and 0 <= to_rank < 8:
+                attacks |= 1 << (to_rank * 8 + to_file)
+        table.append(attacks)
+    return table
+
+
+def _ray_attacks(square, occupied, directions):
+    """
+    Walks each direction from the given square until the edge of the
+    board or an occupied square, which is included. This is only used
+    to build the lookup tables below.
+    """
+    file, rank = square & 7, square >> 3
+    attacks = 0
+    for file_step, rank_step in directions:
+        to_file, to_rank = file + file_step, rank + rank_step
+        while 0 <= to_file < 8 and 0 <= to_rank < 8:
+            bit = 1 << (to_rank * 8 + to_file)
+            attacks |= bit
+            if occupied & bit:
+                break
+            to_file += file_step
+            to_rank += rank_step
+    return attacks
+
+
+KNIGHT_ATTACKS = _step_attacks([(1, 2), (2, 1), (2, -1), (1, -2),
+                                (-1, -2), (-2, -1), (-2, 1), (-1, 2)])
+KING_ATTACKS = _step_attacks([(0, 1), (1, 1), (1, 0), (1, -1),
+                              (0, -1), (-1, -1), (-1, 0), (-1, 1)])
+# PAWN_ATTACKS[colour][square] is the set of squares a pawn of the given
+# colour standing on the given square attacks.
+PAWN_ATTACKS = [_step_attacks([(-1, 1), (1, 1)]),
+                _step_attacks([(-1, -1), (1, -1)])]
+
+
+def _line_mask(square, file_step, rank_step):
+    """
+    Returns the full line through the given square in one direction and
+    its opposite, excluding the square itself.
+    """
+    return _ray_attacks(square, 0, [(file_step, rank_step),
+                                    (-file_step, -rank_step)])
+
+
+DIAGONAL_MASKS = [_line_mask(square, 1, 1) for square in range(64)]
+ANTI_DIAGONAL_MASKS = [_line_mask(square, 1, -1) for square in range(64)]
+
+# FIRST_RANK_ATTACKS[file][occupancy] holds the rank attacks of a rook on
+# the first rank, where bit n of the six bit occupancy is file n + 1.
+FIRST_RANK_ATTACKS = [[_ray_attacks(file, occupancy << 1, [(1, 0), (-1, 0)])
+                       for occupancy in range(64)]
+                      for file in range(8)]
+# The first rank attacks copied up to every rank, for masking with a
+# diagonal.
+FILL_UP_ATTACKS = [[attacks * FILE_A for attacks in row]
+                   for row in FIRST_RANK_ATTACKS]
+
+
+def _file_index(occupied, file):
+    """Folds the inner squares of the given file onto six bits."""
+    return ((FILE_A & (occupied >> file)) * DIAGONAL_C2_H7 & FULL) >> 58
+
+
+def _build_a_file_attacks():
+    """
+    Builds A_FILE_ATTACKS[rank][index], the attacks along the a-file of
+    a rook on the given rank, for every occupancy of a2 to a7.
+    """
+    table = [[0] * 64 for _ in range(8)]
+    for inner in range(64):
+        occupied = 0
+        for bit in range(6):
+            if inner >> bit & 1:
+                occupied |= 1 << ((bit + 1) * 8)
+        index = _file_index(occupied, 0)
+        for rank in range(8):
+            table[rank][index] = _ray_attacks(rank * 8, occupied,
+                                              [(0, 1), (0, -1)])
+    return table
+
+
+A_FILE_ATTACKS = _build_a_file_attacks()
+
+
+def rank_attacks(square, occupied):
+    """Returns the rook attacks along the rank of the given square."""
+    shift = square & 56
+    return (FIRST_RANK_ATTACKS[square & 7][(occupied >> (shift + 1)) & 63]
+            << shift)
+
+
+def file_attacks(square, occupied):
+    """Returns the rook attacks along the file of the given square."""
+    file = square & 7
+    return A_FILE_ATTACKS[square >> 3][_file_index(occupied, file)] << file
+
+
+def _diagonal_attacks(square, occupied, masks):
+    mask = masks[square]
+    index = ((occupied & mask) * FILE_B & FULL) >> 58
+    return FILL_UP_ATTACKS[square & 7][index] & mask
+
+
+def rook_attacks(square, occupied):
+    """
+    Returns the squares attacked by a rook on the given square, given
+    the bitboard of all occupied squares.
+    """
+    return rank_attacks(square, occupied) | file_attacks(square, occupied)
+
+
+def bishop_attacks(square, occupied):
+    """
+    Returns the squares attacked by a bishop on the given square, given
+    the bitboard of all occupied squares.
+    """
+    return (_diagonal_attacks(square, occupied, DIAGONAL_MASKS)
+            | _diagonal_attacks(square, occupied, ANTI_DIAGONAL_MASKS))
+
+
+def queen_attacks(square, occupied):
+    """
+    Returns the squares attacked by a queen on the given square, given
+    the bitboard of all occupied squares.
+    """
+    return rook_attacks(square, occupied) | bishop_attacks(square, occupied)
+
+
+def _build_between():
+    """
+    Builds BETWEEN[a][b], the squares strictly between squares a and b
+    when they share a rank, file or diagonal, and 0 otherwise.
+    """
+    table = [[0] * 64 for _ in range(64)]
+    directions = [(0, 1), (1, 1), (1, 0), (1, -1),
+                  (0, -1), (-1, -1), (-1, 0), (-1, 1)]
+    for square in range(64):
+        row = table[square]
+        for file_step, rank_step in directions:
+            to_file = (square & 7) + file_step
+            to_rank = (square >> 3) + rank_step
+            between = 0
+            while 0 <= to_file < 8 and 0 <= to_rank < 8:
+                to_square = to_rank * 8 + to_file
+                row[to_square] = between
+                between |= 1 << to_square
+                to_file += file_step
+                to_rank += rank_step
+    return table
+
+
+BETWEEN = _build_between()
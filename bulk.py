@@ -0,0 +1,206 @@
+"""
+Bulk processing of FEN files.
+
+Runs one operation over every position in a file of FEN or EPD records,
+one per line, spreading the lines over a pool of worker processes in
+chunks. This avoids paying for interpreter startup and imports once per
+position, as running the task scripts on each file would. Results are
+written in the same order as the input lines. Invalid lines are
+reported on stderr with their line numbers and do not stop the run.
+
+The operations are:
+
+    validate   only report invalid lines, then print a count
+    normalize  print each position's FEN string as GameState writes it
+    show       print each position's board, as 1_show.py does
+    move       make the suggested move and print the new FEN string,
+               as 2_move.py does
+
+Usage: python bulk.py {validate,normalize,show,move} <fen-file>
+           [--workers N] [--chunk-size N] [--output FILE]
+"""
+
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from gamestate import GameState, InvalidFENFileError, iter_fen_lines
+from script_utils import NOT_FOUND, error_out
+from tablebase import TablebaseError
+
+ERROR_LINE = '{}:{}: {}'
+INVALID_FEN = 'FEN invalid: {}'
+SUMMARY = '{} positions, {} invalid'
+
+
+def _validate(game_state):
+    return None
+
+
+def _normalize(game_state):
+    return game_state.fen
+
+
+def _show(game_state):
+    return game_state.board_text + '\n'
+
+
+def _move(game_state):
+    game_state.take_turn()
+    return game_state.fen
+
+
+# Each operation takes a GameState and returns the text to write for it,
+# or None to write nothing.
+OPERATIONS = {
+    'validate': _validate,
+    'normalize': _normalize,
+    'show': _show,
+    'move': _move,
+}
+
+
+def process_chunk(operation, chunk):
+    """
+    Runs the named operation over a chunk of (line number, line) pairs
+    and returns a list with a (line number, text, error) triple for each
+    line, in the same order. Exactly one of text and error is set,
+    unless the operation writes nothing for the line.
+    """
+    function = OPERATIONS[operation]
+    results = []
+    for line_number, line in chunk:
+        try:
+            game_state = GameState.from_fen(line)
+        except InvalidFENFileError:
+            results.append((line_number, None, INVALID_FEN.format(line)))
+            continue
+        try:
+            results.append((line_number, function(game_state), None))
+        except (TablebaseError, OSError) as err:
+            results.append((line_number, None, str(err)))
+    return results
+
+
+def iter_chunks(path, chunk_size):
+    """
+    Generator. Yields the (line number, line) pairs of a FEN file in
+    lists of at most `chunk_size` pairs.
+    """
+    lines = iter_fen_lines(path)
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def map_in_processes(function, argument_tuples, workers=None):
+    """
+    Generator. Calls `function(*arguments)` for each of the argument
+    tuples in a pool of worker processes and yields the results in the
+    same order. Only a few calls per worker are handed out ahead of the
+    results being used, so memory use does not grow with the number of
+    calls.
+
+    Arguments:
+    function -- the function to call. It is sent to the workers, so it
+    must be defined at the top level of a module.
+    argument_tuples -- an iterable of tuples of arguments.
+    workers -- the number of worker processes, None for one per CPU,
+    or 0 to make the calls in this process.
+    """
+    if workers == 0:
+        for arguments in argument_tuples:
+            yield function(*arguments)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for arguments in argument_tuples:
+            pending.append(executor.submit(function, *arguments))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_results(operation, path, workers=None, chunk_size=1000):
+    """
+    Generator. Runs the named operation over every line of a FEN file
+    and yields the (line number, text, error) triples of
+    `process_chunk()` in input order.
+
+    Only a few chunks per worker are read ahead of the results being
+    written, so memory use does not grow with the size of the file.
+
+    Arguments:
+    operation -- one of the keys of `OPERATIONS`.
+    path -- the path to the FEN file.
+    workers -- the number of worker processes, None for one per CPU,
+    or 0 to do the work in this process.
+    chunk_size -- the number of lines given to a worker at a time.
+    """
+    chunks = ((operation, chunk) for chunk in iter_chunks(path, chunk_size))
+    for results in map_in_processes(process_chunk, chunks, workers):
+        yield from results
+
+
+def process_file(operation, path, output=None, errors=None, workers=None,
+                 chunk_size=1000):
+    """
+    Runs the named operation over every line of a FEN file, writing the
+    results to `output` and any errors to `errors`, which default to
+    stdout and stderr. Returns a (positions, failures) pair of counts.
+    The other arguments are as for `iter_results()`.
+    """
+    output = output or sys.stdout
+    errors = errors or sys.stderr
+    positions = failures = 0
+    results = iter_results(operation, path, workers, chunk_size)
+    for line_number, text, error in results:
+        positions += 1
+        if error is not None:
+            failures += 1
+            print(ERROR_LINE.format(path, line_number, error), file=errors)
+        elif text is not None:
+            print(text, file=output)
+    return positions, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('operation', choices=sorted(OPERATIONS))
+    parser.add_argument('fen_file', metavar='fen-file',
+                        help='file with one FEN or EPD record per line')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes, or 0 for none (default: one '
+                        'per CPU)')
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help='lines given to a worker at a time '
+                        '(default: 1000)')
+    parser.add_argument('--output', metavar='FILE',
+                        help='write the results here instead of stdout')
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.fen_file):
+        error_out(NOT_FOUND.format(args.fen_file))
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        positions, failures = process_file(
+            args.operation, args.fen_file, output, sys.stderr, args.workers,
+            args.chunk_size)
+    finally:
+        if args.output:
+            output.close()
+    if args.operation == 'validate':
+        print(SUMMARY.format(positions, failures))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Persistent cache for suggested moves.
+
+Tablebase answers only depend on the position, so once a move has been
+suggested for a position it can be reused instead of asking the API
+again. Moves are stored in a SQLite database keyed by
+`GameState.position_key`, which leaves out the move clocks.
+"""
+
+import sqlite3
+import threading
+import time
+
+
+class MoveCache:
+    """
+    Size-bounded, on-disk cache of suggested moves.
+
+    Entries older than `ttl` seconds are treated as missing. When there
+    are more than `max_entries` entries, the least recently used ones
+    are evicted. Hit, miss, expiry and eviction counts are kept for the
+    lifetime of the object and are available from `stats`.
+    """
+
+    def __init__(self, path, ttl=None, max_entries=1000000, clock=time.time):
+        """
+        Constructor for MoveCache class
+
+        Arguments:
+        path -- the path of the SQLite database file. It is created if
+        it does not exist. ':memory:' gives a cache that is not saved.
+        ttl -- the number of seconds an entry stays valid, or None for
+        entries that never expire.
+        max_entries -- the most entries kept before the least recently
+        used ones are evicted.
+        clock -- a function returning the current time in seconds.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS moves ('
+            'key TEXT PRIMARY KEY, move TEXT NOT NULL, '
+            'created REAL NOT NULL, accessed REAL NOT NULL)')
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS moves_accessed ON moves (accessed)')
+        self._size = self._connection.execute(
+            'SELECT COUNT(*) FROM moves').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def key_for(self, game_state):
+        """
+        Returns the key a GameState is stored under: its position key,
+        which leaves out the move clocks.
+        """
+        return game_state.position_key
+
+    def get(self, key):
+        """
+        Returns the move stored for the given position key, or None if
+        there is no valid entry for it.
+        """
+        now = self._clock()
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT move, created FROM moves WHERE key = ?',
+                (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            move, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._connection.execute('DELETE FROM moves WHERE key = ?',
+                                         (key,))
+                self._size -= 1
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._connection.execute(
+                'UPDATE moves SET accessed = ? WHERE key = ?', (now, key))
+            self.hits += 1
+            return move
+
+    def set(self, key, move):
+        """Stores the move suggested for the given position key."""
+        now = self._clock()
+        with self._lock:
+            cursor = self._connection.execute(
+                'UPDATE moves SET move = ?, created = ?, accessed = ? '
+                'WHERE key = ?', (move, now, now, key))
+            if cursor.rowcount == 0:
+                self._connection.execute(
+                    'INSERT INTO moves (key, move, created, accessed) '
+                    'VALUES (?, ?, ?, ?)', (key, move, now, now))
+                self._size += 1
+                if self._size > self.max_entries:
+                    self._evict(self._size - self.max_entries)
+
+    def _evict(self, count):
+        self._connection.execute(
+            'DELETE FROM moves WHERE key IN ('
+            'SELECT key FROM moves ORDER BY accessed LIMIT ?)', (count,))
+        self._size -= count
+        self.evicted += count
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def stats(self):
+        """
+        Property. A dict of the hit, miss, expiry and eviction counts,
+        along with the current number of entries.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'entries': self._size,
+        }
+
+    def close(self):
+        """Closes the database connection."""
+        self._connection.close()
@@ -0,0 +1,148 @@
+"""
+Static evaluation of GameState positions for the local search.
+
+A position is scored in centipawns from the point of view of the player
+whose turn it is, as the sum of each piece's material value and a bonus
+for the square it stands on. The piece-square tables are the simplified
+ones by Tomasz Michniewski that are often used for small engines. The
+king has one table for the middlegame and another for the endgame, and
+the two are blended by how much material is left on the board.
+"""
+
+from bitboards import PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+
+PIECE_VALUES = {PAWN: 100, KNIGHT: 320, BISHOP: 330, ROOK: 500, QUEEN: 900,
+                KING: 0}
+
+# Each table is laid out as the board looks from white's side, rank 8
+# first, so the bonus for a white piece on square n is at n ^ 56 and the
+# bonus for a black piece on square n is at n.
+_PAWN_TABLE = [
+    0, 0, 0, 0, 0, 0, 0, 0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+]
+_KNIGHT_TABLE = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+]
+_BISHOP_TABLE = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+]
+_ROOK_TABLE = [
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    0, 0, 0, 5, 5, 0, 0, 0,
+]
+_QUEEN_TABLE = [
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20,
+]
+KING_MIDDLEGAME_TABLE = [
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    20, 30, 10, 0, 0, 10, 30, 20,
+]
+KING_ENDGAME_TABLE = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50,
+]
+_TABLES = [_PAWN_TABLE, _KNIGHT_TABLE, _BISHOP_TABLE, _ROOK_TABLE,
+           _QUEEN_TABLE, KING_MIDDLEGAME_TABLE]
+
+# PIECE_SQUARE[index][square] is the value, for white, of the piece with
+# the given bitboard index standing on the given square: its material
+# plus its square bonus, negated for black pieces. The kings' entries
+# only use the middlegame table; `evaluate()` scores the kings with
+# `_king_score()` instead.
+PIECE_SQUARE = [
+    [(PIECE_VALUES[kind] + _TABLES[kind][square ^ 56]) if colour == 0
+     else -(PIECE_VALUES[kind] + _TABLES[kind][square])
+     for square in range(64)]
+    for colour in range(2) for kind in range(6)]
+
+# How much each kind of piece counts towards the middlegame, out of a
+# total of `FULL_PHASE` for the starting position.
+PHASE_WEIGHTS = {KNIGHT: 1, BISHOP: 1, ROOK: 2, QUEEN: 4}
+FULL_PHASE = 24
+# The (index, values, phase weight) of each kind of piece besides the
+# kings, for `evaluate()` to loop over.
+_EVALUATED = [(index, PIECE_SQUARE[index], PHASE_WEIGHTS.get(index % 6, 0))
+              for index in range(12) if index % 6 != KING]
+
+
+def evaluate(game_state):
+    """
+    Returns the score of the given GameState, in centipawns, for the
+    player whose turn it is. Checkmate and stalemate are left to the
+    search to find.
+    """
+    pieces = game_state._pieces
+    score = 0
+    phase = 0
+    for index, values, weight in _EVALUATED:
+        bitboard = pieces[index]
+        while bitboard:
+            low_bit = bitboard & -bitboard
+            score += values[low_bit.bit_length() - 1]
+            phase += weight
+            bitboard ^= low_bit
+    score += _king_score(pieces, min(phase, FULL_PHASE))
+    return score if game_state._player == 'w' else -score
+
+
+def _king_score(pieces, phase):
+    """
+    Returns white's king square bonus less black's, blending the
+    middlegame and endgame tables by the given phase.
+    """
+    white = (pieces[KING] & -pieces[KING]).bit_length() - 1
+    black = (pieces[KING + 6] & -pieces[KING + 6]).bit_length() - 1
+    score = 0
+    if white >= 0:
+        score += (KING_MIDDLEGAME_TABLE[white ^ 56] * phase
+                  + KING_ENDGAME_TABLE[white ^ 56] * (FULL_PHASE - phase))
+    if black >= 0:
+        score -= (KING_MIDDLEGAME_TABLE[black] * phase
+                  + KING_ENDGAME_TABLE[black] * (FULL_PHASE - phase))
+    return score // FULL_PHASE
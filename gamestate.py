@@ -1,10 +1,23 @@
-import json
+import asyncio
 import enum
+import operator
+import re
+import struct
+import warnings
 from enum import Enum
 from urllib.parse import quote_plus
-from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
+from bitboards import (WHITE, BLACK, PIECES, PAWN, KNIGHT, BISHOP, ROOK, QUEEN,
+                       KING, PIECE_INDEX, KNIGHT_ATTACKS, KING_ATTACKS,
+                       PAWN_ATTACKS, rook_attacks, bishop_attacks,
+                       lowest_square, iter_squares, popcount)
+from move import SQUARE_INDEX, PROMOTION, KIND_MASK, PROMOTION_LETTERS
+from movegen import generate_legal_moves, generate_moves
+from zobrist import (PIECE_KEYS, CASTLING_KEYS, EN_PASSANT_KEYS,
+                     BLACK_TO_MOVE_KEY)
+from tablebase import default_client
 
 
 class InvalidFENFileError(Exception):
@@ -12,24 +25,206 @@ class InvalidFENFileError(Exception):
     pass
 
 
+def _castling_right(bit, doc):
+    """
+    Returns a property for one of the castling rights, stored as a bit
+    of `GameState._castling`, that keeps the position's hash up to date
+    when it is set.
+    """
+    def getter(self):
+        return bool(self._castling & bit)
+
+    def setter(self, value):
+        castling = self._castling | bit if value else self._castling & ~bit
+        self._hash ^= CASTLING_KEYS[self._castling] ^ CASTLING_KEYS[castling]
+        self._castling = castling
+
+    return property(getter, setter, doc=doc)
+
+
+# Lookup tables for the FEN parser. Anything not in them is invalid.
+_FEN_DIGITS = {str(run): run for run in range(1, 9)}
+_FEN_PIECES = {letter: index for index, letter in enumerate(PIECES)}
+# Castling rights must be '-' or some of 'KQkq', in that order.
+_FEN_CASTLING = {'-': 0}
+for _rights in range(1, 16):
+    _FEN_CASTLING[''.join(letter for bit, letter in enumerate('KQkq')
+                          if _rights >> bit & 1)] = _rights
+del _rights
+_CASTLING_FEN = {rights: text for text, rights in _FEN_CASTLING.items()}
+# Runs of empty squares in a rank and the digit FEN writes for each.
+_EMPTY_RUNS = [(' ' * run, str(run)) for run in range(8, 0, -1)]
+# The en passant square is behind a pawn that has just moved two squares,
+# so it is on the 6th rank with white to move and the 3rd with black.
+_FEN_EN_PASSANT = {
+    player: dict([('-', None)]
+                 + [(col + row, (col, row)) for col in 'abcdefgh'])
+    for player, row in [('w', '6'), ('b', '3')]
+}
+
+
+def _parse_fen_number(number_str, name, minimum):
+    """
+    Returns the integer value of one of the move clock fields of a FEN
+    string, or raises InvalidFENFileError if it is not a plain decimal
+    number of at least `minimum`.
+    """
+    if not (number_str.isdigit() and number_str.isascii()
+            and int(number_str) >= minimum):
+        raise InvalidFENFileError('{} must be a number of at least {}, not '
+                                  '{!r}'.format(name, minimum, number_str))
+    return int(number_str)
+
+
+# Picks the board array's entries out in the order `board_text` shows
+# them: from a8 across to h8, then down a rank at a time to h1.
+_DISPLAY_ORDER = operator.itemgetter(
+    *[rank << 3 | file for rank in range(7, -1, -1) for file in range(8)])
+
+
+def write_board_texts(game_states, output, separator='\n\n'):
+    """
+    Writes the `board_text` of each of the given GameState objects to a
+    stream, followed by `separator`, filling the board template once per
+    board without building the whole report in memory.
+
+    Arguments:
+    game_states -- an iterable of GameState objects.
+    output -- a text stream, such as an open file or `sys.stdout`.
+    separator -- the text written after each board.
+    """
+    template = GameState._BOARD_TEMPLATE + separator.replace('%', '%%')
+    output.writelines(template % _DISPLAY_ORDER(game_state._squares)
+                      for game_state in game_states)
+
+
+# The layout of the records written by `GameState.to_bytes()`.
+RECORD_FORMAT = '<Q16sBBHH2x'
+_RECORD = struct.Struct(RECORD_FORMAT)
+RECORD_SIZE = _RECORD.size
+_PIECE_CODES = PIECES.encode()
+# _NIBBLES[byte] is the pair of piece indexes packed into a byte of a
+# record, low half first.
+_NIBBLES = [(byte & 15, byte >> 4) for byte in range(256)]
+_SQUARE_NAMES = [(col, row) for row in '12345678' for col in 'abcdefgh']
+
+# Tables for `GameState._make_move()`.
+_EMPTY_CODE = ord(' ')
+_OTHER_PLAYER = {'w': 'b', 'b': 'w'}
+_FULLMOVE_STEP = {'w': 0, 'b': 1}
+# _PROMOTION_CODES[letter][colour] is the ASCII code of the piece a pawn
+# of the given colour is promoted to, for either case of letter.
+_PROMOTION_CODES = {letter: (ord(letter.upper()), ord(letter.lower()))
+                    for letter in 'nbrqNBRQ'}
+# _PROMOTED_PIECES[code][colour] is the same, for the 2-bit promotion
+# code of a packed move.
+_PROMOTED_PIECES = [_PROMOTION_CODES[letter] for letter in PROMOTION_LETTERS]
+# _CASTLING_KEPT[square] is the castling rights left by a move from or to
+# the given square. Moving the king, or a rook from its starting square,
+# gives up castling with it. Any other move from one of those squares
+# means the king or rook has already moved, and a move to one captures
+# the rook, so the same rights are lost either way.
+_CASTLING_KEPT = [15] * 64
+for _square_name, _lost in [('e1', 3), ('h1', 1), ('a1', 2),
+                            ('e8', 12), ('h8', 4), ('a8', 8)]:
+    _CASTLING_KEPT[SQUARE_INDEX[_square_name]] = 15 & ~_lost
+# _MOVE_EFFECTS maps the few moves that do more than move one piece to
+# what else they do. The key is the moving piece's ASCII code << 12 |
+# the from square << 6 | the to square, and the value is (kind, square,
+# other): for _CASTLE, the rook's from and to squares; for
+# _EN_PASSANT_CAPTURE, the square of the pawn captured if the to square
+# is empty; and for _DOUBLE_PUSH, the en passant square it leaves.
+_CASTLE = 0
+_EN_PASSANT_CAPTURE = 1
+_DOUBLE_PUSH = 2
+_MOVE_EFFECTS = {}
+for _king, _row in [('K', '1'), ('k', '8')]:
+    for _to_col, _rook_cols in [('g', 'hf'), ('c', 'ad')]:
+        _MOVE_EFFECTS[ord(_king) << 12 | SQUARE_INDEX['e' + _row] << 6
+                      | SQUARE_INDEX[_to_col + _row]] = (
+            _CASTLE, SQUARE_INDEX[_rook_cols[0] + _row],
+            SQUARE_INDEX[_rook_cols[1] + _row])
+# Pawns make a double push from their home rank and capture en passant
+# from their fifth rank.
+for _pawn, _step, _home, _fifth in [('P', 8, 1, 4), ('p', -8, 6, 3)]:
+    for _file in range(8):
+        _from = _home << 3 | _file
+        _MOVE_EFFECTS[ord(_pawn) << 12 | _from << 6 | _from + 2 * _step] = (
+            _DOUBLE_PUSH, None, _SQUARE_NAMES[_from + _step])
+        _from = _fifth << 3 | _file
+        for _to in (_from + _step - 1, _from + _step + 1):
+            if _to >> 3 == (_from + _step) >> 3:
+                _MOVE_EFFECTS[ord(_pawn) << 12 | _from << 6 | _to] = (
+                    _EN_PASSANT_CAPTURE, _to - _step, None)
+del (_square_name, _lost, _king, _row, _to_col, _rook_cols, _pawn, _step,
+     _home, _fifth, _file, _from, _to)
+
+
+def _square(col, row):
+    """
+    Returns the index into the board array of the square at the given
+    column and row. Squares are numbered from a1 (0) to h8 (63), going
+    across each row before moving up to the next one.
+    """
+    return (ord(row) - 49) << 3 | (ord(col) - 97)
+
+
 class GameState:
     """Holds game state information read from a FEN file."""
 
+    __slots__ = ('_squares', '_pieces', '_occupied', '_rank_fen', '_player',
+                 '_castling', '_en_passant', '_hash', '_undo',
+                 'halfmove_clock', 'fullmove_number', 'move_source',
+                 'move_cache')
+
     ROWS = ['8', '7', '6', '5', '4', '3', '2', '1']
     COLS = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
     # When the board is displayed, each square should display a letter for the
     # piece on the square. If there is no piece, that space should be filled
     # with a single space character, denoted by the constant `EMPTY`.
     EMPTY = ' '
+    # The board itself is stored as a 64-entry bytearray holding the ASCII
+    # code of each square's letter, indexed as described in `_square()`.
+    # Alongside it, `_pieces` holds one bitboard per piece type, in the
+    # order given by `bitboards.PIECES`, and `_occupied` holds one
+    # bitboard per colour. All of them are kept in step by `_put()`.
+    # `_rank_fen` caches the FEN text of each rank, from rank 1 to rank 8,
+    # with None for ranks that have changed since they were last written.
+    _EMPTY_BOARD = EMPTY.encode() * 64
+    # Bits of `_castling`, one for each castling right still available.
+    CASTLE_WHITE_KING = 1
+    CASTLE_WHITE_QUEEN = 2
+    CASTLE_BLACK_KING = 4
+    CASTLE_BLACK_QUEEN = 8
+    # The picture of the board given by `board_text`, with a '%c' for each
+    # square, in the order given by `_DISPLAY_ORDER`, to be filled with
+    # the ASCII codes from the board array.
+    _ENCLOSING_LINE = '  ---------------------------------\n'
+    _DIVIDER_LINE = '  |-------------------------------|\n'
+    _COL_LABEL_LINE = '    a   b   c   d   e   f   g   h'
+    _BOARD_TEMPLATE = (
+        _ENCLOSING_LINE
+        + _DIVIDER_LINE.join(row + ' | %c' * 8 + ' |\n' for row in ROWS)
+        + _ENCLOSING_LINE + _COL_LABEL_LINE)
 
-    def __init__(self, fen_file_path=None):
+    def __init__(self, fen_file_path=None, move_source=None, move_cache=None):
         """
         Constructor for GameState class
 
         Arguments:
         fen_file_path -- the path to the FEN file from which the
         GameState object will be initialized.
+        move_source -- the object whose `suggest_move(game_state)`
+        method gives the moves made by `take_turn()`. Defaults to a
+        `tablebase.TablebaseClient` shared by all GameState objects.
+        move_cache -- an optional `cache.MoveCache` or
+        `transposition.TranspositionTable`, or any object with the same
+        `key_for`, `get` and `set` methods, that suggested moves are
+        looked up in before asking the move source.
         """
+        self.move_source = move_source
+        self.move_cache = move_cache
+        self._reset()
         if fen_file_path:
             with open(fen_file_path) as fen_file:
                 fen_str = fen_file.read()
@@ -38,68 +233,280 @@ class GameState:
             start = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
             self._parse_fen_str(start)
 
+    @classmethod
+    def from_fen(cls, fen_str, move_source=None, move_cache=None):
+        """
+        Returns a new GameState for the given FEN string, without reading
+        a file. An EPD record, which has no move clocks, is also accepted,
+        and gets a halfmove clock of 0 and a fullmove number of 1.
+
+        Arguments:
+        fen_str -- the FEN string or EPD record.
+        move_source -- as for the constructor.
+        move_cache -- as for the constructor.
+        """
+        game_state = cls.__new__(cls)
+        game_state.move_source = move_source
+        game_state.move_cache = move_cache
+        game_state._reset()
+        game_state._parse_fen_str(_epd_to_fen(fen_str))
+        return game_state
+
+    @classmethod
+    def iter_file(cls, path, on_error=None, move_source=None,
+                  move_cache=None):
+        """
+        Generator. Reads a file with one FEN or EPD record per line and
+        yields a new GameState, made as by `from_fen()`, for each valid
+        line, without holding more than one line in memory.
+
+        Invalid lines do not stop the file from being read. Each one is
+        passed to `on_error(line_number, line, error)`, with line numbers
+        counting from 1, or reported as a warning if `on_error` is None.
+
+        Arguments:
+        path -- the path to the file to read.
+        on_error -- a function to call for each invalid line.
+        move_source -- the move source given to each GameState.
+        move_cache -- the move cache given to each GameState.
+        """
+        for line_number, line in iter_fen_lines(path):
+            try:
+                game_state = cls.from_fen(line, move_source, move_cache)
+            except InvalidFENFileError as err:
+                if on_error is None:
+                    warnings.warn('{}:{}: invalid FEN: {!r}'.format(
+                        path, line_number, line))
+                else:
+                    on_error(line_number, line, err)
+                continue
+            yield game_state
+
+    def _reset(self):
+        """
+        Puts the GameState into a blank state, with an empty board, white
+        to move and no castling rights or en passant square, and sets the
+        hash to match. The other setters keep the hash up to date from
+        here on.
+        """
+        self._squares = bytearray(self._EMPTY_BOARD)
+        self._pieces = [0] * 12
+        self._occupied = [0, 0]
+        self._rank_fen = [None] * 8
+        self._player = 'w'
+        self._castling = 0
+        self._en_passant = None
+        self._hash = 0
+        self._undo = []
+
     def _parse_fen_str(self, fen_str):
         """
         Parse the given FEN file and load provided information into the
         GameState object.
+
+        The whole string is checked before anything is stored, so an
+        invalid one raises InvalidFENFileError, giving the reason, and
+        leaves the GameState as it was.
         """
+        fields = fen_str.split()
+        if len(fields) != 6:
+            raise InvalidFENFileError(
+                'expected 6 fields, found {}'.format(len(fields)))
+        squares, pieces, zobrist_hash = self._parse_board(fields[0])
+        player = fields[1]
+        if player != 'w' and player != 'b':
+            raise InvalidFENFileError(
+                "player must be 'w' or 'b', not {!r}".format(player))
+        castling = _FEN_CASTLING.get(fields[2])
+        if castling is None:
+            raise InvalidFENFileError(
+                'invalid castling rights {!r}'.format(fields[2]))
         try:
-            fen_list = fen_str.split()
-            self._parse_board(fen_list[0])
-            self._parse_turn(fen_list[1])
-            self._parse_castling(fen_list[2])
-            self._parse_en_passant(fen_list[3])
-            self._parse_halfmove_clock(fen_list[4])
-            self._parse_fullmove_number(fen_list[5])
-        except IndexError:
-            raise InvalidFENFileError
+            en_passant = _FEN_EN_PASSANT[player][fields[3]]
+        except KeyError:
+            raise InvalidFENFileError(
+                'invalid en passant square {!r} with {!r} to move'.format(
+                    fields[3], player)) from None
+        halfmove_clock = _parse_fen_number(fields[4], 'halfmove clock', 0)
+        fullmove_number = _parse_fen_number(fields[5], 'fullmove number', 1)
+        self._load(squares, pieces, zobrist_hash, player, castling,
+                   en_passant, halfmove_clock, fullmove_number)
 
+    def _load(self, squares, pieces, zobrist_hash, player, castling,
+              en_passant, halfmove_clock, fullmove_number):
+        """
+        Replaces the whole position with the given, already checked,
+        parts. `zobrist_hash` is the hash of the pieces alone; the keys
+        for the other parts are added to it here.
+        """
+        zobrist_hash ^= CASTLING_KEYS[castling]
+        if en_passant:
+            zobrist_hash ^= EN_PASSANT_KEYS[ord(en_passant[0]) - 97]
+        if player == 'b':
+            zobrist_hash ^= BLACK_TO_MOVE_KEY
+        self._squares = squares
+        self._pieces = pieces
+        self._occupied = [pieces[0] | pieces[1] | pieces[2] | pieces[3]
+                          | pieces[4] | pieces[5],
+                          pieces[6] | pieces[7] | pieces[8] | pieces[9]
+                          | pieces[10] | pieces[11]]
+        self._rank_fen = [None] * 8
+        self._player = player
+        self._castling = castling
+        self._en_passant = en_passant
+        self._hash = zobrist_hash
+        self._undo = []
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
 
     def _parse_board(self, board_str):
-        self.board = {}
-        row_index = 0
-        col_index = 0
+        """
+        Parses the piece placement field of a FEN string in one pass.
+        Returns the board array, the piece bitboards and the hash of the
+        pieces, or raises InvalidFENFileError if the field does not
+        describe exactly 8 ranks of 8 squares.
+        """
+        squares = bytearray(self._EMPTY_BOARD)
+        pieces = [0] * 12
+        zobrist_hash = 0
+        # FEN gives the ranks from 8 down to 1
+        rank = 7
+        file = 0
+        after_digit = False
         for char in board_str:
-            try:
-                # if number can be parsed as int, add that many empty squares
-                num = int(char)
-                for i in range(num):
-                    self._set_piece(self.COLS[col_index], self.ROWS[row_index],
-                                    self.EMPTY)
-                    col_index += 1
-            except ValueError:
-                if char == '/':
-                    # slash means go to beginning of next row
-                    col_index = 0
-                    row_index += 1
-                else:
-                    # in absence of slash or number, set the square as
-                    # containing the current piece type (given by the
-                    # character) and move on to the next square
-                    self._set_piece(self.COLS[col_index], self.ROWS[row_index],
-                                    char)
-                    col_index += 1
-
-    def _parse_turn(self, turn_str):
-        self.player = turn_str
-
-    def _parse_castling(self, castling_str):
-        self.castle_white_king = 'K' in castling_str
-        self.castle_white_queen = 'Q' in castling_str
-        self.castle_black_king = 'k' in castling_str
-        self.castle_black_queen = 'q' in castling_str
-
-    def _parse_en_passant(self, en_passant_str):
-        if en_passant_str == '-':
-            self.en_passant = None
-        else:
-            self.en_passant = tuple(en_passant_str)
+            run = _FEN_DIGITS.get(char)
+            if run is not None:
+                if after_digit:
+                    raise InvalidFENFileError(
+                        'rank {} has two digits in a row'.format(rank + 1))
+                file += run
+                after_digit = True
+                continue
+            after_digit = False
+            if char == '/':
+                if file != 8:
+                    raise InvalidFENFileError('rank {} has {} squares, not '
+                                              '8'.format(rank + 1, file))
+                if rank == 0:
+                    raise InvalidFENFileError('board has more than 8 ranks')
+                rank -= 1
+                file = 0
+                continue
+            index = _FEN_PIECES.get(char)
+            if index is None:
+                raise InvalidFENFileError(
+                    'invalid piece letter {!r}'.format(char))
+            if file >= 8:
+                raise InvalidFENFileError(
+                    'rank {} has more than 8 squares'.format(rank + 1))
+            square = rank << 3 | file
+            squares[square] = ord(char)
+            pieces[index] |= 1 << square
+            zobrist_hash ^= PIECE_KEYS[index * 64 + square]
+            file += 1
+        if rank:
+            raise InvalidFENFileError(
+                'board has {} ranks, not 8'.format(8 - rank))
+        if file != 8:
+            raise InvalidFENFileError(
+                'rank 1 has {} squares, not 8'.format(file))
+        return squares, pieces, zobrist_hash
+
+    def to_bytes(self):
+        """
+        Returns the position as a record of `RECORD_SIZE` bytes, which
+        `from_bytes()` turns back into an equal GameState much faster
+        than a FEN string can be parsed.
 
-    def _parse_halfmove_clock(self, halfmove_str):
-        self.halfmove_clock = int(halfmove_str)
+        The record is laid out as `RECORD_FORMAT`: a bitboard of the
+        occupied squares; the bitboard index of the piece on each of
+        them, from a1 up, packed two to a byte, low half first; the
+        castling bits, with 16 added when black is to move; the board
+        array index of the en passant square, or 0 if there is none; and
+        the halfmove clock and fullmove number. Raises ValueError if
+        there are more than 32 pieces or the clocks do not fit.
+        """
+        squares = self._squares
+        occupied = self._occupied[0] | self._occupied[1]
+        if popcount(occupied) > 32:
+            raise ValueError('cannot pack more than 32 pieces')
+        packed = bytearray(16)
+        count = 0
+        for square in iter_squares(occupied):
+            packed[count >> 1] |= PIECE_INDEX[squares[square]] << (
+                (count & 1) << 2)
+            count += 1
+        en_passant = self._en_passant
+        try:
+            return _RECORD.pack(
+                occupied, bytes(packed),
+                self._castling | (self._player == 'b') << 4,
+                _square(*en_passant) if en_passant else 0,
+                self.halfmove_clock, self.fullmove_number)
+        except struct.error as err:
+            raise ValueError('cannot pack move clocks {} and {}: {}'.format(
+                self.halfmove_clock, self.fullmove_number, err)) from None
 
-    def _parse_fullmove_number(self, fullmove_str):
-        self.fullmove_number = int(fullmove_str)
+    @classmethod
+    def from_bytes(cls, buffer, offset=0, move_source=None,
+                   move_cache=None):
+        """
+        Returns a new GameState for a record written by `to_bytes()`.
+        The record is read in place, so a slice of a memoryview or a
+        memory-mapped file is not copied first. Raises ValueError if the
+        record does not describe a valid position.
+
+        Arguments:
+        buffer -- a bytes-like object holding the record.
+        offset -- where in the buffer the record starts.
+        move_source -- as for the constructor.
+        move_cache -- as for the constructor.
+        """
+        (occupied, packed, flags, en_passant, halfmove_clock,
+         fullmove_number) = _RECORD.unpack_from(buffer, offset)
+        if flags >> 5:
+            raise ValueError('invalid flags {:#x}'.format(flags))
+        player = 'b' if flags & 16 else 'w'
+        if fullmove_number < 1:
+            raise ValueError('invalid fullmove number {}'.format(
+                fullmove_number))
+        if en_passant:
+            if en_passant >= 64:
+                raise ValueError('invalid en passant square {}'.format(
+                    en_passant))
+            en_passant = _SQUARE_NAMES[en_passant]
+            if en_passant[1] != ('3' if player == 'b' else '6'):
+                raise ValueError('invalid en passant square {!r} with {!r} '
+                                 'to move'.format(''.join(en_passant),
+                                                  player))
+        else:
+            en_passant = None
+        squares = bytearray(cls._EMPTY_BOARD)
+        pieces = [0] * 12
+        zobrist_hash = 0
+        piece_codes = _PIECE_CODES
+        piece_keys = PIECE_KEYS
+        for index in [index for byte in packed for index in _NIBBLES[byte]]:
+            if not occupied:
+                break
+            bit = occupied & -occupied
+            occupied ^= bit
+            square = bit.bit_length() - 1
+            try:
+                squares[square] = piece_codes[index]
+            except IndexError:
+                raise ValueError(
+                    'invalid piece index {}'.format(index)) from None
+            pieces[index] |= bit
+            zobrist_hash ^= piece_keys[index << 6 | square]
+        if occupied:
+            raise ValueError('more than 32 occupied squares')
+        game_state = cls.__new__(cls)
+        game_state.move_source = move_source
+        game_state.move_cache = move_cache
+        game_state._load(squares, pieces, zobrist_hash, player, flags & 15,
+                         en_passant, halfmove_clock, fullmove_number)
+        return game_state
 
     def _get_piece(self, col, row):
         """
@@ -112,7 +519,7 @@ class GameState:
         piece at c3, then `game_state._get_piece('c', '3')` returns
         `' '`.
         """
-        return self.board[col][row]
+        return chr(self._squares[_square(col, row)])
 
     def _set_piece(self, col, row, val):
         """
@@ -125,9 +532,162 @@ class GameState:
         row -- the row of the square.
         val -- the string value to store on the square.
         """
-        if not col in self.board.keys():
-            self.board[col] = {}
-        self.board[col][row] = val
+        self._put(_square(col, row), ord(val))
+
+    def _clear_board(self):
+        """Removes every piece from the board."""
+        zobrist_hash = self._hash
+        for index, bitboard in enumerate(self._pieces):
+            for square in iter_squares(bitboard):
+                zobrist_hash ^= PIECE_KEYS[index * 64 + square]
+        self._hash = zobrist_hash
+        self._squares = bytearray(self._EMPTY_BOARD)
+        self._pieces = [0] * 12
+        self._occupied = [0, 0]
+        self._rank_fen = [None] * 8
+
+    def _put(self, square, piece):
+        """
+        Stores a piece, given as the ASCII code of its letter, on the
+        square with the given board array index, updating the bitboards
+        to match and dropping the cached FEN text of its rank.
+        """
+        pieces = self._pieces
+        occupied = self._occupied
+        index = PIECE_INDEX[self._squares[square]]
+        if index >= 0:
+            bit = 1 << square
+            pieces[index] ^= bit
+            occupied[index >= 6] ^= bit
+            self._hash ^= PIECE_KEYS[index * 64 + square]
+        index = PIECE_INDEX[piece]
+        if index >= 0:
+            bit = 1 << square
+            pieces[index] |= bit
+            occupied[index >= 6] |= bit
+            self._hash ^= PIECE_KEYS[index * 64 + square]
+        self._squares[square] = piece
+        self._rank_fen[square >> 3] = None
+
+    @property
+    def player(self):
+        """Property. 'w' or 'b', the player whose turn it is."""
+        return self._player
+
+    @player.setter
+    def player(self, player):
+        if (player == 'b') != (self._player == 'b'):
+            self._hash ^= BLACK_TO_MOVE_KEY
+        self._player = player
+
+    castle_white_king = _castling_right(
+        CASTLE_WHITE_KING, 'Property. Whether white may castle king-side.')
+    castle_white_queen = _castling_right(
+        CASTLE_WHITE_QUEEN, 'Property. Whether white may castle queen-side.')
+    castle_black_king = _castling_right(
+        CASTLE_BLACK_KING, 'Property. Whether black may castle king-side.')
+    castle_black_queen = _castling_right(
+        CASTLE_BLACK_QUEEN, 'Property. Whether black may castle queen-side.')
+
+    @property
+    def en_passant(self):
+        """
+        Property. The en passant square as a (column, row) tuple, such
+        as ('e', '3'), or None if there is no en passant square.
+        """
+        return self._en_passant
+
+    @en_passant.setter
+    def en_passant(self, en_passant):
+        if self._en_passant:
+            self._hash ^= EN_PASSANT_KEYS[(ord(self._en_passant[0]) - 97) & 7]
+        if en_passant:
+            self._hash ^= EN_PASSANT_KEYS[(ord(en_passant[0]) - 97) & 7]
+        self._en_passant = en_passant
+
+    @property
+    def zobrist_hash(self):
+        """
+        Property. A 64-bit Zobrist hash of the position: the board, the
+        player to move, the castling rights and the en passant file. It
+        is kept up to date as the GameState changes, so reading it costs
+        nothing, and positions that differ only in their move clocks
+        share a hash. See the `zobrist` module.
+        """
+        return self._hash
+
+    @property
+    def board(self):
+        """
+        Property. A nested-dict view of the board, keyed by column and
+        then by row, e.g. `game_state.board['e']['1']`. The view reads
+        from and writes to the underlying board array, so changes made
+        through it are reflected in the game state. Columns iterate from
+        'a' to 'h' and rows from '8' to '1', as `COLS` and `ROWS` do.
+
+        The view and its columns stay live: `dict(game_state.board)`
+        holds live column views, not a copy of the board. Use
+        `copy.deepcopy(game_state.board)`, which gives plain nested
+        dicts, to keep a snapshot.
+
+        Assigning a nested dict to this property replaces the whole
+        board. Squares missing from the assigned dict are left empty.
+        The dict may be the view itself.
+        """
+        return _BoardView(self)
+
+    @board.setter
+    def board(self, board_dict):
+        # copy first, since the dict may be a view of this very board
+        board_dict = {col: dict(rows) for col, rows in board_dict.items()}
+        self._clear_board()
+        for col, rows in board_dict.items():
+            for row, val in rows.items():
+                self._set_piece(col, row, val)
+
+    def is_attacked(self, col, row, player):
+        """
+        Returns whether any piece belonging to the given player attacks
+        the given square.
+
+        Arguments:
+        col -- the column of the square.
+        row -- the row of the square.
+        player -- 'w' or 'b', the player whose pieces are checked.
+        """
+        colour = WHITE if player == 'w' else BLACK
+        occupied = self._occupied[WHITE] | self._occupied[BLACK]
+        return bool(self._attackers(_square(col, row), colour, occupied))
+
+    @property
+    def in_check(self):
+        """
+        Property. Whether the king of the player whose turn it is is
+        under attack.
+        """
+        colour = WHITE if self.player == 'w' else BLACK
+        king = self._pieces[colour * 6 + KING]
+        if not king:
+            return False
+        occupied = self._occupied[WHITE] | self._occupied[BLACK]
+        return bool(self._attackers(lowest_square(king), colour ^ 1,
+                                    occupied))
+
+    def _attackers(self, square, colour, occupied):
+        """
+        Returns a bitboard of the pieces of the given colour that attack
+        the square with the given index, with sliding pieces blocked by
+        the squares in `occupied`.
+        """
+        pieces = self._pieces
+        base = colour * 6
+        diagonal = pieces[base + BISHOP] | pieces[base + QUEEN]
+        straight = pieces[base + ROOK] | pieces[base + QUEEN]
+        return ((PAWN_ATTACKS[colour ^ 1][square] & pieces[base + PAWN])
+                | (KNIGHT_ATTACKS[square] & pieces[base + KNIGHT])
+                | (KING_ATTACKS[square] & pieces[base + KING])
+                | (bishop_attacks(square, occupied) & diagonal)
+                | (rook_attacks(square, occupied) & straight))
 
     def __str__(self):
         return self.fen
@@ -140,49 +700,44 @@ class GameState:
                  self._fullmove_to_fen()]
         return ' '.join(parts)
 
+    @property
+    def position_key(self):
+        """
+        Property. The board, turn, castling and en passant fields of the
+        FEN representation. Positions that only differ in their move
+        clocks share a key, which makes it suitable for caching answers
+        that only depend on the position.
+        """
+        parts = [self._board_to_fen(), self.player, self._castling_to_fen(),
+                 self._en_passant_to_fen()]
+        return ' '.join(parts)
+
     def _board_to_fen(self):
         """
         Returns the first part of the FEN representation, a string
-        telling the positions of pieces on the board.
-        """
-        rows = [self._row_to_fen(row) for row in self.ROWS]
-        return '/'.join(rows)
-
-    def _row_to_fen(self, row):
-        # Note: The empty count continues to add up until either the
-        # a non-empty square is reached, or the end of the row is
-        # reached, at which point the count is added to the
-        # FEN-formatted row information.
-        ret = ''
-        empty_count = 0
-        for col in self.COLS:
-            piece = self._get_piece(col, row)
-            if piece == self.EMPTY:
-                empty_count += 1
-            else:
-                if empty_count > 0:
-                    ret += str(empty_count)
-                    empty_count = 0
-                ret += piece
-        if empty_count > 0:
-            ret += str(empty_count)
+        telling the positions of pieces on the board. Only the ranks that
+        have changed since the last call are written again.
+        """
+        rank_fen = self._rank_fen
+        for rank in range(8):
+            if rank_fen[rank] is None:
+                rank_fen[rank] = self._row_to_fen(rank)
+        return '/'.join(rank_fen[::-1])
+
+    def _row_to_fen(self, rank):
+        """
+        Returns the FEN text of the rank with the given index, counting
+        from 0 for rank 1. Runs of empty squares are replaced with their
+        length, longest first, so that a run is never split.
+        """
+        ret = self._squares[rank << 3:(rank << 3) + 8].decode()
+        if self.EMPTY in ret:
+            for run, count in _EMPTY_RUNS:
+                ret = ret.replace(run, count)
         return ret
 
     def _castling_to_fen(self):
-        ret = ''
-
-        if self.castle_white_king:
-            ret += 'K'
-        if self.castle_white_queen:
-            ret += 'Q'
-        if self.castle_black_king:
-            ret += 'k'
-        if self.castle_black_queen:
-            ret += 'q'
-
-        if ret == '':
-            ret = '-'
-        return ret
+        return _CASTLING_FEN[self._castling]
 
     def _en_passant_to_fen(self):
         return ''.join(self.en_passant) if self.en_passant else '-'
@@ -199,47 +754,106 @@ class GameState:
         Property. The text to be printed to the output in order to form
         a picture of the chess board.
         """
-        ret = ''
-        ret += self._get_enclosing_line()
-        row_lines = [self._get_row_line(row) for row in self.ROWS]
-        row_lines = self._get_divider_line().join(row_lines)
-        ret += row_lines
-        ret += self._get_enclosing_line()
-        ret += self._get_col_label_line()
-        return ret
+        return self._BOARD_TEMPLATE % _DISPLAY_ORDER(self._squares)
 
-    def _get_enclosing_line(self):
+    def legal_moves(self):
         """
-        Returns the text needed to form the top or bottom edge of the
-        board.
+        Generator. Yields every legal move for the player whose turn it
+        is, as UCI strings such as 'e2e4' or 'e7e8q'.
         """
-        return '  ---------------------------------\n'
+        yield from generate_legal_moves(self)
 
-    def _get_row_line(self, row):
-        """Returns the text needed to form a row of the the board."""
-        ret = ''
-        to_join = [row] + self._get_row_list(row)
-        ret += ' | '.join(to_join)
-        ret += ' |\n'
-        return ret
+    def legal_move_codes(self, moves=None):
+        """
+        Returns every legal move for the player whose turn it is, packed
+        into ints as by the `move` module, in an `array('H')`. This is
+        much cheaper than `legal_moves()` when the moves are only going
+        to be made, not shown.
+
+        Arguments:
+        moves -- an optional `array('H')` to add the moves to.
+        """
+        return generate_moves(self, moves)
+
+    def copy(self):
+        """Returns a copy of the GameState that can be changed freely."""
+        other = GameState.__new__(GameState)
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+        other._squares = bytearray(self._squares)
+        other._pieces = list(self._pieces)
+        other._occupied = list(self._occupied)
+        other._rank_fen = list(self._rank_fen)
+        other._undo = list(self._undo)
+        return other
 
-    def _get_row_list(self, row):
+    def push(self, move):
         """
-        Returns a list of piece values for all squares in the given row,
-        in order from column a to column h.
+        Make the given move, as `_make_move()` does, and remember how to
+        take it back with `pop()`. This is much cheaper than copying the
+        GameState to try a move out.
         """
-        return [self.board[col][row] for col in self.COLS]
+        squares = self._squares
+        changed = tuple((square, squares[square])
+                        for square in self._squares_changed_by(move))
+        self._undo.append((move, changed, self._player, self._castling,
+                           self._en_passant, self.halfmove_clock,
+                           self.fullmove_number, self._hash))
+        self._make_move(move)
 
-    def _get_divider_line(self):
+    def pop(self):
         """
-        Returns the text needed to form a line between rows on the
-        board.
+        Take back the last move made with `push()`, restoring the
+        GameState to exactly how it was before, and return the move.
         """
-        return '  |-------------------------------|\n'
+        (move, changed, self._player, self._castling, self._en_passant,
+         self.halfmove_clock, self.fullmove_number, zobrist_hash) = \
+            self._undo.pop()
+        for square, piece in changed:
+            self._put(square, piece)
+        self._hash = zobrist_hash
+        return move
 
-    def _get_col_label_line(self):
-        """Returns the text needed to form the column labels."""
-        return '    a   b   c   d   e   f   g   h'
+    def _squares_changed_by(self, move):
+        """
+        Returns the board array indexes of the squares the given move
+        will change, including the rook's squares when castling and the
+        captured pawn's square when capturing en passant.
+        """
+        if isinstance(move, str):
+            from_square = SQUARE_INDEX[move[0:2]]
+            to_square = SQUARE_INDEX[move[2:4]]
+        else:
+            from_square = move & 63
+            to_square = move >> 6 & 63
+        effect = _MOVE_EFFECTS.get(
+            self._squares[from_square] << 12 | from_square << 6 | to_square)
+        if effect is not None:
+            kind, square, other = effect
+            if kind == _CASTLE:
+                return (from_square, to_square, square, other)
+            if (kind == _EN_PASSANT_CAPTURE
+                    and self._squares[to_square] == _EMPTY_CODE):
+                return (from_square, to_square, square)
+        return (from_square, to_square)
+
+    def apply_moves(self, moves):
+        """
+        Generator. Makes each of the given moves in turn, as
+        `_make_move()` does, without asking the move source, and yields
+        the GameState after each one. The same GameState is yielded
+        every time, changed in place, so read its `fen` or take a
+        `copy()` to keep a position. Moves are not checked for
+        legality, since replaying a recorded game should not pay for
+        generating every legal move.
+
+        Arguments:
+        moves -- an iterable of UCI strings or packed moves.
+        """
+        make_move = self._make_move
+        for move in moves:
+            make_move(move)
+            yield self
 
     def take_turn(self):
         """
@@ -249,83 +863,243 @@ class GameState:
         suggested_move = self._get_suggested_move()
         self._make_move(suggested_move)
 
-    def _get_suggested_move(self):
-        body = requests.get('https://syzygy-tables.info/api/v2',
-                            params={'fen': self.fen})
-        json_dict = json.loads(body.text, object_pairs_hook=OrderedDict)
-        return list(json_dict['moves'].keys())[0]
-
-    def _make_move(self, move_str):
-        """
-        Make the move described by the given columns and rows.
-        """
-        col_0, row_0, col_1, row_1 = tuple(move_str)
-        self._update_castling(col_0, row_0)
-        self._update_halfmove_clock(col_0, row_0, col_1, row_1)
-        piece = self._get_piece(col_0, row_0)
-        self._set_piece(col_0, row_0, self.EMPTY)
-        self._set_piece(col_1, row_1, piece)
-        self._update_fullmove_number()
-        self._toggle_player()
-        self._update_en_passant(col_0, row_0, col_1, row_1)
-
-    def _toggle_player(self):
-        self.player = 'b' if self.player == 'w' else 'w'
-
-    def _update_castling(self, col, row):
-        """
-        Update castling status based on where the piece moves from. For
-        checking rooks, the starting square is used instead of the piece
-        type. This is because information on where a rook started is not
-        stored in the GameState data model. If a rook is moved from one
-        of those spaces, that disqualifies the rook from being used in
-        castling. If any other piece is moved from one of those spaces,
-        that means the rook that started there has already been
-        disqualified, so the rook should still be marked as not
-        available for castling.
+    async def take_turn_async(self, executor=None):
+        """
+        Coroutine. Like `take_turn()`, but the suggested move is looked
+        up in a worker thread, so other games can be played while this
+        one waits for the API.
 
         Arguments:
-        col -- the starting column of the move to update based on.
-        row -- the starting row of the move to update based on.
-        """
-        if self._get_piece(col, row) == 'K':
-            self.castle_white_king = False
-            self.castle_white_queen = False
-        elif col == 'a' and row == '1':
-            self.castle_white_queen = False
-        elif col == 'h' and row == '1':
-            self.castle_white_king = False
-        elif self._get_piece(col, row) == 'k':
-            self.castle_black_king = False
-            self.castle_black_queen = False
-        elif col == 'a' and row == '8':
-            self.castle_black_queen = False
-        elif col == 'h' and row == '8':
-            self.castle_black_king = False
-
-    def _update_en_passant(self, col_0, row_0, col_1, row_1):
-        moved_piece = self._get_piece(col_1, row_1)
-        row_0 = int(row_0)
-        row_1 = int(row_1)
-        if moved_piece == 'P' and row_1 == row_0 + 2 and col_0 == col_1:
-            # white player has moved pawn two spaces forward
-            self.en_passant = (col_0, str(row_1 - 1))
-        elif moved_piece == 'p' and row_1 == row_0 - 2 and col_0 == col_1:
-            # black player has moved pawn two spaces forward
-            self.en_passant = (col_0, str(row_1 + 1))
-        else:
-            self.en_passant = None
+        executor -- the `concurrent.futures.Executor` to look the move
+        up in, or None for the event loop's default executor.
+        """
+        loop = asyncio.get_running_loop()
+        suggested_move = await loop.run_in_executor(
+            executor, self._get_suggested_move)
+        self._make_move(suggested_move)
 
-    def _update_halfmove_clock(self, col_0, row_0, col_1, row_1):
-        if self._get_piece(col_0, row_0) in ('P', 'p'):
-            # piece moved is a pawn, reset the halfmove clock
-            self.halfmove_clock = 0
-        elif self._get_piece(col_1, row_1) != self.EMPTY:
-            # opponent's piece is captured, reset the halfmove clock
+    def _get_suggested_move(self):
+        """
+        Returns the move suggested by the move source, using the move
+        cache, if there is one, to avoid asking about the same position
+        twice.
+        """
+        if self.move_cache is None:
+            return self._request_suggested_move()
+        key = self.move_cache.key_for(self)
+        move = self.move_cache.get(key)
+        if move is None:
+            move = self._request_suggested_move()
+            self.move_cache.set(key, move)
+        return move
+
+    def _request_suggested_move(self):
+        move_source = self.move_source or default_client()
+        return move_source.suggest_move(self)
+
+    def _make_move(self, move):
+        """
+        Make the given move, which is either a UCI string, such as 'e2e4'
+        or, with the piece a pawn is promoted to, 'e7e8q', or a move
+        packed into an int as by the `move` module. Castling moves the
+        rook along with the king, and an en passant capture removes the
+        captured pawn.
+
+        Everything a move does besides moving the piece is looked up in
+        tables keyed by square and piece, so an ordinary move only costs
+        a few lookups and two writes to the board.
+        """
+        if isinstance(move, str):
+            from_square = SQUARE_INDEX[move[0:2]]
+            to_square = SQUARE_INDEX[move[2:4]]
+            promotion = _PROMOTION_CODES[move[4]] if len(move) > 4 else None
+        else:
+            from_square = move & 63
+            to_square = move >> 6 & 63
+            promotion = (_PROMOTED_PIECES[move >> 12 & 3]
+                         if move & KIND_MASK == PROMOTION else None)
+        squares = self._squares
+        piece = squares[from_square]
+        index = PIECE_INDEX[piece]
+        castling = (self._castling & _CASTLING_KEPT[from_square]
+                    & _CASTLING_KEPT[to_square])
+        self._hash ^= CASTLING_KEYS[self._castling] ^ CASTLING_KEYS[castling]
+        self._castling = castling
+        # pawn moves and captures reset the halfmove clock
+        if index % 6 == PAWN or squares[to_square] != _EMPTY_CODE:
             self.halfmove_clock = 0
         else:
             self.halfmove_clock += 1
+        en_passant = None
+        effect = _MOVE_EFFECTS.get(piece << 12 | from_square << 6 | to_square)
+        if effect is not None:
+            kind, square, other = effect
+            if kind == _CASTLE:
+                # the rook jumps over the king
+                self._put(other, squares[square])
+                self._put(square, _EMPTY_CODE)
+            elif kind == _EN_PASSANT_CAPTURE:
+                # a pawn moving diagonally onto an empty square is
+                # capturing en passant, so the captured pawn is beside it
+                if squares[to_square] == _EMPTY_CODE:
+                    self._put(square, _EMPTY_CODE)
+            else:
+                en_passant = other
+        if promotion is not None:
+            piece = promotion[index >= 6]
+        self._put(from_square, _EMPTY_CODE)
+        self._put(to_square, piece)
+        self.fullmove_number += _FULLMOVE_STEP[self._player]
+        self.player = _OTHER_PLAYER[self._player]
+        self.en_passant = en_passant
+
+
+# Bytes read from position files at a time.
+READ_BUFFER_SIZE = 1 << 20
+
+
+def iter_fen_lines(path):
+    """
+    Generator. Yields a (line number, line) pair for each non-blank line
+    of a file of FEN or EPD records, with line numbers counting from 1
+    and surrounding whitespace removed. The file is read in large
+    buffered chunks.
+    """
+    with open(path, buffering=READ_BUFFER_SIZE) as fen_file:
+        for line_number, line in enumerate(fen_file, 1):
+            line = line.strip()
+            if line:
+                yield line_number, line
+
+
+# The operations that end an EPD record: each an opcode, any operands,
+# which may be quoted strings, and a semicolon.
+_EPD_OPERATIONS = re.compile(
+    r'(?:[A-Za-z]\w*(?:\s+(?:"[^"]*"|[^\s;"]+))*\s*;\s*)+$')
+
+
+def _epd_to_fen(line):
+    """
+    Returns a FEN string for a FEN or EPD record. EPD records have only
+    the first four fields of a FEN string, followed by operations, such
+    as 'bm e4;', if any, so they are given a halfmove clock of 0 and a
+    fullmove number of 1. Anything else is returned unchanged, for the
+    FEN parser to accept or reject.
+    """
+    fields = line.split(None, 4)
+    if len(fields) == 4 or (len(fields) == 5
+                            and _EPD_OPERATIONS.match(fields[4])):
+        return ' '.join(fields[:4] + ['0', '1'])
+    return line
+
+
+async def play_many(game_states, concurrency=10, plies=1, on_error=None):
+    """
+    Coroutine. Takes turns in many games at once, so that the time spent
+    waiting for the API is shared between them instead of adding up.
+    Each game's moves are made in order, and each move is made as soon
+    as it arrives. A game whose move cannot be looked up stops there,
+    while the others play on. Once every game has finished,
+    `on_error(game_state, error)` is called for each game that stopped
+    early, or the first error is raised if `on_error` is None. Returns
+    the list of GameState objects.
+
+    Arguments:
+    game_states -- the GameState objects to take turns in.
+    concurrency -- the most moves being looked up at once. The move
+    source's connection pool should be at least this big.
+    plies -- the number of turns to take in each game.
+    on_error -- a function called with each game that stopped early
+    and the exception that stopped it.
+    """
+    game_states = list(game_states)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def play(game_state, executor):
+        for _ in range(plies):
+            async with semaphore:
+                await game_state.take_turn_async(executor)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        results = await asyncio.gather(
+            *(play(game_state, executor) for game_state in game_states),
+            return_exceptions=True)
+    finally:
+        # waiting for the threads here would block the event loop
+        executor.shutdown(wait=False)
+    for game_state, result in zip(game_states, results):
+        if isinstance(result, Exception):
+            if on_error is None:
+                raise result
+            on_error(game_state, result)
+    return game_states
+
+
+class _BoardView(MutableMapping):
+    """
+    Nested-dict compatibility view of a GameState's board, keyed by
+    column letter. Each value is a `_ColumnView` keyed by row string.
+    """
+
+    __slots__ = ('_game_state',)
+
+    def __init__(self, game_state):
+        self._game_state = game_state
+
+    def __getitem__(self, col):
+        if col not in GameState.COLS:
+            raise KeyError(col)
+        return _ColumnView(self._game_state, col)
+
+    def __setitem__(self, col, rows):
+        column = self[col]
+        for row in GameState.ROWS:
+            column[row] = rows.get(row, GameState.EMPTY)
+
+    def __delitem__(self, col):
+        raise TypeError('board columns cannot be deleted')
+
+    def __iter__(self):
+        return iter(GameState.COLS)
+
+    def __len__(self):
+        return len(GameState.COLS)
+
+    def __repr__(self):
+        return repr(self.__deepcopy__())
+
+    def __deepcopy__(self, memo=None):
+        return {col: dict(column) for col, column in self.items()}
+
+
+class _ColumnView(MutableMapping):
+    """One column of a `_BoardView`, keyed by row string."""
+
+    __slots__ = ('_game_state', '_col')
+
+    def __init__(self, game_state, col):
+        self._game_state = game_state
+        self._col = col
+
+    def __getitem__(self, row):
+        if row not in GameState.ROWS:
+            raise KeyError(row)
+        return self._game_state._get_piece(self._col, row)
+
+    def __setitem__(self, row, val):
+        if row not in GameState.ROWS:
+            raise KeyError(row)
+        self._game_state._set_piece(self._col, row, val)
+
+    def __delitem__(self, row):
+        raise TypeError('board squares cannot be deleted')
+
+    def __iter__(self):
+        return iter(GameState.ROWS)
+
+    def __len__(self):
+        return len(GameState.ROWS)
 
-    def _update_fullmove_number(self):
-        if self.player == 'b':
-            self.fullmove_number += 1
\ No newline at end of file
+    def __repr__(self):
+        return repr(dict(self))
\ No newline at end of file
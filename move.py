@@ -0,0 +1,381 @@
+"""
+Moves packed into 16-bit integers.
+
+A move is an int laid out as:
+
+    bits 0-5    the from square
+    bits 6-11   the to square
+    bits 12-13  the promotion piece: knight, bishop, rook or queen
+    bits 14-15  the kind of move: NORMAL, PROMOTION, EN_PASSANT or
+                CASTLING
+
+Squares are numbered as on the GameState board, from a1 (0) to h8 (63).
+A packed move is never 0, because a move never starts and ends on a1,
+so 0 can stand for no move. Move generation fills `array('H')` lists of
+packed moves, which take two bytes a move and can be handed between
+processes as a buffer. `Move` is an int subclass that adds UCI and SAN
+conversion for when a move has to be shown or read.
+"""
+
+from array import array
+
+from bitboards import (WHITE, BLACK, FULL, PIECE_INDEX, PAWN, KNIGHT, BISHOP,
+                       ROOK, QUEEN, KING, KNIGHT_ATTACKS, KING_ATTACKS,
+                       PAWN_ATTACKS, rook_attacks, bishop_attacks,
+                       queen_attacks, iter_squares, lowest_square)
+
+NORMAL = 0
+PROMOTION = 1 << 14
+EN_PASSANT = 2 << 14
+CASTLING = 3 << 14
+KIND_MASK = 3 << 14
+
+SQUARE_NAMES = [col + row for row in '12345678' for col in 'abcdefgh']
+SQUARE_INDEX = {name: square for square, name in enumerate(SQUARE_NAMES)}
+# The promotion pieces, in the order of their 2-bit codes, as UCI letters
+# and as piece types.
+PROMOTION_LETTERS = 'nbrq'
+PROMOTION_PIECES = (KNIGHT, BISHOP, ROOK, QUEEN)
+_PROMOTION_CODES = {letter: code << 12
+                    for code, letter in enumerate(PROMOTION_LETTERS)}
+_PROMOTION_CODES.update((letter.upper(), code)
+                        for letter, code in list(_PROMOTION_CODES.items()))
+_SAN_LETTERS = {KNIGHT: 'N', BISHOP: 'B', ROOK: 'R', QUEEN: 'Q', KING: 'K'}
+_SAN_PIECES = {letter: piece for piece, letter in _SAN_LETTERS.items()}
+_SAN_DECORATIONS = '+#!?'
+# The squares each kind of piece but the pawn reaches from a square,
+# given the occupied squares; by symmetry, also the squares it can come
+# from.
+_SAN_ATTACKS = {
+    KNIGHT: lambda square, occupied: KNIGHT_ATTACKS[square],
+    BISHOP: bishop_attacks,
+    ROOK: rook_attacks,
+    QUEEN: queen_attacks,
+    KING: lambda square, occupied: KING_ATTACKS[square],
+}
+_EMPTY = ord(' ')
+
+
+def pack(from_square, to_square, kind=NORMAL, promotion=0):
+    """
+    Returns a packed move. `promotion` is the 2-bit code of the
+    promotion piece, an index into `PROMOTION_LETTERS`.
+    """
+    return from_square | to_square << 6 | promotion << 12 | kind
+
+
+def new_move_list():
+    """Returns an empty list for packed moves."""
+    return array('H')
+
+
+class Move(int):
+    """
+    A packed move. It is an int, so it can be stored and compared as
+    one, and GameState accepts it anywhere it accepts a UCI string.
+    """
+
+    __slots__ = ()
+
+    @property
+    def from_square(self):
+        """Property. The board array index the piece moves from."""
+        return self & 63
+
+    @property
+    def to_square(self):
+        """Property. The board array index the piece moves to."""
+        return self >> 6 & 63
+
+    @property
+    def kind(self):
+        """
+        Property. NORMAL, PROMOTION, EN_PASSANT or CASTLING. Moves read
+        from UCI without a GameState are only ever NORMAL or PROMOTION.
+        """
+        return self & KIND_MASK
+
+    @property
+    def promotion(self):
+        """
+        Property. The letter of the piece a pawn is promoted to, such as
+        'q', or '' if the move is not a promotion.
+        """
+        if self & KIND_MASK != PROMOTION:
+            return ''
+        return PROMOTION_LETTERS[self >> 12 & 3]
+
+    @property
+    def uci(self):
+        """Property. The move as a UCI string, such as 'e7e8q'."""
+        return to_uci(self)
+
+    def __str__(self):
+        return to_uci(self)
+
+    def __repr__(self):
+        return 'Move({!r})'.format(to_uci(self))
+
+    @classmethod
+    def from_uci(cls, uci, game_state=None):
+        """
+        Returns the Move for a UCI string. If a GameState is given, the
+        move's kind is worked out from the piece that moves, so that
+        castling and en passant captures are marked as such.
+        """
+        return cls(from_uci(uci, game_state))
+
+    @classmethod
+    def from_san(cls, san, game_state):
+        """
+        Returns the legal Move that a SAN string, such as 'Nbd7',
+        'exd6', 'e8=Q+' or 'O-O', describes in the given GameState.
+        Raises ValueError if there is not exactly one such move.
+        """
+        return cls(from_san(san, game_state))
+
+    def san(self, game_state):
+        """
+        Returns the move as a SAN string, such as 'Nxe5+', for the given
+        GameState, in which it must be legal.
+        """
+        return to_san(self, game_state)
+
+
+def to_uci(move):
+    """Returns a packed move as a UCI string."""
+    uci = SQUARE_NAMES[move & 63] + SQUARE_NAMES[move >> 6 & 63]
+    if move & KIND_MASK == PROMOTION:
+        return uci + PROMOTION_LETTERS[move >> 12 & 3]
+    return uci
+
+
+def from_uci(uci, game_state=None):
+    """
+    Returns a UCI string as a packed move. See `Move.from_uci()`.
+    Raises ValueError for strings that are not UCI moves.
+    """
+    try:
+        from_square = SQUARE_INDEX[uci[0:2]]
+        to_square = SQUARE_INDEX[uci[2:4]]
+        if len(uci) > 4:
+            if len(uci) != 5:
+                raise KeyError(uci)
+            return (from_square | to_square << 6 | _PROMOTION_CODES[uci[4]]
+                    | PROMOTION)
+    except KeyError:
+        raise ValueError('invalid UCI move {!r}'.format(uci)) from None
+    move = from_square | to_square << 6
+    if game_state is not None:
+        index = PIECE_INDEX[game_state._squares[from_square]] % 6
+        if index == KING and abs(to_square - from_square) == 2:
+            move |= CASTLING
+        elif (index == PAWN and (from_square ^ to_square) & 7
+              and game_state._squares[to_square] == _EMPTY):
+            move |= EN_PASSANT
+    return move
+
+
+def to_san(move, game_state):
+    """Returns a packed move as a SAN string. See `Move.san()`."""
+    from_square = move & 63
+    to_square = move >> 6 & 63
+    squares = game_state._squares
+    piece = PIECE_INDEX[squares[from_square]] % 6
+    if piece == KING and abs(to_square - from_square) == 2:
+        san = 'O-O' if to_square > from_square else 'O-O-O'
+    else:
+        capture = squares[to_square] != _EMPTY or (
+            piece == PAWN and (from_square ^ to_square) & 7)
+        if piece == PAWN:
+            san = SQUARE_NAMES[from_square][0] + 'x' if capture else ''
+        else:
+            san = _SAN_LETTERS[piece] + _disambiguation(
+                move, piece, game_state) + ('x' if capture else '')
+        san += SQUARE_NAMES[to_square]
+        if move & KIND_MASK == PROMOTION:
+            san += '=' + PROMOTION_LETTERS[move >> 12 & 3].upper()
+    game_state.push(move)
+    try:
+        if game_state.in_check:
+            san += '+' if any(True for _ in game_state.legal_moves()) else '#'
+    finally:
+        game_state.pop()
+    return san
+
+
+def _disambiguation(move, piece, game_state):
+    """
+    Returns what SAN needs after the piece letter to tell the move apart
+    from moves of other pieces of the same type to the same square: '',
+    a file, a rank, or both.
+    """
+    from_square = move & 63
+    to_square = move >> 6 & 63
+    squares = game_state._squares
+    others = [other & 63 for other in game_state.legal_move_codes()
+              if other >> 6 & 63 == to_square and other & 63 != from_square
+              and PIECE_INDEX[squares[other & 63]] % 6 == piece]
+    if not others:
+        return ''
+    name = SQUARE_NAMES[from_square]
+    if all(other & 7 != from_square & 7 for other in others):
+        return name[0]
+    if all(other >> 3 != from_square >> 3 for other in others):
+        return name[1]
+    return name
+
+
+def from_san(san, game_state):
+    """
+    Returns a SAN string as a packed move. See `Move.from_san()`.
+
+    Rather than generating every legal move, only the pieces of the
+    right type that reach the destination square are considered, found
+    from the attack tables, and each is made and taken back to check
+    that it does not leave its own king in check. Replaying a recorded
+    game is then mostly a matter of one table lookup a move.
+    """
+    text = san.rstrip(_SAN_DECORATIONS)
+    if text in ('O-O', 'O-O-O', '0-0', '0-0-0'):
+        squares = game_state._squares
+        matches = [move for move in game_state.legal_move_codes()
+                   if PIECE_INDEX[squares[move & 63]] % 6 == KING
+                   and (move >> 6 & 63) - (move & 63)
+                   == (2 if len(text) == 3 else -2)]
+    else:
+        matches = _san_matches(san, text, game_state)
+    if len(matches) != 1:
+        raise ValueError('{} legal moves match {!r} in {}'.format(
+            len(matches), san, game_state.fen))
+    return matches[0]
+
+
+def _san_matches(san, text, game_state):
+    """
+    Returns the legal moves, other than castling, that fit a SAN string
+    with its check and annotation marks removed.
+    """
+    promotion = None
+    if '=' in text:
+        text, letter = text.split('=', 1)
+        promotion = _PROMOTION_CODES.get(letter)
+        if promotion is None:
+            raise ValueError('invalid SAN move {!r}'.format(san))
+    elif text[-1:] in 'NBRQ' and len(text) > 2 and text[-2] in '18':
+        # some writers leave out the '='
+        text, promotion = text[:-1], _PROMOTION_CODES[text[-1]]
+    piece = _SAN_PIECES.get(text[:1], PAWN)
+    if piece != PAWN:
+        text = text[1:]
+    to_square = SQUARE_INDEX.get(text[-2:])
+    if to_square is None:
+        raise ValueError('invalid SAN move {!r}'.format(san))
+    hint = text[:-2].replace('x', '')
+
+    colour = WHITE if game_state.player == 'w' else BLACK
+    occupied = game_state._occupied
+    if occupied[colour] >> to_square & 1:
+        return []
+    own = game_state._pieces[colour * 6 + piece]
+    everything = occupied[WHITE] | occupied[BLACK]
+    kind = NORMAL
+    if piece != PAWN:
+        if promotion is not None:
+            return []
+        sources = _SAN_ATTACKS[piece](to_square, everything) & own
+    else:
+        if (promotion is not None) != (to_square >> 3 == 7 - 7 * colour):
+            return []
+        if promotion is not None:
+            kind = PROMOTION | promotion
+        sources = _pawn_sources(to_square, colour, own, game_state)
+    # a piece the king cannot see along a line cannot be pinned, so
+    # unless the king moves or is in check, only the moves of pieces it
+    # can see, and en passant captures, need to be tried out
+    king = game_state._pieces[colour * 6 + KING]
+    if not king:
+        exposed = 0
+    elif piece == KING or game_state.in_check:
+        exposed = FULL
+    else:
+        exposed = queen_attacks(lowest_square(king), everything)
+    matches = []
+    for from_square in iter_squares(sources):
+        if not _matches_hint(SQUARE_NAMES[from_square], hint):
+            continue
+        diagonal = (from_square ^ to_square) & 7
+        # a pawn capture names the file it is made from, and a pawn push
+        # names no square at all
+        if piece == PAWN and (not hint[:1].isalpha() if diagonal else hint):
+            continue
+        move = from_square | to_square << 6 | kind
+        if (piece == PAWN and diagonal
+                and not occupied[colour ^ 1] >> to_square & 1):
+            move |= EN_PASSANT
+        elif not exposed >> from_square & 1:
+            matches.append(move)
+            continue
+        if _keeps_king_safe(move, colour, game_state):
+            matches.append(move)
+    return matches
+
+
+def _pawn_sources(to_square, colour, pawns, game_state):
+    """
+    Returns a bitboard of the given pawns that can move to a square,
+    by a capture, including en passant, or by a push of one or two
+    squares.
+    """
+    occupied = game_state._occupied
+    everything = occupied[WHITE] | occupied[BLACK]
+    if everything >> to_square & 1:
+        if not occupied[colour ^ 1] >> to_square & 1:
+            return 0
+        return PAWN_ATTACKS[colour ^ 1][to_square] & pawns
+    sources = 0
+    en_passant = game_state.en_passant
+    if (en_passant is not None
+            and SQUARE_INDEX[''.join(en_passant)] == to_square):
+        sources = PAWN_ATTACKS[colour ^ 1][to_square] & pawns
+    forward = 8 - 16 * colour
+    one_back = to_square - forward
+    if not 0 <= one_back < 64:
+        return sources
+    if pawns >> one_back & 1:
+        return sources | 1 << one_back
+    two_back = one_back - forward
+    # a pawn on its starting rank may move two squares
+    if (two_back >> 3 == 1 + 5 * colour and not everything >> one_back & 1
+            and pawns >> two_back & 1):
+        sources |= 1 << two_back
+    return sources
+
+
+def _keeps_king_safe(move, colour, game_state):
+    """
+    Returns whether a pseudo-legal move leaves the mover's king out of
+    check, by making it and taking it back.
+    """
+    game_state.push(move)
+    try:
+        king = game_state._pieces[colour * 6 + KING]
+        if not king:
+            return True
+        occupied = game_state._occupied[WHITE] | game_state._occupied[BLACK]
+        return not game_state._attackers(lowest_square(king), colour ^ 1,
+                                         occupied)
+    finally:
+        game_state.pop()
+
+
+def _matches_hint(name, hint):
+    """
+    Returns whether a square name fits the file and/or rank SAN gives
+    to tell a move apart from others.
+    """
+    if not hint:
+        return True
+    if len(hint) == 2:
+        return name == hint
+    return hint in name
@@ -0,0 +1,176 @@
+"""
+Legal move generation for GameState objects.
+
+Moves are generated from the bitboards that GameState keeps alongside
+its board array, as moves packed into ints by the `move` module, or as
+UCI strings such as 'e2e4' or 'e7e8q'. `GameState._make_move()` accepts
+either. Only fully legal moves are produced: pinned pieces stay on their
+pin line, checks must be answered, and castling and en passant follow
+all of the rules.
+"""
+
+from bitboards import (WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING,
+                       FULL, RANK_1, RANK_8, KNIGHT_ATTACKS, KING_ATTACKS,
+                       PAWN_ATTACKS, BETWEEN, rook_attacks, bishop_attacks,
+                       iter_squares, lowest_square)
+from move import PROMOTION, EN_PASSANT, CASTLING, new_move_list, to_uci
+
+# The promotion codes of the `move` module, queen first.
+PROMOTIONS = [PROMOTION | code << 12 for code in (3, 2, 1, 0)]
+
+# Castling moves for each colour, as (`GameState._castling` bit, king
+# square, king destination, rook square, squares that must be empty,
+# squares that must not be attacked).
+_CASTLING = [
+    [(1, 4, 6, 7, 0x60, 0x60),
+     (2, 4, 2, 0, 0x0E, 0x0C)],
+    [(4, 60, 62, 63, 0x60 << 56, 0x60 << 56),
+     (8, 60, 58, 56, 0x0E << 56, 0x0C << 56)],
+]
+
+
+def generate_legal_moves(game_state):
+    """
+    Returns a list of every legal move, as a UCI string, for the player
+    whose turn it is in the given GameState.
+    """
+    return [to_uci(move) for move in generate_moves(game_state)]
+
+
+def generate_moves(game_state, moves=None):
+    """
+    Returns every legal move for the player whose turn it is in the
+    given GameState, packed as by the `move` module, in an
+    `array('H')`. The moves are added to `moves`, if it is given, so
+    that a search can keep one list for each ply.
+    """
+    pieces = game_state._pieces
+    us = WHITE if game_state.player == 'w' else BLACK
+    them = us ^ 1
+    own = game_state._occupied[us]
+    enemy = game_state._occupied[them]
+    occupied = own | enemy
+    base = us * 6
+    attackers = game_state._attackers
+    if moves is None:
+        moves = new_move_list()
+
+    king = pieces[base + KING]
+    check_mask = FULL
+    pins = {}
+    if king:
+        king_square = lowest_square(king)
+        for to in iter_squares(KING_ATTACKS[king_square] & ~own):
+            if not attackers(to, them, occupied ^ king):
+                moves.append(king_square | to << 6)
+
+        checkers = attackers(king_square, them, occupied)
+        if checkers:
+            if checkers & (checkers - 1):
+                # double check, so only the king can move
+                return moves
+            checker = lowest_square(checkers)
+            check_mask = checkers | BETWEEN[king_square][checker]
+        else:
+            _add_castling(game_state, us, occupied, moves)
+
+        # a sniper is an enemy slider that would attack the king if none
+        # of our own pieces were in the way
+        their_base = them * 6
+        snipers = ((rook_attacks(king_square, enemy)
+                    & (pieces[their_base + ROOK] | pieces[their_base + QUEEN]))
+                   | (bishop_attacks(king_square, enemy)
+                      & (pieces[their_base + BISHOP]
+                         | pieces[their_base + QUEEN])))
+        for sniper in iter_squares(snipers):
+            between = BETWEEN[king_square][sniper]
+            blockers = between & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pins[lowest_square(blockers)] = between | (1 << sniper)
+
+    targets = ~own & check_mask
+    for square in iter_squares(pieces[base + KNIGHT]):
+        # a pinned knight can never stay on its pin line
+        if square not in pins:
+            _add_moves(square, KNIGHT_ATTACKS[square] & targets, moves)
+    diagonal = pieces[base + BISHOP] | pieces[base + QUEEN]
+    for square in iter_squares(diagonal):
+        reach = bishop_attacks(square, occupied) & targets
+        _add_moves(square, reach & pins.get(square, FULL), moves)
+    straight = pieces[base + ROOK] | pieces[base + QUEEN]
+    for square in iter_squares(straight):
+        reach = rook_attacks(square, occupied) & targets
+        _add_moves(square, reach & pins.get(square, FULL), moves)
+
+    _add_pawn_moves(game_state, us, occupied, enemy, check_mask, pins, moves)
+    return moves
+
+
+def _add_moves(square, reach, moves):
+    for to in iter_squares(reach):
+        moves.append(square | to << 6)
+
+
+def _add_pawn_moves(game_state, us, occupied, enemy, check_mask, pins, moves):
+    step = 8 if us == WHITE else -8
+    start_rank = 1 if us == WHITE else 6
+    last_rank = 7 if us == WHITE else 0
+    pawn_attacks = PAWN_ATTACKS[us]
+    en_passant = None
+    if game_state.en_passant:
+        col, row = game_state.en_passant
+        en_passant = (ord(row) - 49) << 3 | (ord(col) - 97)
+
+    # pawns on the first or last rank cannot be part of a real game, and
+    # would step off the board
+    pawns = game_state._pieces[us * 6 + PAWN] & ~(RANK_1 | RANK_8)
+    for square in iter_squares(pawns):
+        allowed = check_mask & pins.get(square, FULL)
+        reach = pawn_attacks[square] & enemy & allowed
+        one = square + step
+        if not occupied >> one & 1:
+            reach |= (1 << one) & allowed
+            two = one + step
+            if (square >> 3 == start_rank and not occupied >> two & 1):
+                reach |= (1 << two) & allowed
+        for to in iter_squares(reach):
+            if to >> 3 == last_rank:
+                for promotion in PROMOTIONS:
+                    moves.append(square | to << 6 | promotion)
+            else:
+                moves.append(square | to << 6)
+        if en_passant is not None and pawn_attacks[square] >> en_passant & 1:
+            if _en_passant_is_legal(game_state, us, square, en_passant,
+                                    occupied):
+                moves.append(square | en_passant << 6 | EN_PASSANT)
+
+
+def _en_passant_is_legal(game_state, us, square, en_passant, occupied):
+    """
+    Checks an en passant capture by trying it on the occupancy bitboard.
+    This covers the cases the pin and check masks cannot, such as two
+    pawns leaving a rank at once and uncovering an attack on the king.
+    """
+    captured = en_passant - 8 if us == WHITE else en_passant + 8
+    if not game_state._pieces[(us ^ 1) * 6 + PAWN] >> captured & 1:
+        return False
+    king = game_state._pieces[us * 6 + KING]
+    if not king:
+        return True
+    occupied ^= (1 << square) | (1 << captured) | (1 << en_passant)
+    checkers = game_state._attackers(lowest_square(king), us ^ 1, occupied)
+    return not checkers & ~(1 << captured)
+
+
+def _add_castling(game_state, us, occupied, moves):
+    king = game_state._pieces[us * 6 + KING]
+    rooks = game_state._pieces[us * 6 + ROOK]
+    for (right, king_square, king_to, rook_square, empty,
+         safe) in _CASTLING[us]:
+        if (game_state._castling & right and king >> king_square & 1
+                and rooks >> rook_square & 1 and not occupied & empty):
+            for square in iter_squares(safe):
+                if game_state._attackers(square, us ^ 1, occupied):
+                    break
+            else:
+                moves.append(king_square | king_to << 6 | CASTLING)
@@ -0,0 +1,215 @@
+"""
+Local search spread over several processes.
+
+Python runs one thread at a time, so the search in `search.py` can only
+use one core. `ParallelSearchMoveSource` splits the legal moves at the
+root between a pool of worker processes, and each worker searches its
+share with iterative deepening until the shared deadline. The workers
+all use one transposition table, kept in shared memory, so what one
+worker learns about a position saves the others from searching it
+again.
+
+The answer is the best move at the deepest iteration every worker
+finished, since scores from different depths do not compare fairly.
+A forced mate found by any worker is taken at once, and the other
+workers are told to stop searching.
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import shared_memory
+
+from gamestate import GameState
+from move import Move, to_uci
+from search import SearchMoveSource, SearchResult, MATE_BOUND
+from tablebase import TablebaseError
+from transposition import TranspositionTable
+
+# The table and move source of each worker process, made once by
+# `_start_worker()` and kept for every search the worker does.
+_worker_memory = None
+_worker_source = None
+
+
+def _attach(name):
+    """
+    Attaches to the shared memory block with the given name, without
+    letting the resource tracker remove it when this process exits.
+    """
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # before Python 3.13, attaching cannot opt out of tracking
+        return shared_memory.SharedMemory(name)
+
+
+def _start_worker(memory_name, table_bytes, max_depth, stop):
+    """
+    Initializer for the worker processes. Searches end early once the
+    `multiprocessing.Event` `stop` is set.
+    """
+    global _worker_memory, _worker_source
+    _worker_memory = _attach(memory_name)
+    table = TranspositionTable(table_bytes, buffer=_worker_memory.buf)
+    _worker_source = SearchMoveSource(max_depth, table=table,
+                                      clock=time.time, stop=stop.is_set)
+
+
+def _search_share(record, root_moves, deadline, max_nodes, age):
+    """
+    Searches some of the root moves of the position with the given
+    binary record in a worker process, until the given `time.time()`
+    deadline, and returns the (iterations, nodes) of the search.
+    """
+    source = _worker_source
+    source.time_limit = (None if deadline is None
+                         else max(0.0, deadline - time.time()))
+    source.max_nodes = max_nodes
+    # every worker's table object keeps its own age, so they are set to
+    # the parent's before each search instead
+    source.table.age = (age - 1) & 63
+    source.search(GameState.from_bytes(record), root_moves)
+    return source.iterations, source.nodes
+
+
+class ParallelSearchMoveSource:
+    """
+    Suggests moves for GameState objects by searching them on several
+    cores at once. Call `close()` to stop the worker processes and free
+    the shared table.
+    """
+
+    def __init__(self, workers=None, time_limit=1.0, max_depth=64,
+                 max_nodes=None, table_bytes=16 * 1024 * 1024):
+        """
+        Constructor for ParallelSearchMoveSource class
+
+        Arguments:
+        workers -- the number of worker processes, None for one per CPU,
+        or 0 to search in this process without a pool.
+        time_limit -- the most seconds a search may take, or None for
+        no limit.
+        max_depth -- the deepest iteration to search, in plies.
+        max_nodes -- the most nodes each worker may visit in a search,
+        or None for no limit.
+        table_bytes -- the size of the shared transposition table.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self._memory = shared_memory.SharedMemory(create=True,
+                                                  size=table_bytes)
+        self.table = TranspositionTable(table_bytes, buffer=self._memory.buf)
+        self._executor = None
+        self._stop = None
+        if self.workers:
+            self._stop = multiprocessing.Event()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_start_worker,
+                initargs=(self._memory.name, table_bytes, max_depth,
+                          self._stop))
+            # start the workers now, so that the first search does not
+            # have to wait for them
+            for future in [self._executor.submit(int)
+                           for _ in range(self.workers)]:
+                future.result()
+
+    def suggest_move(self, game_state):
+        """
+        Returns the best move found, as a UCI string, for the player
+        whose turn it is in the given GameState.
+        """
+        return to_uci(self.search(game_state).move)
+
+    def search(self, game_state):
+        """
+        Searches the given GameState, which is left unchanged, and
+        returns a `search.SearchResult`. Its node count is the total
+        over all the workers.
+        """
+        start = time.time()
+        moves = game_state.legal_move_codes()
+        if not moves:
+            raise TablebaseError('no moves for {}'.format(game_state.fen))
+        source = SearchMoveSource(self.max_depth, self.time_limit,
+                                  self.max_nodes, self.table)
+        if not self._executor or len(moves) == 1:
+            return source.search(game_state)
+
+        self.table.new_search()
+        deadline = (start + self.time_limit
+                    if self.time_limit is not None else None)
+        record = game_state.to_bytes()
+        entry = self.table.probe(game_state.zobrist_hash)
+        moves = source._order(game_state, moves, entry and entry[0], 0)
+        # dealing the moves out best first gives each worker a fair share
+        # of the likely best ones
+        shares = [moves[worker::self.workers]
+                  for worker in range(min(self.workers, len(moves)))]
+        self._stop.clear()
+        futures = [self._executor.submit(_search_share, record, share,
+                                         deadline, self.max_nodes,
+                                         self.table.age)
+                   for share in shares]
+        pending = futures
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if any(_found_mate(future.result()[0]) for future in done):
+                # the mate is the answer, so the other workers need not
+                # search on until the deadline
+                self._stop.set()
+        results = [future.result() for future in futures]
+        depth, score, move = _combine(
+            [iterations for iterations, _ in results], shares)
+        return SearchResult(Move(move), score, depth,
+                            sum(nodes for _, nodes in results),
+                            time.time() - start)
+
+    def close(self):
+        """Stops the worker processes and frees the shared table."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.table = None
+        self._memory.close()
+        self._memory.unlink()
+
+
+def _found_mate(iterations):
+    """
+    Returns whether the last of the given iterations found a forced mate
+    for the player to move.
+    """
+    return bool(iterations) and iterations[-1][1] > MATE_BOUND
+
+
+def _combine(iterations, shares):
+    """
+    Returns the (depth, score, move) answer from the iterations each
+    worker finished: a forced mate if any worker found one, or else the
+    best result at the deepest iteration they all finished. A worker
+    that proved its moves lose to a mate needs to search no deeper.
+    """
+    mates = [results[-1] for results in iterations if _found_mate(results)]
+    if mates:
+        return max(mates, key=lambda result: result[1])
+    depths = [results[-1][0] for results in iterations
+              if results and results[-1][1] >= -MATE_BOUND]
+    depth = min(depths) if depths else max(
+        (results[-1][0] for results in iterations if results), default=0)
+    best = None
+    for results, share in zip(iterations, shares):
+        if not results:
+            # a worker that finished nothing can only offer its first move
+            candidate = (0, -MATE_BOUND, share[0])
+        else:
+            candidate = next((result for result in results
+                              if result[0] == depth), results[-1])
+        if best is None or candidate[1] > best[1]:
+            best = candidate
+    return depth, best[1], best[2]
@@ -0,0 +1,131 @@
+"""
+Perft (performance test) move path enumeration for GameState.
+
+Counts every leaf node of the legal move tree to a fixed depth and
+compares the counts with the published results for the standard perft
+positions. This checks the move generator and move application against
+known-good numbers, and the time taken gives a nodes per second figure.
+
+Usage: python perft.py [--depth N] [--fen FEN]
+"""
+
+import argparse
+import time
+
+from gamestate import GameState
+
+# The standard perft positions, with their node counts for depths 1 to 5.
+PERFT_POSITIONS = [
+    ('start',
+     'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+     [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete',
+     'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603, 193690690]),
+    ('position 3',
+     '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     [14, 191, 2812, 43238, 674624]),
+    ('position 4',
+     'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333, 15833292]),
+    ('position 5',
+     'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     [44, 1486, 62379, 2103487, 89941194]),
+    ('position 6',
+     'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     [46, 2079, 89890, 3894594, 164075551]),
+]
+
+
+def perft(game_state, depth):
+    """
+    Returns the number of leaf nodes of the legal move tree below the
+    given GameState, searched to the given depth.
+    """
+    moves = game_state.legal_move_codes()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        game_state.push(move)
+        nodes += perft(game_state, depth - 1)
+        game_state.pop()
+    return nodes
+
+
+def divide(game_state, depth):
+    """
+    Returns a dict mapping each legal move to the perft count of the
+    position it leads to, searched to one less than the given depth.
+    Comparing this with another move generator narrows down a bug.
+    """
+    ret = {}
+    for move in game_state.legal_moves():
+        game_state.push(move)
+        ret[move] = perft(game_state, depth - 1)
+        game_state.pop()
+    return ret
+
+
+def run_perft(fen, depth):
+    """
+    Runs perft on the position given by a FEN string and returns a dict
+    with the node count, the time taken and the nodes per second.
+    """
+    game_state = GameState()
+    game_state._parse_fen_str(fen)
+    start = time.perf_counter()
+    nodes = perft(game_state, depth)
+    seconds = time.perf_counter() - start
+    return {
+        'nodes': nodes,
+        'seconds': seconds,
+        'nodes_per_second': nodes / seconds if seconds else 0.0,
+    }
+
+
+def run_suite(max_depth, positions=PERFT_POSITIONS):
+    """
+    Generator. Runs perft on each standard position at each depth up to
+    `max_depth`, yielding a result dict for each run that also holds the
+    position name, the depth, the expected count and whether it matched.
+    """
+    for name, fen, counts in positions:
+        for depth in range(1, min(max_depth, len(counts)) + 1):
+            result = run_perft(fen, depth)
+            result.update(name=name, fen=fen, depth=depth,
+                          expected=counts[depth - 1],
+                          ok=result['nodes'] == counts[depth - 1])
+            yield result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--depth', type=int, default=4,
+                        help='deepest depth to search (default: 4)')
+    parser.add_argument('--fen', help='run only on this position and print '
+                        'per-move counts instead of running the suite')
+    args = parser.parse_args()
+
+    if args.fen:
+        game_state = GameState()
+        game_state._parse_fen_str(args.fen)
+        counts = divide(game_state, args.depth)
+        for move in sorted(counts):
+            print('{}: {}'.format(move, counts[move]))
+        print('total: {}'.format(sum(counts.values())))
+        return 0
+
+    failed = False
+    for result in run_suite(args.depth):
+        failed |= not result['ok']
+        print('{:<11} depth {}  {:>10} nodes  {:>9.0f} nodes/s  {}'.format(
+            result['name'], result['depth'], result['nodes'],
+            result['nodes_per_second'],
+            'ok' if result['ok'] else 'FAIL (expected {})'.format(
+                result['expected'])))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
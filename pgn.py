@@ -0,0 +1,507 @@
+"""
+Reading and replaying recorded games from PGN files.
+
+A PGN file holds games one after another, each a section of tag pairs,
+such as '[White "Morphy"]', followed by its moves in SAN with move
+numbers, comments, variations and a result. The games are replayed
+with moves made locally, as `GameState.apply_moves()` makes them, so no
+move source is asked for anything, and every position of every game is
+available as it is reached.
+
+There are two ways to read a file. `iter_games()` streams it through a
+large read buffer, one game after another. `PGNFile` maps it into
+memory and finds where each game starts with one scan over the bytes,
+so any game can then be read without the ones before it, and a game's
+tags and moves are only parsed when they are asked for. The index also
+lets `iter_results()` hand ranges of games to worker processes, which
+each read and parse only their own part of the file.
+
+Run as a script, this prints the FEN string of every position in the
+games of a PGN file, each game's positions after a blank line.
+
+Usage: python pgn.py <pgn-file> [--workers N] [--games-per-range N]
+           [--output FILE]
+"""
+
+import argparse
+import mmap
+import os
+import re
+import sys
+from array import array
+
+from bulk import map_in_processes
+from gamestate import GameState, InvalidFENFileError, READ_BUFFER_SIZE
+from move import from_san
+from script_utils import error_out
+
+ERROR_GAME = '{}: game {}: {}'
+NOT_FOUND = 'PGN file not found: {}'
+
+# A tag pair, such as '[Event "F/S Return Match"]', with its value still
+# escaped.
+_TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_TAG_ESCAPE = re.compile(r'\\(.)')
+# The tokens of movetext: comments, which do not nest, the brackets of
+# variations, which do, numeric annotations, move numbers, and anything
+# else between spaces, which is a move or a result.
+_MOVETEXT_TOKEN = re.compile(r'\{[^}]*\}?|;[^\n]*|[()]|\$\d+|\d+\.+|'
+                             r'[^\s{}();$]+')
+_RESULTS = frozenset(['1-0', '0-1', '1/2-1/2', '*'])
+# Where a comment starts in a line of movetext.
+_COMMENT_START = re.compile(r'[{;]')
+# A game's tag section, as raw bytes: a run of tag pair lines, which may
+# have blank lines between them.
+_TAG_LINE = rb'\[\s*\w+\s+"(?:[^"\\\n]|\\.)*"\s*\][^\n]*'
+_TAG_SECTION = re.compile(_TAG_LINE + rb'(?:\s*\n' + _TAG_LINE + rb')*')
+# Comments, skipped whole so that lines inside them are not taken for
+# tags, and the tag sections that start games after the first line.
+_GAME_START = re.compile(rb'\{[^}]*\}?|;[^\n]*|\n('
+                         + _TAG_SECTION.pattern + rb')')
+_NON_SPACE = re.compile(rb'\S')
+
+
+class InvalidPGNError(Exception):
+    """Raised when a game in a PGN file cannot be read or replayed."""
+    pass
+
+
+def iter_games(path):
+    """
+    Generator. Yields a (tags, movetext) pair for each game of a PGN
+    file, reading it a line at a time. `tags` is a dict of the game's
+    tag pairs, and `movetext` is the text of its moves, still to be
+    parsed by `parse_movetext()`.
+    """
+    lines = []
+    in_movetext = False
+    in_comment = False
+    with open(path, buffering=READ_BUFFER_SIZE,
+              encoding='utf-8', errors='replace') as pgn_file:
+        for line in pgn_file:
+            if not in_movetext:
+                if (line.strip() and not line.startswith('[')
+                        and not line.startswith('%')):
+                    in_movetext = True
+                    in_comment = _in_comment(line, False)
+            elif in_comment or not _TAG.match(line):
+                in_comment = _in_comment(line, in_comment)
+            else:
+                # a tag after the movetext starts the next game
+                yield _split_game(lines)
+                lines = []
+                in_movetext = False
+            lines.append(line)
+    tags, movetext = _split_game(lines)
+    if tags or movetext:
+        yield tags, movetext
+
+
+def _in_comment(line, in_comment):
+    """
+    Returns whether a '{' comment is still open at the end of a line of
+    movetext, given whether one was open at its start.
+    """
+    position = 0
+    while True:
+        if in_comment:
+            position = line.find('}', position)
+            if position < 0:
+                return True
+            in_comment = False
+            position += 1
+        else:
+            match = _COMMENT_START.search(line, position)
+            if match is None or match.group() == ';':
+                return False
+            in_comment = True
+            position = match.end()
+
+
+def _split_game(lines):
+    """
+    Returns the (tags, movetext) pair for the lines of one game. Lines
+    starting with '%' are escaped, and left out.
+    """
+    tags = {}
+    movetext = []
+    for line in lines:
+        if not movetext and line.startswith('['):
+            match = _TAG.match(line)
+            if match:
+                tags[match.group(1)] = _TAG_ESCAPE.sub(r'\1', match.group(2))
+        elif line.startswith('%'):
+            continue
+        elif line.strip() or movetext:
+            movetext.append(line)
+    return tags, ''.join(movetext)
+
+
+def _decode_lines(data):
+    """Returns bytes of PGN text as a list of lines."""
+    return data.decode('utf-8', 'replace').splitlines(True)
+
+
+def index_games(data):
+    """
+    Returns an `array('Q')` of the offsets at which the games in the
+    given bytes of PGN text start, found in one pass over them without
+    decoding them or parsing any game. A game starts with its tag
+    section, or at the start of the text for moves with no tags before
+    them. Lines inside comments are never taken for tags.
+    """
+    section = _TAG_SECTION.match(data)
+    offsets = array('Q', [0] if section else [])
+    offsets.extend(match.start(1) for match in _GAME_START.finditer(
+        data, section.end() if section else 0) if match.lastindex)
+    first = offsets[0] if offsets else len(data)
+    if _NON_SPACE.search(data, 0, first):
+        offsets.insert(0, 0)
+    return offsets
+
+
+class Game:
+    """
+    One game of a PGN file, kept as its raw bytes until its tags, moves
+    or positions are asked for. Reading the tags only decodes the tag
+    section, so games can be picked out by their tags cheaply.
+    """
+
+    __slots__ = ('number', 'text', '_tags', '_movetext', '_moves')
+
+    def __init__(self, number, text):
+        """
+        Constructor for Game class
+
+        Arguments:
+        number -- the number of the game in its file, counting from 1.
+        text -- the bytes of the game: its tags and its movetext.
+        """
+        self.number = number
+        self.text = text
+        self._tags = None
+        self._movetext = None
+        self._moves = None
+
+    @property
+    def tags(self):
+        """Property. A dict of the game's tag pairs."""
+        if self._tags is None:
+            match = _TAG_SECTION.match(self.text)
+            section = self.text[:match.end()] if match else b''
+            self._tags = _split_game(_decode_lines(section))[0]
+        return self._tags
+
+    @property
+    def movetext(self):
+        """
+        Property. The text of the game's moves, with its comments,
+        variations and result.
+        """
+        if self._movetext is None:
+            match = _TAG_SECTION.match(self.text)
+            rest = self.text[match.end():] if match else self.text
+            self._movetext = _split_game(_decode_lines(rest))[1]
+        return self._movetext
+
+    @property
+    def moves(self):
+        """Property. The game's moves, as a list of SAN strings."""
+        if self._moves is None:
+            self._moves = parse_movetext(self.movetext)
+        return self._moves
+
+    def positions(self):
+        """
+        Generator. Replays the game from its start position, as
+        `replay()` does, and yields the GameState after each move.
+        """
+        game_state = start_position(self.tags)
+        return game_state.apply_moves(_resolve_moves(self.moves,
+                                                     game_state))
+
+
+class PGNFile:
+    """
+    A PGN file mapped into memory, with the offsets of its games found
+    when it is opened. It is a sequence of Game objects, each made only
+    when it is asked for. Call `close()` when done with it.
+    """
+
+    def __init__(self, path, offsets=None):
+        """
+        Constructor for PGNFile class
+
+        Arguments:
+        path -- the path of the PGN file.
+        offsets -- the offsets of the games, as from the `offsets` of
+        an earlier PGNFile of the same file, to save indexing it again.
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        # an empty file cannot be mapped
+        if os.fstat(self._file.fileno()).st_size:
+            self._data = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        else:
+            self._data = b''
+        self.offsets = (index_games(self._data) if offsets is None
+                        else array('Q', offsets))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        """
+        Returns the Game with the given index, counting from 0, or a
+        list of Game objects for a slice.
+        """
+        if isinstance(index, slice):
+            return [self[number]
+                    for number in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        start = self.offsets[index]
+        end = (self.offsets[index + 1] if index + 1 < len(self.offsets)
+               else len(self._data))
+        return Game(index + 1, self._data[start:end])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def size(self):
+        """Property. The size of the file in bytes."""
+        return len(self._data)
+
+    def close(self):
+        """Closes the file."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+def parse_movetext(movetext):
+    """
+    Returns the moves of a game's movetext as a list of SAN strings,
+    leaving out move numbers, comments, variations, numeric annotations
+    and the result.
+    """
+    moves = []
+    depth = 0
+    for token in _MOVETEXT_TOKEN.findall(movetext):
+        first = token[0]
+        if first == '(':
+            depth += 1
+        elif first == ')':
+            depth = max(depth - 1, 0)
+        elif (depth or first in '{;$' or token in _RESULTS
+              or token[-1] == '.'):
+            continue
+        else:
+            moves.append(token)
+    return moves
+
+
+def start_position(tags):
+    """
+    Returns a new GameState for the position a game starts from: the
+    one its FEN tag gives, if it has one, or else the standard start.
+    Raises InvalidPGNError if the FEN tag is invalid.
+    """
+    fen = tags.get('FEN')
+    if fen is None:
+        return GameState()
+    try:
+        return GameState.from_fen(fen)
+    except InvalidFENFileError:
+        raise InvalidPGNError('invalid FEN tag {!r}'.format(fen)) from None
+
+
+def replay(movetext, game_state=None):
+    """
+    Generator. Makes the moves of a game's movetext one at a time and
+    yields the GameState after each one. As with
+    `GameState.apply_moves()`, the same GameState is yielded every time,
+    changed in place. Raises InvalidPGNError, after the positions before
+    it, at the first move that is not legal.
+
+    Arguments:
+    movetext -- the movetext of the game, as from `iter_games()`.
+    game_state -- the GameState to start from, which is changed, or None
+    to start from the standard start position.
+    """
+    if game_state is None:
+        game_state = GameState()
+    return game_state.apply_moves(
+        _resolve_moves(parse_movetext(movetext), game_state))
+
+
+def _resolve_moves(sans, game_state):
+    """
+    Generator. Yields the packed move for each SAN string in the
+    GameState as it is when the move is asked for.
+    """
+    for ply, san in enumerate(sans, 1):
+        try:
+            yield from_san(san, game_state)
+        except ValueError as err:
+            raise InvalidPGNError('ply {}: {}'.format(ply, err)) from None
+
+
+def iter_positions(path, on_error=None):
+    """
+    Generator. Replays every game of a PGN file and yields a (game
+    number, GameState) pair for each position after a move, counting
+    games from 1. The same GameState is yielded for every position of
+    a game.
+
+    A game that cannot be replayed does not stop the file from being
+    read: the positions before the error are yielded, and then
+    `on_error(game_number, error)` is called, or the error is raised if
+    `on_error` is None.
+    """
+    for game_number, (tags, movetext) in enumerate(iter_games(path), 1):
+        try:
+            for game_state in replay(movetext, start_position(tags)):
+                yield game_number, game_state
+        except InvalidPGNError as err:
+            if on_error is None:
+                raise
+            on_error(game_number, err)
+
+
+def process_range(path, first, offsets, function):
+    """
+    Runs a function over a range of games of a PGN file and returns a
+    list with a (game number, result, error) triple for each game, in
+    the same order. Only the range's part of the file is read. When
+    `function(game)` raises InvalidPGNError, the result is None and the
+    error is its message; otherwise the error is None.
+
+    Arguments:
+    path -- the path of the PGN file.
+    first -- the number of the range's first game, counting from 1.
+    offsets -- the offsets of the range's games in the file, followed
+    by the offset of the end of the last one.
+    function -- the function to call with each Game.
+    """
+    with open(path, 'rb') as pgn_file:
+        pgn_file.seek(offsets[0])
+        data = pgn_file.read(offsets[-1] - offsets[0])
+    base = offsets[0]
+    results = []
+    for number, start, end in zip(range(first, first + len(offsets) - 1),
+                                  offsets, offsets[1:]):
+        game = Game(number, data[start - base:end - base])
+        try:
+            results.append((number, function(game), None))
+        except InvalidPGNError as err:
+            results.append((number, None, str(err)))
+    return results
+
+
+def iter_results(path, function, workers=None, games_per_range=100):
+    """
+    Generator. Runs `function(game)` over every Game of a PGN file and
+    yields the (game number, result, error) triples of
+    `process_range()` in file order.
+
+    The file is indexed in this process, and the worker processes are
+    given ranges of games by their offsets, so each reads and parses
+    only its own games. Only a few ranges per worker are handed out
+    ahead of the results being used, so memory use does not grow with
+    the size of the file.
+
+    Arguments:
+    path -- the path of the PGN file.
+    function -- the function to call with each Game. It is sent to the
+    workers, so it must be defined at the top level of a module.
+    workers -- the number of worker processes, None for one per CPU,
+    or 0 to do the work in this process.
+    games_per_range -- the number of games given to a worker at a time.
+    """
+    pgn_file = PGNFile(path)
+    try:
+        bounds = pgn_file.offsets
+        bounds.append(pgn_file.size)
+    finally:
+        pgn_file.close()
+    ranges = ((path, start + 1, bounds[start:start + games_per_range + 1],
+               function)
+              for start in range(0, len(bounds) - 1, games_per_range))
+    for results in map_in_processes(process_range, ranges, workers):
+        yield from results
+
+
+def game_fens(game):
+    """
+    Returns the FEN strings of the positions in a Game, and the message
+    of the error that stopped its replay early, or None if none did.
+    """
+    fens = []
+    try:
+        for game_state in game.positions():
+            fens.append(game_state.fen)
+    except InvalidPGNError as err:
+        return fens, str(err)
+    return fens, None
+
+
+def write_positions(path, output=None, errors=None, workers=None,
+                    games_per_range=100):
+    """
+    Replays every game of a PGN file and writes the FEN string of each
+    position to `output`, each game's positions after a blank line, and
+    any errors to `errors`, which default to stdout and stderr. Returns
+    a (positions, failures) pair of counts. The other arguments are as
+    for `iter_results()`.
+    """
+    output = output or sys.stdout
+    errors = errors or sys.stderr
+    positions = failures = 0
+    written = False
+    results = iter_results(path, game_fens, workers, games_per_range)
+    for game_number, (fens, error), _ in results:
+        if fens:
+            if written:
+                output.write('\n')
+            output.write('\n'.join(fens) + '\n')
+            written = True
+            positions += len(fens)
+        if error is not None:
+            failures += 1
+            print(ERROR_GAME.format(path, game_number, error), file=errors)
+    return positions, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[3])
+    parser.add_argument('pgn_file', metavar='pgn-file',
+                        help='the PGN file to replay')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes, or 0 for none (default: one '
+                        'per CPU)')
+    parser.add_argument('--games-per-range', type=int, default=100,
+                        help='games given to a worker at a time '
+                        '(default: 100)')
+    parser.add_argument('--output', metavar='FILE',
+                        help='write the FEN strings here instead of stdout')
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.pgn_file):
+        error_out(NOT_FOUND.format(args.pgn_file))
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        _, failures = write_positions(args.pgn_file, output, sys.stderr,
+                                      args.workers, args.games_per_range)
+    finally:
+        if args.output:
+            output.close()
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""
+Batches of positions as NumPy arrays, evaluated all at once.
+
+For offline work over many positions, such as ranking candidate moves
+or filtering training data, looping over GameState objects in Python
+costs far more than the arithmetic. This module packs the boards of a
+batch into one (N, 64) int8 array, straight from a FEN file or from
+GameState objects, and computes the evaluation and a few simple
+features with array operations over the whole batch.
+
+In a board array, each square holds 0 when it is empty, 1 to 6 for a
+white pawn, knight, bishop, rook, queen or king, and -1 to -6 for the
+black pieces. Squares are numbered as on the GameState board. NumPy is
+only needed when this module is used:
+
+    pip install numpy
+"""
+
+from bitboards import (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, PIECES, FULL,
+                       FILE_A, FILE_B, FILE_H)
+from evaluation import (PIECE_SQUARE, PIECE_VALUES, PHASE_WEIGHTS,
+                        FULL_PHASE, KING_MIDDLEGAME_TABLE,
+                        KING_ENDGAME_TABLE)
+from gamestate import GameState
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The number of positions packed into an array at a time while a file
+# is read.
+CHUNK_SIZE = 4096
+
+# The (file, rank) steps of each kind of piece but the pawns.
+_KNIGHT_STEPS = [(1, 2), (2, 1), (2, -1), (1, -2),
+                 (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
+_KING_STEPS = [(0, 1), (1, 1), (1, 0), (1, -1),
+               (0, -1), (-1, -1), (-1, 0), (-1, 1)]
+_ROOK_STEPS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+_BISHOP_STEPS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError('position_arrays needs the numpy package: '
+                          'pip install numpy')
+
+
+def _build_tables():
+    """
+    Returns the lookup tables used on board arrays. Tables indexed by
+    piece code are offset by 6, so that black pieces, with negative
+    codes, index from 0.
+    """
+    codes = numpy.zeros(256, dtype=numpy.int8)
+    for index, letter in enumerate(PIECES):
+        kind = index % 6 + 1
+        codes[ord(letter)] = kind if index < 6 else -kind
+    # values[code + 6, square] is `evaluation.PIECE_SQUARE` for the piece
+    # with the code, with the kings left to the two king tables.
+    values = numpy.zeros((13, 64), dtype=numpy.int32)
+    king_middlegame = numpy.zeros((13, 64), dtype=numpy.int32)
+    king_endgame = numpy.zeros((13, 64), dtype=numpy.int32)
+    phases = numpy.zeros(13, dtype=numpy.int32)
+    material = numpy.zeros(13, dtype=numpy.int32)
+    for index in range(12):
+        kind = index % 6
+        sign = 1 if index < 6 else -1
+        row = 6 + sign * (kind + 1)
+        material[row] = sign * PIECE_VALUES[kind]
+        phases[row] = PHASE_WEIGHTS.get(kind, 0)
+        if kind == KING:
+            for square in range(64):
+                flipped = square ^ 56 if sign > 0 else square
+                king_middlegame[row, square] = (
+                    sign * KING_MIDDLEGAME_TABLE[flipped])
+                king_endgame[row, square] = sign * KING_ENDGAME_TABLE[flipped]
+        else:
+            values[row] = PIECE_SQUARE[index]
+    # wrap_masks[file_step] leaves out the squares that a step of that
+    # many files would wrap around to from the other side of the board.
+    wrap_masks = {
+        -2: numpy.uint64(FULL & ~(FILE_H >> 1 | FILE_H)),
+        -1: numpy.uint64(FULL & ~FILE_H),
+        0: numpy.uint64(FULL),
+        1: numpy.uint64(FULL & ~FILE_A),
+        2: numpy.uint64(FULL & ~(FILE_A | FILE_B)),
+    }
+    return (codes, values, king_middlegame, king_endgame, phases, material,
+            wrap_masks)
+
+
+if numpy is not None:
+    (_CODES, _VALUES, _KING_MIDDLEGAME, _KING_ENDGAME, _PHASES, _MATERIAL,
+     _WRAP_MASKS) = _build_tables()
+    _SQUARES = numpy.arange(64)
+    # constants for `_popcount()`
+    _ONE, _TWO, _FOUR, _FIFTY_SIX = (numpy.uint64(bits)
+                                     for bits in (1, 2, 4, 56))
+    _M1 = numpy.uint64(0x5555555555555555)
+    _M2 = numpy.uint64(0x3333333333333333)
+    _M4 = numpy.uint64(0x0F0F0F0F0F0F0F0F)
+    _H01 = numpy.uint64(0x0101010101010101)
+
+
+def encode_boards(game_states):
+    """
+    Returns the boards of the given GameState objects as an (N, 64) int8
+    array, in one pass over the objects.
+    """
+    _require_numpy()
+    squares = b''.join(bytes(game_state._squares)
+                       for game_state in game_states)
+    letters = numpy.frombuffer(squares, dtype=numpy.uint8).reshape(-1, 64)
+    return _CODES[letters]
+
+
+def encode_players(game_states):
+    """
+    Returns an (N,) int8 array with 1 for each GameState with white to
+    move and -1 for each with black to move.
+    """
+    _require_numpy()
+    return numpy.array([1 if game_state.player == 'w' else -1
+                        for game_state in game_states], dtype=numpy.int8)
+
+
+def load_fen_file(path, on_error=None):
+    """
+    Reads a file of FEN or EPD records, one per line, as
+    `GameState.iter_file()` does, and returns a (boards, players) pair
+    of arrays, as from `encode_boards()` and `encode_players()`, with a
+    row for each valid line. Only `CHUNK_SIZE` GameState objects are
+    held at a time.
+    """
+    _require_numpy()
+    boards = []
+    players = []
+    chunk = []
+    for game_state in GameState.iter_file(path, on_error):
+        chunk.append(game_state)
+        if len(chunk) == CHUNK_SIZE:
+            boards.append(encode_boards(chunk))
+            players.append(encode_players(chunk))
+            chunk = []
+    if chunk or not boards:
+        boards.append(encode_boards(chunk))
+        players.append(encode_players(chunk))
+    return numpy.concatenate(boards), numpy.concatenate(players)
+
+
+def to_planes(boards):
+    """
+    Returns an (N, 64) board array as an (N, 12, 64) int8 array of
+    zeros and ones, with a plane for each piece in the order of
+    `bitboards.PIECES`.
+    """
+    _require_numpy()
+    codes = numpy.array([kind + 1 for kind in range(6)]
+                        + [-(kind + 1) for kind in range(6)],
+                        dtype=numpy.int8)
+    return (boards[:, None, :] == codes[None, :, None]).astype(numpy.int8)
+
+
+def evaluate_batch(boards, players):
+    """
+    Returns an (N,) int32 array with the score of each position, in
+    centipawns, for the player to move, the same as
+    `evaluation.evaluate()` gives for each one.
+
+    Arguments:
+    boards -- an (N, 64) board array.
+    players -- an (N,) array of 1 for white to move and -1 for black.
+    """
+    _require_numpy()
+    rows = boards.astype(numpy.intp) + 6
+    # index the tables flat, so the index is only worked out once
+    flat = rows * 64 + _SQUARES
+    score = _VALUES.take(flat).sum(axis=1)
+    phase = numpy.minimum(_PHASES.take(rows).sum(axis=1), FULL_PHASE)
+    middlegame = _KING_MIDDLEGAME.take(flat).sum(axis=1)
+    endgame = _KING_ENDGAME.take(flat).sum(axis=1)
+    score += (middlegame * phase + endgame * (FULL_PHASE - phase)
+              ) // FULL_PHASE
+    return (score * players).astype(numpy.int32)
+
+
+def features(boards):
+    """
+    Returns a dict of simple features of each position in an (N, 64)
+    board array, each an (N,) int32 array of white's count less black's:
+
+        material        material, in centipawns
+        mobility        pseudo-legal moves of the knights, bishops,
+                        rooks, queens and kings, not counting castling
+                        or whether the king is left in check
+        doubled_pawns   pawns with another of their own pawns ahead of
+                        them on the same file
+        isolated_pawns  pawns with no pawns of their own on the files
+                        next to them
+        passed_pawns    pawns with no enemy pawns ahead of them on
+                        their own file or the files next to them
+    """
+    _require_numpy()
+    rows = boards.astype(numpy.intp) + 6
+    white_pawns = _bitboards(boards, [PAWN + 1], 1)
+    black_pawns = _bitboards(boards, [PAWN + 1], -1)
+    white = _pawn_features(white_pawns, black_pawns, 8)
+    black = _pawn_features(black_pawns, white_pawns, -8)
+    ret = {
+        'material': _MATERIAL[rows].sum(axis=1).astype(numpy.int32),
+        'mobility': (_mobility(boards, 1)
+                     - _mobility(boards, -1)).astype(numpy.int32),
+    }
+    for name in white:
+        ret[name] = (white[name] - black[name]).astype(numpy.int32)
+    return ret
+
+
+def _pawn_features(own, enemy, forward):
+    """
+    Returns the pawn structure counts for the player whose pawns are in
+    the `own` bitboards, against the `enemy` pawns, where the player's
+    pawns move `forward` squares a step: 8 for white, -8 for black.
+    """
+    # the squares behind the player's pawns, and in front of the enemy's
+    own_behind = _file_fill(own, -forward)
+    enemy_front = _file_fill(enemy, -forward)
+    files = own | own_behind | _file_fill(own, forward)
+    blocked = (enemy_front | (_shift(enemy_front, 1) & _WRAP_MASKS[1])
+               | (_shift(enemy_front, -1) & _WRAP_MASKS[-1]))
+    neighbours = ((_shift(files, 1) & _WRAP_MASKS[1])
+                  | (_shift(files, -1) & _WRAP_MASKS[-1]))
+    return {
+        'doubled_pawns': _popcount(own & own_behind),
+        'isolated_pawns': _popcount(own & ~neighbours),
+        'passed_pawns': _popcount(own & ~blocked),
+    }
+
+
+def _file_fill(bitboards, shift):
+    """
+    Returns the squares strictly beyond each set square, along its file,
+    in the direction of `shift`, which is 8 or -8.
+    """
+    bitboards = _shift(bitboards, shift)
+    bitboards = bitboards | _shift(bitboards, shift)
+    bitboards = bitboards | _shift(bitboards, shift * 2)
+    return bitboards | _shift(bitboards, shift * 4)
+
+
+def _mobility(boards, sign):
+    """
+    Returns an (N,) array of the pseudo-legal moves of the pieces other
+    than pawns of the player whose codes have the given sign.
+
+    The pieces are turned into one bitboard per position, in a uint64
+    array, and moved a step at a time in each direction, so the work is
+    done on N words rather than N boards. Moving all of a player's
+    knights one way cannot land two of them on the same square, nor can
+    sliding all of their rooks and queens one way, since the nearer
+    piece blocks the other, so counting the squares reached counts the
+    moves.
+    """
+    own = _bitboards(boards, [code for code in range(1, 7)], sign)
+    empty = _bitboards(boards, [0], 1)
+    targets = ~own
+    count = numpy.zeros(len(boards), dtype=numpy.int64)
+    for kinds, steps, slides in [
+            ((KNIGHT,), _KNIGHT_STEPS, False),
+            ((KING,), _KING_STEPS, False),
+            ((ROOK, QUEEN), _ROOK_STEPS, True),
+            ((BISHOP, QUEEN), _BISHOP_STEPS, True)]:
+        pieces = _bitboards(boards, [kind + 1 for kind in kinds], sign)
+        for file_step, rank_step in steps:
+            shift = rank_step * 8 + file_step
+            mask = _WRAP_MASKS[file_step]
+            if slides:
+                pieces_seen = _fill(pieces, empty & mask, shift)
+            else:
+                pieces_seen = pieces
+            count += _popcount(_shift(pieces_seen, shift) & mask & targets)
+    return count
+
+
+def _bitboards(boards, codes, sign):
+    """
+    Returns an (N,) uint64 array of bitboards of the squares holding any
+    of the given codes times `sign`.
+    """
+    squares = numpy.isin(boards, [code * sign for code in codes])
+    return numpy.packbits(squares, axis=1, bitorder='little').view(
+        '<u8').ravel()
+
+
+def _shift(bitboards, shift):
+    """Shifts bitboards up by `shift` squares, or down if it is negative."""
+    if shift > 0:
+        return bitboards << numpy.uint64(shift)
+    return bitboards >> numpy.uint64(-shift)
+
+
+def _fill(pieces, open_squares, shift):
+    """
+    Returns the pieces spread along the direction of `shift` over any
+    run of open squares, by Kogge-Stone doubling: three steps cover the
+    seven squares a piece can slide.
+    """
+    pieces = pieces | (open_squares & _shift(pieces, shift))
+    open_squares = open_squares & _shift(open_squares, shift)
+    pieces = pieces | (open_squares & _shift(pieces, shift * 2))
+    open_squares = open_squares & _shift(open_squares, shift * 2)
+    return pieces | (open_squares & _shift(pieces, shift * 4))
+
+
+def _popcount(bitboards):
+    """Returns the number of squares set in each of an array of bitboards."""
+    bitboards = bitboards - ((bitboards >> _ONE) & _M1)
+    bitboards = (bitboards & _M2) + ((bitboards >> _TWO) & _M2)
+    bitboards = (bitboards + (bitboards >> _FOUR)) & _M4
+    return ((bitboards * _H01) >> _FIFTY_SIX).astype(numpy.int64)
@@ -0,0 +1,364 @@
+"""
+On-disk database of positions and what is known about them.
+
+Positions are kept as fixed-width entries in an append-only, memory-mapped
+file: the 32-byte record written by `GameState.to_bytes()`, followed by
+annotations, such as the suggested move and the tablebase result. A
+second memory-mapped file holds an open-addressing hash index from each
+position's Zobrist hash to its entry, so looking a position up costs a
+probe or two however large the database grows, and never needs the API
+or a FEN string to be parsed again.
+
+Entries are never moved or removed once written, though their
+annotations can be updated in place. If the index is lost or out of
+step with the entries, it is rebuilt from them when the database is
+opened. A database should only be written by one process at a time.
+
+Usage: python position_db.py <database> <fen-file> [<fen-file> ...]
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+from gamestate import GameState, RECORD_SIZE
+from move import from_uci, to_uci
+
+RECORDS_MAGIC = b'POSDB\x00\x00\x02'
+INDEX_MAGIC = b'POSIX\x00\x00\x01'
+HEADER_SIZE = 16
+# An entry is a GameState record followed by the suggested move, packed
+# as by the `move` module, a byte of `HAS_*` flags telling
+# which annotations are set, and the WDL and DTZ values.
+ENTRY_FORMAT = '<{}sHBbh2x'.format(RECORD_SIZE)
+_ENTRY = struct.Struct(ENTRY_FORMAT)
+ENTRY_SIZE = _ENTRY.size
+_ANNOTATIONS = struct.Struct('<HBbh')
+HAS_MOVE = 1
+HAS_WDL = 2
+HAS_DTZ = 4
+# The part of a record that tells positions apart: everything before
+# the move clocks.
+_POSITION_SIZE = struct.calcsize('<Q16sBB')
+_HEADER = struct.Struct('<8sQ')
+_SLOT_SIZE = 16
+_MIN_SLOTS = 1024
+
+
+class PositionDatabase:
+    """
+    Persistent store of positions, keyed by their Zobrist hashes, with a
+    suggested move and tablebase WDL and DTZ values for each.
+
+    It can be given to GameState as its `move_cache`, through
+    `key_for()`, `get()` and `set()`, so that suggested moves are saved
+    for good.
+    """
+
+    def __init__(self, path):
+        """
+        Constructor for PositionDatabase class
+
+        Arguments:
+        path -- the path of the entries file, which is created if it does
+        not exist. The index is kept next to it, in `path + '.idx'`.
+        """
+        self.path = path
+        self.index_path = path + '.idx'
+        self._records_file, self._records = _open_mapped(
+            path, RECORDS_MAGIC, HEADER_SIZE + ENTRY_SIZE * 1024)
+        self._count = _HEADER.unpack_from(self._records)[1]
+        self._index_file, self._index = _open_mapped(
+            self.index_path, INDEX_MAGIC,
+            HEADER_SIZE + _SLOT_SIZE * _MIN_SLOTS)
+        self._slots = memoryview(self._index)[HEADER_SIZE:].cast('Q')
+        self._mask = len(self._slots) // 2 - 1
+        self._indexed = _HEADER.unpack_from(self._index)[1]
+        if self._indexed != self._count:
+            self.rebuild_index()
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, game_state):
+        return self._find(game_state.zobrist_hash,
+                          game_state.to_bytes()) is not None
+
+    def add(self, game_state, move=None, wdl=None, dtz=None):
+        """
+        Stores a position, if it is not already stored, and sets any of
+        its annotations that are given. Returns the position's entry
+        number.
+
+        Arguments:
+        game_state -- the GameState to store. Its move clocks are kept,
+        but positions that only differ in their clocks share an entry.
+        move -- the suggested move, as a UCI string.
+        wdl -- the tablebase win/draw/loss value, from -2 to 2.
+        dtz -- the tablebase distance to zeroing value.
+        """
+        key = game_state.zobrist_hash
+        record = game_state.to_bytes()
+        number = self._find(key, record)
+        if number is None:
+            number = self._append(key, record)
+        if move is not None or wdl is not None or dtz is not None:
+            self._annotate(number, move, wdl, dtz)
+        return number
+
+    def lookup(self, game_state):
+        """
+        Returns a dict of the 'move', 'wdl' and 'dtz' annotations stored
+        for the given GameState's position, with None for any that are
+        not set, or None if the position is not stored.
+        """
+        number = self._find(game_state.zobrist_hash, game_state.to_bytes())
+        if number is None:
+            return None
+        return self.annotations(number)
+
+    def annotations(self, number):
+        """
+        Returns the annotations of the entry with the given number, as
+        for `lookup()`.
+        """
+        move, flags, wdl, dtz = _ANNOTATIONS.unpack_from(
+            self._records, self._offset(number) + RECORD_SIZE)
+        return {
+            'move': to_uci(move) if flags & HAS_MOVE else None,
+            'wdl': wdl if flags & HAS_WDL else None,
+            'dtz': dtz if flags & HAS_DTZ else None,
+        }
+
+    def game_state(self, number, move_source=None, move_cache=None):
+        """
+        Returns a new GameState for the entry with the given number,
+        decoded straight from the mapped file.
+        """
+        return GameState.from_bytes(self._records, self._offset(number),
+                                    move_source, move_cache)
+
+    def __iter__(self):
+        """
+        Iterator. Yields a GameState for each entry, in the order they
+        were added.
+        """
+        for number in range(self._count):
+            yield self.game_state(number)
+
+    def import_file(self, path, on_error=None):
+        """
+        Adds every position in a file of FEN or EPD records, one per
+        line, as read by `GameState.iter_file()`. Returns the number of
+        positions that were not already stored.
+        """
+        count = self._count
+        for game_state in GameState.iter_file(path, on_error):
+            self.add(game_state)
+        return self._count - count
+
+    def key_for(self, game_state):
+        """
+        Returns the key a GameState is stored under: its hash, with its
+        record to tell apart positions whose hashes collide.
+        """
+        return game_state.zobrist_hash, game_state.to_bytes()
+
+    def get(self, key):
+        """
+        Returns the suggested move stored for the given key, or None.
+        """
+        number = self._find(*key)
+        if number is None:
+            return None
+        return self.annotations(number)['move']
+
+    def set(self, key, move):
+        """Stores the move suggested for the given key."""
+        zobrist_hash, record = key
+        number = self._find(zobrist_hash, record)
+        if number is None:
+            number = self._append(zobrist_hash, record)
+        self._annotate(number, move, None, None)
+
+    def _offset(self, number):
+        if not 0 <= number < self._count:
+            raise IndexError('no entry {}'.format(number))
+        return HEADER_SIZE + number * ENTRY_SIZE
+
+    def _find(self, key, record):
+        """
+        Returns the number of the entry for the position with the given
+        hash and record, or None if it is not stored.
+        """
+        slots = self._slots
+        records = self._records
+        position = record[:_POSITION_SIZE]
+        slot = key & self._mask
+        while True:
+            value = slots[slot * 2 + 1]
+            if not value:
+                return None
+            if slots[slot * 2] == key:
+                offset = HEADER_SIZE + (value - 1) * ENTRY_SIZE
+                if records[offset:offset + _POSITION_SIZE] == position:
+                    return value - 1
+            slot = (slot + 1) & self._mask
+
+    def _append(self, key, record):
+        """Writes a new entry and indexes it. Returns its number."""
+        number = self._count
+        offset = HEADER_SIZE + number * ENTRY_SIZE
+        if offset + ENTRY_SIZE > len(self._records):
+            self._records = _resize(self._records_file, self._records,
+                                    HEADER_SIZE + (len(self._records)
+                                                   - HEADER_SIZE) * 2)
+        _ENTRY.pack_into(self._records, offset, record, 0, 0, 0, 0)
+        # the entry is counted only once it is written in full
+        self._count = number + 1
+        _HEADER.pack_into(self._records, 0, RECORDS_MAGIC, self._count)
+        if (self._indexed + 1) * 4 > (self._mask + 1) * 3:
+            self._resize_index((self._mask + 1) * 2)
+        self._insert(key, number)
+        self._indexed += 1
+        _HEADER.pack_into(self._index, 0, INDEX_MAGIC, self._indexed)
+        return number
+
+    def _annotate(self, number, move, wdl, dtz):
+        offset = self._offset(number) + RECORD_SIZE
+        old_move, flags, old_wdl, old_dtz = _ANNOTATIONS.unpack_from(
+            self._records, offset)
+        if move is not None:
+            old_move = from_uci(move)
+            flags |= HAS_MOVE
+        if wdl is not None:
+            old_wdl = wdl
+            flags |= HAS_WDL
+        if dtz is not None:
+            old_dtz = dtz
+            flags |= HAS_DTZ
+        _ANNOTATIONS.pack_into(self._records, offset, old_move, flags,
+                               old_wdl, old_dtz)
+
+    def _insert(self, key, number):
+        slots = self._slots
+        slot = key & self._mask
+        while slots[slot * 2 + 1]:
+            slot = (slot + 1) & self._mask
+        slots[slot * 2] = key
+        slots[slot * 2 + 1] = number + 1
+
+    def _resize_index(self, slot_count):
+        """Rehashes the index into a table with the given slot count."""
+        slots = self._slots
+        entries = [(slots[slot], slots[slot + 1])
+                   for slot in range(0, len(slots), 2) if slots[slot + 1]]
+        self._map_index(slot_count)
+        for key, value in entries:
+            self._insert(key, value - 1)
+
+    def _map_index(self, slot_count):
+        """Replaces the index with an empty one of the given size."""
+        self._slots.release()
+        self._index = _resize(self._index_file, self._index, HEADER_SIZE)
+        self._index = _resize(self._index_file, self._index,
+                              HEADER_SIZE + slot_count * _SLOT_SIZE)
+        self._slots = memoryview(self._index)[HEADER_SIZE:].cast('Q')
+        self._mask = slot_count - 1
+
+    def rebuild_index(self):
+        """
+        Builds the index again from the entries, which are always
+        written before they are indexed.
+        """
+        slot_count = _MIN_SLOTS
+        while self._count * 4 > slot_count * 3:
+            slot_count *= 2
+        self._map_index(slot_count)
+        for number, game_state in enumerate(self):
+            self._insert(game_state.zobrist_hash, number)
+        self._indexed = self._count
+        _HEADER.pack_into(self._index, 0, INDEX_MAGIC, self._indexed)
+
+    def flush(self):
+        """Writes any changes still in memory out to the files."""
+        self._records.flush()
+        self._index.flush()
+
+    @property
+    def stats(self):
+        """
+        Property. A dict of the entry count and the sizes of the files
+        and the index.
+        """
+        return {
+            'entries': self._count,
+            'index_slots': self._mask + 1,
+            'records_bytes': len(self._records),
+            'index_bytes': len(self._index),
+        }
+
+    def close(self):
+        """Flushes the database and closes its files."""
+        self.flush()
+        self._slots.release()
+        self._records.close()
+        self._index.close()
+        self._records_file.close()
+        self._index_file.close()
+
+
+def _open_mapped(path, magic, initial_size):
+    """
+    Opens the file at the given path, creating it with an empty header
+    and `initial_size` bytes if it does not exist or is empty, and maps
+    it into memory. Returns the file and the mapping.
+    """
+    mapped_file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+    if os.fstat(mapped_file.fileno()).st_size == 0:
+        mapped_file.write(_HEADER.pack(magic, 0))
+        mapped_file.truncate(initial_size)
+        mapped_file.flush()
+    mapping = mmap.mmap(mapped_file.fileno(), 0)
+    if mapping[:len(magic)] != magic:
+        mapping.close()
+        mapped_file.close()
+        raise ValueError('{} is not a position database file'.format(path))
+    return mapped_file, mapping
+
+
+def _resize(mapped_file, mapping, size):
+    """
+    Grows or shrinks a mapped file, filling any new space with zeros,
+    and returns a new mapping of it.
+    """
+    mapping.flush()
+    mapping.close()
+    mapped_file.truncate(size)
+    return mmap.mmap(mapped_file.fileno(), 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('database', help='the database file to add to')
+    parser.add_argument('fen_files', nargs='+', metavar='fen-file',
+                        help='files with one FEN or EPD record per line')
+    args = parser.parse_args()
+
+    database = PositionDatabase(args.database)
+    try:
+        for path in args.fen_files:
+            added = database.import_file(
+                path, lambda line_number, line, error: print(
+                    '{}:{}: FEN invalid: {}'.format(path, line_number, error),
+                    file=sys.stderr))
+            print('{}: {} new positions'.format(path, added))
+        print('{} positions in {}'.format(len(database), args.database))
+    finally:
+        database.close()
+
+
+if __name__ == '__main__':
+    main()
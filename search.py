@@ -0,0 +1,424 @@
+"""
+Local alpha-beta search, for when the tablebase has no answer.
+
+The tablebase only knows positions with seven pieces or fewer, and the
+API may be out of reach, so `SearchMoveSource` suggests moves by
+searching the position itself: iterative deepening negamax alpha-beta
+with a quiescence search over captures, a transposition table, and
+move ordering by the table's move, captures by most valuable victim,
+killer moves and a history table. Each search stops when its time or
+node budget runs out, and answers with the best move of the deepest
+iteration it finished, so a move always comes back within the budget.
+
+`FallbackMoveSource` chains move sources, so that GameState can ask the
+tablebase first and search when it fails:
+
+    move_source = FallbackMoveSource(default_client(), SearchMoveSource())
+"""
+
+import time
+from collections import namedtuple
+
+from bitboards import PIECE_INDEX, PAWN
+from evaluation import evaluate, PIECE_VALUES
+from move import (Move, KIND_MASK, PROMOTION, EN_PASSANT, new_move_list,
+                  to_uci)
+from tablebase import TablebaseError
+from transposition import (TranspositionTable, BOUND_EXACT, BOUND_LOWER,
+                           BOUND_UPPER, MAX_DEPTH)
+
+# Scores are in centipawns. A checkmate found n plies from the root
+# scores MATE - n, so that quicker mates score higher, and any score
+# beyond MATE_BOUND is a mate.
+INFINITY = 1000000
+MATE = 100000
+MAX_PLY = 128
+MATE_BOUND = MATE - MAX_PLY
+
+# How many nodes are searched between looks at the clock.
+_CLOCK_INTERVAL = 1024
+
+# Move ordering keys. Captures and promotions come first, then killer
+# moves, then quiet moves by their history scores, which stay below
+# `_KILLER_KEY`.
+_HASH_MOVE_KEY = 1 << 30
+_CAPTURE_KEY = 1 << 28
+_KILLER_KEY = 1 << 26
+_HISTORY_LIMIT = _KILLER_KEY - 1
+# The value of the piece on each board letter, for ordering captures by
+# most valuable victim, then least valuable attacker.
+_VALUES = [PIECE_VALUES[index % 6] if index >= 0 else 0
+           for index in PIECE_INDEX]
+_PAWN_VALUE = PIECE_VALUES[PAWN]
+_EMPTY = ord(' ')
+
+SearchResult = namedtuple('SearchResult', 'move score depth nodes seconds')
+SearchResult.__doc__ = """
+The outcome of `SearchMoveSource.search()`: the best move found, as a
+`move.Move`, its score for the player to move, the deepest iteration
+finished, the number of nodes searched and the seconds taken.
+"""
+
+
+class _OutOfBudget(Exception):
+    """Raised inside a search when its time or node budget runs out."""
+    pass
+
+
+class SearchMoveSource:
+    """
+    Suggests moves for GameState objects by searching them locally, with
+    no network and bounded latency.
+
+    Like the other move sources, `suggest_move()` raises TablebaseError
+    when there is no move to suggest, because the position is checkmate
+    or stalemate.
+    """
+
+    def __init__(self, max_depth=64, time_limit=1.0, max_nodes=None,
+                 table=None, clock=time.monotonic, stop=None):
+        """
+        Constructor for SearchMoveSource class
+
+        Arguments:
+        max_depth -- the deepest iteration to search, in plies.
+        time_limit -- the most seconds a search may take, or None for
+        no limit.
+        max_nodes -- the most nodes a search may visit, or None for no
+        limit.
+        table -- the `transposition.TranspositionTable` to use, which
+        may be shared with GameState as its move cache. A 16 MB table
+        is made if none is given.
+        clock -- a function returning the current time in seconds.
+        stop -- an optional function returning whether to stop the
+        search early. It is called as often as the clock is read.
+        """
+        self.max_depth = max(1, min(max_depth, MAX_PLY - 1))
+        self.time_limit = time_limit
+        self.max_nodes = max_nodes
+        self.table = table if table is not None else TranspositionTable()
+        self._clock = clock
+        self._stop = stop
+        self.nodes = 0
+        self.iterations = []
+        self._node_limit = None
+        self._deadline = None
+        self._killers = None
+        self._history = None
+        # one move list for each ply, refilled at every node instead of
+        # making a new one
+        self._move_lists = [new_move_list() for _ in range(MAX_PLY + 1)]
+
+    def suggest_move(self, game_state):
+        """
+        Returns the best move found, as a UCI string, for the player
+        whose turn it is in the given GameState.
+        """
+        return to_uci(self.search(game_state).move)
+
+    def search(self, game_state, root_moves=None):
+        """
+        Searches the given GameState, which is left unchanged, and
+        returns a `SearchResult`. Searching stops at `max_depth`, when
+        the budget runs out, or when a forced mate is found. The (depth,
+        score, move) result of each finished iteration is left in
+        `iterations`.
+
+        Arguments:
+        game_state -- the GameState to search.
+        root_moves -- if given, only these legal moves, packed as by the
+        `move` module, are searched at the root, even if there is only
+        one of them. This is how `parallel_search` shares out the work.
+        """
+        start = self._clock()
+        game_state = game_state.copy()
+        moves = game_state.legal_move_codes()
+        if not moves:
+            raise TablebaseError('no moves for {}'.format(game_state.fen))
+        if root_moves is not None:
+            moves = [move for move in moves if move in root_moves]
+            if not moves:
+                raise ValueError('none of the root moves are legal')
+        self.nodes = 0
+        self.iterations = []
+        self._node_limit = self.max_nodes or INFINITY
+        self._deadline = (start + self.time_limit
+                          if self.time_limit is not None else None)
+        self._killers = [[0, 0] for _ in range(MAX_PLY + 1)]
+        self._history = [0] * 4096
+        self.table.new_search()
+
+        entry = self.table.probe(game_state.zobrist_hash)
+        best_move = self._order(game_state, moves, entry and entry[0], 0)[0]
+        best_score = evaluate(game_state)
+        finished = 0
+        if len(moves) > 1 or root_moves is not None:
+            for depth in range(1, self.max_depth + 1):
+                try:
+                    best_score, best_move = self._root(
+                        game_state, moves, depth, best_move,
+                        root_moves is None)
+                except _OutOfBudget:
+                    break
+                finished = depth
+                self.iterations.append((depth, best_score, best_move))
+                if abs(best_score) > MATE_BOUND:
+                    break
+                # the next iteration takes several times as long as this
+                # one, so only start it if it has a chance to finish
+                if (self._deadline is not None and
+                        (self._clock() - start) * 2 > self.time_limit):
+                    break
+        return SearchResult(Move(best_move), best_score, finished,
+                            self.nodes, self._clock() - start)
+
+    def _root(self, game_state, moves, depth, best_move, save=True):
+        """
+        Searches every move at the root to the given depth, the best
+        move of the last iteration first, and returns the best score and
+        move. The result is saved in the table unless `save` is false,
+        as it must be when only some of the legal moves were searched.
+        """
+        alpha = -INFINITY
+        for move in self._order(game_state, moves, best_move, 0):
+            game_state.push(move)
+            score = -self._search(game_state, depth - 1, -INFINITY, -alpha, 1)
+            game_state.pop()
+            if score > alpha:
+                alpha = score
+                best_move = move
+        if save:
+            self.table.save(game_state.zobrist_hash, best_move,
+                            _to_table(alpha, 0), depth, BOUND_EXACT)
+        return alpha, best_move
+
+    def _search(self, game_state, depth, alpha, beta, ply):
+        """
+        Returns the score of the given GameState for the player to move,
+        searched to the given depth, as seen through the alpha-beta
+        window. Scores outside the window are only bounds.
+        """
+        self._visit()
+        key = game_state._hash
+        if game_state.halfmove_clock >= 100 or _is_repetition(game_state):
+            return 0
+        if ply >= MAX_PLY:
+            return evaluate(game_state)
+        in_check = game_state.in_check
+        if in_check:
+            # look one ply further at checks, so that mates are not
+            # pushed out of sight
+            depth += 1
+        if depth <= 0:
+            return self._quiesce(game_state, alpha, beta, ply)
+
+        hash_move = 0
+        entry = self.table.probe(key)
+        if entry is not None:
+            hash_move, score, entry_depth, bound = entry
+            # entries from a move source have no real score, so only
+            # their move is used
+            if depth <= entry_depth < MAX_DEPTH:
+                score = _from_table(score, ply)
+                if (bound == BOUND_EXACT
+                        or bound == BOUND_LOWER and score >= beta
+                        or bound == BOUND_UPPER and score <= alpha):
+                    return score
+
+        moves = self._move_lists[ply]
+        del moves[:]
+        game_state.legal_move_codes(moves)
+        if not moves:
+            return -MATE + ply if in_check else 0
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = 0
+        squares = game_state._squares
+        for move in self._order(game_state, moves, hash_move, ply):
+            game_state.push(move)
+            score = -self._search(game_state, depth - 1, -beta, -alpha,
+                                  ply + 1)
+            game_state.pop()
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if (squares[move >> 6 & 63] == _EMPTY
+                                and not move & KIND_MASK):
+                            self._remember_quiet(move, depth, ply)
+                        break
+        if best_score >= beta:
+            bound = BOUND_LOWER
+        elif best_score > original_alpha:
+            bound = BOUND_EXACT
+        else:
+            bound = BOUND_UPPER
+        self.table.save(key, best_move, _to_table(best_score, ply), depth,
+                        bound)
+        return best_score
+
+    def _quiesce(self, game_state, alpha, beta, ply):
+        """
+        Returns the score of the given GameState once captures and
+        promotions have played out, so that the search never stops in
+        the middle of an exchange. The player to move may always stand
+        pat instead of capturing.
+        """
+        self._visit()
+        stand_pat = evaluate(game_state)
+        if stand_pat >= beta:
+            return stand_pat
+        moves = self._move_lists[ply]
+        del moves[:]
+        game_state.legal_move_codes(moves)
+        if not moves:
+            return -MATE + ply if game_state.in_check else 0
+        if ply >= MAX_PLY:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        squares = game_state._squares
+        for move in self._order(game_state, moves, 0, ply):
+            if (squares[move >> 6 & 63] == _EMPTY
+                    and move & KIND_MASK not in (PROMOTION, EN_PASSANT)):
+                # ordering puts every capture and promotion first
+                break
+            game_state.push(move)
+            score = -self._quiesce(game_state, -beta, -alpha, ply + 1)
+            game_state.pop()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _order(self, game_state, moves, hash_move, ply):
+        """
+        Returns the given moves sorted best first: the hash move, then
+        captures and promotions, then killer moves, then quiet moves by
+        their history scores.
+        """
+        squares = game_state._squares
+        killers = self._killers[ply] if self._killers else ()
+        history = self._history or ()
+        keyed = []
+        for move in moves:
+            if move == hash_move:
+                keyed.append((_HASH_MOVE_KEY, move))
+                continue
+            victim = _VALUES[squares[move >> 6 & 63]]
+            kind = move & KIND_MASK
+            if kind == EN_PASSANT:
+                victim = _PAWN_VALUE
+            if victim or kind == PROMOTION:
+                key = _CAPTURE_KEY + victim * 16 - (
+                    _VALUES[squares[move & 63]] >> 4)
+                if kind == PROMOTION:
+                    key += 1000 + (move >> 12 & 3)
+            elif move in killers:
+                key = _KILLER_KEY
+            else:
+                key = history[move & 4095] if history else 0
+            keyed.append((key, move))
+        keyed.sort(reverse=True)
+        return [move for _, move in keyed]
+
+    def _remember_quiet(self, move, depth, ply):
+        """
+        Records a quiet move that caused a cutoff, as a killer move for
+        its ply and in the history table.
+        """
+        killers = self._killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        history = self._history
+        index = move & 4095
+        history[index] = min(history[index] + depth * depth, _HISTORY_LIMIT)
+
+    def _visit(self):
+        """
+        Counts a node, and raises _OutOfBudget if the node or time budget
+        has run out, or the search has been told to stop.
+        """
+        self.nodes += 1
+        if self.nodes >= self._node_limit:
+            raise _OutOfBudget()
+        if not self.nodes % _CLOCK_INTERVAL and (
+                self._deadline is not None
+                and self._clock() >= self._deadline
+                or self._stop is not None and self._stop()):
+            raise _OutOfBudget()
+
+
+class FallbackMoveSource:
+    """
+    Asks each of a list of move sources for a move in turn, until one
+    gives an answer, so that a failing or unreachable move source does
+    not stop the game.
+    """
+
+    def __init__(self, *move_sources):
+        """
+        Constructor for FallbackMoveSource class
+
+        Arguments:
+        move_sources -- the move sources to ask, in order. A move source
+        fails by raising TablebaseError, or OSError, which covers
+        network errors.
+        """
+        self.move_sources = move_sources
+        self.fallbacks = 0
+
+    def suggest_move(self, game_state):
+        """
+        Returns the move suggested by the first move source that does
+        not fail. If they all fail, the last one's error is raised.
+        """
+        error = None
+        for move_source in self.move_sources:
+            try:
+                return move_source.suggest_move(game_state)
+            except (TablebaseError, OSError) as err:
+                error = err
+                self.fallbacks += 1
+        raise error
+
+
+def _is_repetition(game_state):
+    """
+    Returns whether the position of the given GameState has been seen
+    before, according to its undo stack, since the last capture or pawn
+    move.
+    """
+    undo = game_state._undo
+    key = game_state._hash
+    # a position can first repeat four plies on, with the same player
+    # to move
+    for back in range(4, min(game_state.halfmove_clock, len(undo)) + 1, 2):
+        if undo[-back][7] == key:
+            return True
+    return False
+
+
+def _to_table(score, ply):
+    """
+    Returns a score to store in the transposition table, with mates
+    counted from the position rather than from the root.
+    """
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def _from_table(score, ply):
+    """Undoes `_to_table()` for a score read back at the given ply."""
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
@@ -0,0 +1,134 @@
+"""
+Move source that probes local Syzygy tablebase files.
+
+This gives the same answers as the syzygy-tables.info API without
+going over the network. Table files (.rtbw and .rtbz) are read with the
+python-chess package, which memory-maps them, so worker processes
+probing the same tables share the operating system's page cache instead
+of each loading their own copy. python-chess is only needed when this
+module is used:
+
+    pip install chess
+"""
+
+from collections import OrderedDict
+
+from bitboards import popcount
+from tablebase import TablebaseError
+
+try:
+    import chess
+    import chess.syzygy
+except ImportError:
+    chess = None
+
+
+class SyzygyMoveSource:
+    """
+    Suggests moves for GameState objects by probing Syzygy tables on
+    disk. Like the API, it ranks winning moves by how quickly they make
+    progress and losing moves by how long they hold out.
+    """
+
+    def __init__(self, directory, max_pieces=7):
+        """
+        Constructor for SyzygyMoveSource class
+
+        Arguments:
+        directory -- the directory holding the .rtbw and .rtbz files.
+        It may also be a list of directories.
+        max_pieces -- positions with more pieces than this are not
+        probed at all.
+        """
+        self.max_pieces = max_pieces
+        self._tablebase = self._open(directory)
+
+    def _open(self, directory):
+        if chess is None:
+            raise ImportError('SyzygyMoveSource needs the python-chess '
+                              'package: pip install chess')
+        directories = ([directory] if isinstance(directory, str)
+                       else directory)
+        tablebase = chess.syzygy.Tablebase()
+        for path in directories:
+            tablebase.add_directory(path)
+        return tablebase
+
+    def get_moves(self, game_state):
+        """
+        Returns an OrderedDict mapping each legal move, as a UCI string,
+        to a dict of its 'wdl' and 'dtz' values, best move first. The
+        values are from the point of view of the player making the move.
+        """
+        occupied = game_state._occupied[0] | game_state._occupied[1]
+        if popcount(occupied) > self.max_pieces:
+            raise TablebaseError('too many pieces for the tablebase: '
+                                 '{}'.format(game_state.fen))
+        ranked = []
+        for move in game_state.legal_moves():
+            child = game_state.copy()
+            child._make_move(move)
+            wdl, dtz, mate = self._probe_after(child)
+            ranked.append((_rank(wdl, dtz, mate, child.halfmove_clock == 0),
+                           move, wdl, dtz))
+        # sorted() keeps moves that rank the same in generation order
+        ranked.sort(key=lambda entry: entry[0])
+        return OrderedDict((move, {'wdl': wdl, 'dtz': dtz})
+                           for _, move, wdl, dtz in ranked)
+
+    def suggest_move(self, game_state):
+        """
+        Returns the best move, as a UCI string, for the player whose
+        turn it is in the given GameState.
+        """
+        moves = self.get_moves(game_state)
+        if not moves:
+            raise TablebaseError('no moves for {}'.format(game_state.fen))
+        return next(iter(moves))
+
+    def _probe_after(self, child):
+        """
+        Returns the WDL and DTZ values of a move for the player who
+        made it, given the GameState the move leads to, and whether the
+        move gives checkmate.
+        """
+        if not any(True for _ in child.legal_moves()):
+            if child.in_check:
+                return 2, 1, True
+            return 0, 0, False
+        wdl, dtz = self._probe(child)
+        return -wdl, -dtz, False
+
+    def _probe(self, game_state):
+        """
+        Returns the WDL and DTZ values of the given GameState for the
+        player whose turn it is.
+        """
+        board = chess.Board(game_state.fen)
+        try:
+            return (self._tablebase.probe_wdl(board),
+                    self._tablebase.probe_dtz(board))
+        except KeyError as err:
+            # python-chess raises MissingTableError, a KeyError, both for
+            # missing tables and for positions with castling rights
+            raise TablebaseError(str(err)) from err
+
+    def close(self):
+        """Closes the memory-mapped table files."""
+        self._tablebase.close()
+
+
+def _rank(wdl, dtz, mate, zeroing):
+    """
+    Returns a sort key for a move with the given WDL and DTZ values,
+    where smaller is better. Mates come first, then wins, draws and
+    losses. Winning moves that reset the 50-move counter come before
+    other wins, then the quickest wins; the slowest losses come first.
+    """
+    if mate:
+        return (-3, 0, 0)
+    if wdl > 0:
+        return (-wdl, not zeroing, abs(dtz))
+    if wdl < 0:
+        return (-wdl, 0, -abs(dtz))
+    return (0, 0, 0)
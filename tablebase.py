@@ -0,0 +1,105 @@
+"""
+Client for the Syzygy tablebase API at https://syzygy-tables.info.
+
+The client owns a pooled `requests.Session`, so connections are kept
+alive and reused between turns, and it applies connect and read
+timeouts and retries with backoff on rate limiting and server errors.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+API_URL = 'https://syzygy-tables.info/api/v2'
+
+
+class TablebaseError(Exception):
+    """Raised when the tablebase API does not suggest a move."""
+    pass
+
+
+class TablebaseClient:
+    """Suggests moves for GameState objects by asking the tablebase API."""
+
+    # Responses that mean the request may succeed if tried again later.
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, url=API_URL, pool_size=10, connect_timeout=3.05,
+                 read_timeout=10, retries=3, backoff_factor=0.5):
+        """
+        Constructor for TablebaseClient class
+
+        Arguments:
+        url -- the URL of the API endpoint.
+        pool_size -- the most connections kept open to the API at once.
+        connect_timeout -- seconds to wait for a connection to be made.
+        read_timeout -- seconds to wait for the API to respond.
+        retries -- how many times a failed request is tried again.
+        backoff_factor -- retries wait backoff_factor * 2 ** (n - 1)
+        seconds before the nth retry, unless the API sends a
+        Retry-After header.
+        """
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(total=retries, connect=retries, read=retries,
+                      status=retries, backoff_factor=backoff_factor,
+                      status_forcelist=self.RETRY_STATUSES)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_moves(self, fen):
+        """
+        Returns the moves the API gives for the position with the given
+        FEN string, as an OrderedDict mapping UCI moves to their
+        details, best move first. Raises TablebaseError if the response
+        is not a JSON object.
+        """
+        response = self.session.get(self.url, params={'fen': fen},
+                                    timeout=self.timeout)
+        response.raise_for_status()
+        try:
+            json_dict = json.loads(response.text,
+                                   object_pairs_hook=OrderedDict)
+        except ValueError as err:
+            raise TablebaseError('invalid response for {}: {}'.format(
+                fen, err)) from err
+        if not isinstance(json_dict, dict):
+            raise TablebaseError('invalid response for {}'.format(fen))
+        return json_dict.get('moves') or OrderedDict()
+
+    def suggest_move(self, game_state):
+        """
+        Returns the best move, as a UCI string, for the player whose
+        turn it is in the given GameState.
+        """
+        moves = self.get_moves(game_state.fen)
+        if not moves:
+            raise TablebaseError('no moves for {}'.format(game_state.fen))
+        return next(iter(moves))
+
+    def close(self):
+        """Closes all pooled connections."""
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def default_client():
+    """
+    Returns the TablebaseClient shared by GameState objects that were
+    not given a move source of their own, creating it on first use.
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = TablebaseClient()
+        return _default_client
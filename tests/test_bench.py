@@ -0,0 +1,61 @@
+from unittest import TestCase, skipIf
+
+import bench
+import position_arrays
+
+
+class BenchTests(TestCase):
+    """Smoke tests for the benchmark harness."""
+
+    def setUp(self):
+        self.corpus = bench.load_corpus(['corpus/start.fen',
+                                         'corpus/kiwipete.fen'])
+
+    def test_every_benchmark_runs(self):
+        """Each benchmark should report its op count and rates."""
+        for name in bench.BENCHMARKS:
+            result = bench.run_benchmark(name, self.corpus, 1, 1)
+            self.assertGreater(result['ops'], 0, name)
+            self.assertGreater(result['ops_per_second'], 0, name)
+            self.assertIn('allocated_bytes_per_op', result)
+
+    def test_allocations(self):
+        """Strings built and thrown away should count as allocated."""
+        result = bench.run_benchmark('fen', self.corpus, 1, 1)
+        self.assertGreater(result['allocated_bytes_per_op'], 50)
+        self.assertGreaterEqual(result['peak_allocated_bytes'],
+                                result['allocated_bytes_per_op'])
+
+    def test_make_move_uses_every_legal_move(self):
+        """The move benchmark should make all 20 + 48 legal moves."""
+        result = bench.run_benchmark('_make_move', self.corpus, 1, 1)
+        self.assertEqual(result['ops'], 68)
+
+    def test_perft(self):
+        result = bench.run_perft_benchmark(1)
+        self.assertTrue(result['ok'])
+        self.assertEqual(len(result['positions']), 6)
+
+    def test_search(self):
+        result = bench.run_search_benchmark(self.corpus, 2)
+        self.assertEqual(len(result['positions']), 2)
+        self.assertGreater(result['nodes'], 0)
+        self.assertGreater(result['nodes_per_second'], 0)
+
+    def test_parallel_search(self):
+        result = bench.run_parallel_benchmark(self.corpus, 1, 2)
+        self.assertEqual([run['workers'] for run in result['runs']], [1, 2])
+        self.assertEqual(result['runs'][0]['speedup'], 1.0)
+
+    @skipIf(position_arrays.numpy is None, 'numpy is not installed')
+    def test_batch_evaluation(self):
+        result = bench.run_batch_benchmark(self.corpus, 2)
+        self.assertEqual(result['positions'], 4)
+        self.assertGreater(result['batch_positions_per_second'], 0)
+
+    def test_replay(self):
+        result = bench.run_replay_benchmark(['corpus/games.pgn'], 1)
+        self.assertGreater(result['plies'], 0)
+        self.assertGreater(result['plies_per_second'], 0)
+        self.assertGreater(result['fen_plies_per_second'], 0)
+        self.assertGreater(result['index_bytes_per_second'], 0)
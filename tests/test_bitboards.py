@@ -0,0 +1,65 @@
+import random
+from unittest import TestCase
+
+import bitboards
+from bitboards import (KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, WHITE,
+                       BLACK, rook_attacks, bishop_attacks, iter_squares)
+
+
+def _bits(*names):
+    """Returns a bitboard of the given square names, e.g. 'e4'."""
+    ret = 0
+    for name in names:
+        ret |= 1 << ((int(name[1]) - 1) * 8 + ord(name[0]) - ord('a'))
+    return ret
+
+
+class StepAttackTests(TestCase):
+    """Tests the precomputed knight, king and pawn attack tables."""
+
+    def test_knight_in_corner(self):
+        """A knight on a1 should only attack b3 and c2."""
+        self.assertEqual(KNIGHT_ATTACKS[0], _bits('b3', 'c2'))
+
+    def test_king_on_edge(self):
+        """A king on e1 should attack the five squares around it."""
+        self.assertEqual(KING_ATTACKS[4], _bits('d1', 'f1', 'd2', 'e2', 'f2'))
+
+    def test_pawns_do_not_wrap(self):
+        """Pawns on the a- and h-files should not attack across edges."""
+        self.assertEqual(PAWN_ATTACKS[WHITE][8], _bits('b3'))
+        self.assertEqual(PAWN_ATTACKS[BLACK][55], _bits('g6'))
+
+
+class SlidingAttackTests(TestCase):
+    """Tests kindergarten sliding attacks against a plain ray walk."""
+
+    def test_matches_ray_walk(self):
+        """
+        Rook and bishop attacks should match walking each ray, for
+        random occupancies.
+        """
+        rng = random.Random(0)
+        straight = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+        diagonal = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+        for _ in range(5000):
+            occupied = rng.getrandbits(64) & rng.getrandbits(64)
+            square = rng.randrange(64)
+            self.assertEqual(
+                rook_attacks(square, occupied),
+                bitboards._ray_attacks(square, occupied, straight))
+            self.assertEqual(
+                bishop_attacks(square, occupied),
+                bitboards._ray_attacks(square, occupied, diagonal))
+
+    def test_blocked_rook(self):
+        """A rook should stop at, and include, the first blocker."""
+        occupied = _bits('d4', 'd6', 'f4')
+        self.assertEqual(rook_attacks(27, occupied),
+                         _bits('d5', 'd6', 'd3', 'd2', 'd1', 'e4', 'f4',
+                               'c4', 'b4', 'a4'))
+
+    def test_iter_squares(self):
+        """Should yield set squares from lowest to highest."""
+        self.assertEqual(list(iter_squares(_bits('h8', 'a1', 'e4'))),
+                         [0, 28, 63])
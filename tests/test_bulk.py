@@ -0,0 +1,70 @@
+import io
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import bulk
+
+START = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+
+class StubSource:
+
+    def suggest_move(self, game_state):
+        return sorted(game_state.legal_moves())[0]
+
+
+class ProcessFileTests(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'positions.fen')
+        self.fens = ['4k3/8/8/8/8/8/{}/4K3 w - - 0 1'.format(row)
+                     for row in ['P7', '1P6', '2P5', '3P4', '5P2', '6P1']]
+        with open(self.path, 'w') as fen_file:
+            fen_file.write('\n'.join(self.fens[:3] + ['asdf'] + self.fens[3:]))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_file(self, operation, **kwargs):
+        output = io.StringIO()
+        errors = io.StringIO()
+        counts = bulk.process_file(operation, self.path, output, errors,
+                                   **kwargs)
+        return counts, output.getvalue(), errors.getvalue()
+
+    def test_normalize_keeps_order(self):
+        """Results from several workers should come out in input order."""
+        counts, output, errors = self.run_file('normalize', workers=2,
+                                               chunk_size=2)
+        self.assertEqual(counts, (7, 1))
+        self.assertEqual(output.splitlines(), self.fens)
+        self.assertEqual(errors, '{}:4: FEN invalid: asdf\n'.format(self.path))
+
+    def test_validate(self):
+        counts, output, errors = self.run_file('validate', workers=0)
+        self.assertEqual(counts, (7, 1))
+        self.assertEqual(output, '')
+
+    def test_show(self):
+        _, output, _ = self.run_file('show', workers=0, chunk_size=4)
+        self.assertEqual(output.count('\n8 | '), 6)
+
+    def test_move(self):
+        with patch('gamestate.default_client', return_value=StubSource()):
+            counts, output, _ = self.run_file('move', workers=0)
+        self.assertEqual(counts, (7, 1))
+        self.assertEqual(output.splitlines()[0],
+                         '4k3/8/8/8/8/P7/8/4K3 b - - 0 1')
+
+
+class MapInProcessesTests(TestCase):
+
+    def test_order(self):
+        arguments = [(number, 7) for number in range(50)]
+        expected = [divmod(number, 7) for number in range(50)]
+        for workers in [0, 2]:
+            self.assertEqual(list(bulk.map_in_processes(
+                divmod, iter(arguments), workers)), expected)
@@ -0,0 +1,98 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from cache import MoveCache
+from gamestate import GameState
+
+
+class FakeClock:
+    """A clock that only moves when told to."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class MoveCacheTests(TestCase):
+    """Tests cache.MoveCache"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'moves.sqlite')
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_hits_and_misses(self):
+        """Should return stored moves and count hits and misses."""
+        cache = MoveCache(self.path)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 'e2e4')
+        self.assertEqual(cache.get('a'), 'e2e4')
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'], 1)
+
+    def test_persists(self):
+        """Entries should still be there after reopening the file."""
+        cache = MoveCache(self.path)
+        cache.set('a', 'e2e4')
+        cache.close()
+        cache = MoveCache(self.path)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get('a'), 'e2e4')
+
+    def test_ttl(self):
+        """Entries older than the TTL should be treated as missing."""
+        cache = MoveCache(self.path, ttl=60, clock=self.clock)
+        cache.set('a', 'e2e4')
+        self.clock.now += 59
+        self.assertEqual(cache.get('a'), 'e2e4')
+        self.clock.now += 2
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats['expired'], 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        """The least recently used entry should be evicted first."""
+        cache = MoveCache(self.path, max_entries=2, clock=self.clock)
+        cache.set('a', 'a2a3')
+        self.clock.now += 1
+        cache.set('b', 'b2b3')
+        self.clock.now += 1
+        cache.get('a')
+        self.clock.now += 1
+        cache.set('c', 'c2c3')
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats['evicted'], 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'a2a3')
+        self.assertEqual(cache.get('c'), 'c2c3')
+
+
+class GameStateCacheTests(TestCase):
+    """Tests the move cache as used by GameState._get_suggested_move()"""
+
+    @patch.object(GameState, '_request_suggested_move', return_value='e2e4')
+    def test_asks_api_once_per_position(self, mocked):
+        """
+        Positions that differ only in their move clocks should share a
+        cache entry.
+        """
+        cache = MoveCache(':memory:')
+        GameState(move_cache=cache).take_turn()
+        g = GameState(move_cache=cache)
+        g.halfmove_clock = 7
+        g.take_turn()
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(g._get_piece('e', '4'), 'P')
+
+    def test_position_key(self):
+        """The position key should leave out the move clocks."""
+        self.assertEqual(GameState().position_key,
+                         'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq -')
@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+from evaluation import evaluate
+from gamestate import GameState
+
+
+class EvaluateTests(TestCase):
+    """Tests evaluation.evaluate()"""
+
+    def test_start_is_even(self):
+        self.assertEqual(evaluate(GameState()), 0)
+
+    def test_side_to_move(self):
+        """The score should be for the player whose turn it is."""
+        white = GameState.from_fen('4k3/8/8/8/8/8/8/3QK3 w - - 0 1')
+        black = GameState.from_fen('4k3/8/8/8/8/8/8/3QK3 b - - 0 1')
+        self.assertGreater(evaluate(white), 800)
+        self.assertEqual(evaluate(black), -evaluate(white))
+
+    def test_mirrored_positions(self):
+        """Swapping the colours and flipping the board negates the score."""
+        for fen, mirrored in [
+                ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/'
+                 'R3K2R w KQkq - 0 1',
+                 'r3k2r/pppbbppp/2n2q1P/1P2p3/3pn3/BN2PNP1/P1PPQPB1/'
+                 'R3K2R w KQkq - 0 1'),
+                ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+                 '8/4p1p1/8/1r3P1K/kp5R/3P4/2P5/8 w - - 0 1')]:
+            self.assertEqual(evaluate(GameState.from_fen(fen)),
+                             -evaluate(GameState.from_fen(mirrored)))
+
+    def test_centralised_knight(self):
+        centre = GameState.from_fen('4k3/8/8/8/3N4/8/8/4K3 w - - 0 1')
+        corner = GameState.from_fen('4k3/8/8/8/8/8/8/N3K3 w - - 0 1')
+        self.assertGreater(evaluate(centre), evaluate(corner))
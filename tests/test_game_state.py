@@ -1,8 +1,15 @@
+import copy
+import io
+import os
+import random
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch
 
 import gamestate
+import zobrist
 from gamestate import GameState, InvalidFENFileError
+from move import Move
 
 
 class InitTests(TestCase):
@@ -69,6 +76,58 @@ class ParseFenStrTests(TestCase):
         with self.assertRaises(InvalidFENFileError):
             g._parse_fen_str('asdf 32ds 0-=fe')
 
+    def test_invalid_reasons(self):
+        """
+        Each kind of mistake should raise InvalidFENFileError saying
+        what is wrong.
+        """
+        board = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR'
+        cases = [
+            (board + ' w KQkq - 0', 'expected 6 fields, found 5'),
+            (board + ' w KQkq - 0 1 extra', 'expected 6 fields, found 7'),
+            ('rnbqkbnr/pppppp3/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1',
+             'rank 7 has 9 squares'),
+            ('rnbqkbnr/ppppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1',
+             'rank 7 has more than 8 squares'),
+            ('rnbqkbnr/pppppppp/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1',
+             'board has 7 ranks'),
+            (board + '/8 w - - 0 1', 'board has more than 8 ranks'),
+            ('rnbqkbnr/pppppppp/8/8/44/8/PPPPPPPP/RNBQKBNR w - - 0 1',
+             'rank 4 has two digits in a row'),
+            ('rnbqkbnr/pppppppp/8/8/3X4/8/PPPPPPPP/RNBQKBNR w - - 0 1',
+             "invalid piece letter 'X'"),
+            (board + ' x KQkq - 0 1', "player must be 'w' or 'b'"),
+            (board + ' w KQkqK - 0 1', "invalid castling rights 'KQkqK'"),
+            (board + ' w qk - 0 1', "invalid castling rights 'qk'"),
+            (board + ' w - e3 0 1', "invalid en passant square 'e3'"),
+            (board + ' w - i6 0 1', "invalid en passant square 'i6'"),
+            (board + ' w - - -1 1', 'halfmove clock must be a number'),
+            (board + ' w - - 0 0', 'fullmove number must be a number of at '
+             'least 1'),
+        ]
+        for fen, reason in cases:
+            with self.subTest(fen=fen):
+                with self.assertRaisesRegex(InvalidFENFileError, reason):
+                    GameState()._parse_fen_str(fen)
+
+    def test_invalid_leaves_state(self):
+        """A string that fails to parse should not change the GameState."""
+        fen = '4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1'
+        g = GameState()
+        g._parse_fen_str(fen)
+        zobrist_hash = g.zobrist_hash
+        with self.assertRaises(InvalidFENFileError):
+            g._parse_fen_str('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR b '
+                             'KQkq - 0 x')
+        self.assertEqual(g.fen, fen)
+        self.assertEqual(g.zobrist_hash, zobrist_hash)
+
+    def test_en_passant_parsed(self):
+        g = GameState()
+        g._parse_fen_str('4k3/8/8/8/3Pp3/8/8/4K3 b - d3 0 1')
+        self.assertEqual(g.en_passant, ('d', '3'))
+        self.assertEqual(g.zobrist_hash, zobrist.compute_hash(g))
+
     def test_whites_turn(self):
         """
         Tests the parsing of the turn field in the FEN string when it is
@@ -207,6 +266,37 @@ class FenTests(TestCase):
         """Should correctly display a multi-digit fullmove number."""
         ...
 
+    def test_cached_ranks_follow_changes(self):
+        """
+        The cached FEN text of each rank should be dropped when a move,
+        `pop()` or a board write changes the rank.
+        """
+        g = GameState()
+        start = g.fen
+        g.push('e2e4')
+        self.assertEqual(
+            g.fen, 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1')
+        other = g.copy()
+        g.pop()
+        self.assertEqual(g.fen, start)
+        self.assertEqual(other.fen.split()[0],
+                         'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR')
+        g.board['a']['8'] = ' '
+        self.assertEqual(g.fen.split()[0],
+                         '1nbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR')
+        g.board = other.board
+        self.assertEqual(g.fen.split()[0], other.fen.split()[0])
+
+    def test_only_changed_ranks_rewritten(self):
+        g = GameState()
+        g.fen
+        with patch.object(GameState, '_row_to_fen',
+                          autospec=True, return_value='8') as row_to_fen:
+            g._make_move('g1f3')
+            g.fen
+        self.assertEqual(sorted(call[0][1] for call in
+                                row_to_fen.call_args_list), [0, 2])
+
 
 class BoardTextTests(TestCase):
     """Tests `board_text` property method of GameState."""
@@ -249,6 +339,19 @@ class BoardTextTests(TestCase):
 """.strip('\n')  # the outer newlines are only there to make this code readable
         self.assertEqual(g.board_text, expected)
 
+    def test_write_board_texts(self):
+        """
+        Writing many boards to a stream should give each board's text
+        followed by the separator.
+        """
+        states = [GameState(), GameState()]
+        states[1]._make_move('e2e4')
+        output = io.StringIO()
+        gamestate.write_board_texts(states, output, separator='\n%\n')
+        self.assertEqual(output.getvalue(),
+                         states[0].board_text + '\n%\n'
+                         + states[1].board_text + '\n%\n')
+
 
 class TakeTurnTests(TestCase):
     """Tests GameState.take_turn()"""
@@ -579,4 +682,488 @@ class MakeMoveTests(TestCase):
         game.player = 'w'
         game.fullmove_number = 3
         game._make_move('a2a3')
-        self.assertEqual(game.fullmove_number, 3)
\ No newline at end of file
+        self.assertEqual(game.fullmove_number, 3)
+
+
+class BoardTests(TestCase):
+    """Tests the `board` compatibility property of GameState."""
+
+    def test_writes_through_to_board(self):
+        """
+        Setting a square through the nested-dict view should update the
+        game state.
+        """
+        g = GameState()
+        g.board['e']['4'] = 'Q'
+        self.assertEqual(g._get_piece('e', '4'), 'Q')
+        self.assertEqual(g.fen.split()[0],
+                         'rnbqkbnr/pppppppp/8/8/4Q3/8/PPPPPPPP/RNBQKBNR')
+
+    def test_assign_partial_board(self):
+        """
+        Squares missing from an assigned board dict should be empty.
+        """
+        g = GameState()
+        g.board = {'e': {'1': 'K'}, 'a': {'8': 'k'}}
+        self.assertEqual(g.fen.split()[0], 'k7/8/8/8/8/8/8/4K3')
+
+    def test_assign_own_view(self):
+        """Assigning the view back, changed or not, should keep it."""
+        g = GameState()
+        g.board = g.board
+        self.assertEqual(g.fen, GameState().fen)
+        board = g.board
+        board['e']['4'] = 'P'
+        g.board = board
+        self.assertEqual(g.fen.split()[0],
+                         'rnbqkbnr/pppppppp/8/8/4P3/8/PPPPPPPP/RNBQKBNR')
+
+    def test_deepcopy_is_snapshot(self):
+        g = GameState()
+        snapshot = copy.deepcopy(g.board)
+        g.board['e']['2'] = GameState.EMPTY
+        self.assertEqual(snapshot['e']['2'], 'P')
+        self.assertIs(type(snapshot['e']), dict)
+
+    def test_row_order(self):
+        """Rows should iterate from '8' to '1', as ROWS lists them."""
+        self.assertEqual(list(GameState().board['a']), GameState.ROWS)
+        self.assertEqual(list(GameState().board), GameState.COLS)
+
+    def test_no_instance_dict(self):
+        """GameState should not carry a per-instance __dict__."""
+        self.assertFalse(hasattr(GameState(), '__dict__'))
+
+
+class AttackTests(TestCase):
+    """Tests the bitboards kept by GameState and the attack queries."""
+
+    def test_bitboards_follow_moves(self):
+        """Bitboards should stay in step with the board after a move."""
+        g = GameState()
+        g._make_move('e2e4')
+        white_pawns = g._pieces[0]
+        self.assertTrue(white_pawns & (1 << 28))
+        self.assertFalse(white_pawns & (1 << 12))
+        self.assertEqual(bin(g._occupied[0]).count('1'), 16)
+
+    def test_capture_clears_bitboard(self):
+        """A captured piece should be removed from its bitboard."""
+        g = GameState()
+        g._parse_fen_str('4k3/8/8/3p4/4P3/8/8/4K3 w - - 0 1')
+        g._make_move('e4d5')
+        self.assertEqual(g._pieces[6], 0)
+        self.assertEqual(g._occupied[1], 1 << 60)
+
+    def test_is_attacked(self):
+        """Should report squares attacked by the given player."""
+        g = GameState()
+        self.assertTrue(g.is_attacked('f', '3', 'w'))
+        self.assertFalse(g.is_attacked('e', '4', 'w'))
+        self.assertTrue(g.is_attacked('f', '6', 'b'))
+
+    def test_in_check(self):
+        """Should report whether the player to move is in check."""
+        g = GameState()
+        self.assertFalse(g.in_check)
+        g._parse_fen_str('4k3/8/8/8/8/8/8/4K2r w - - 0 1')
+        self.assertTrue(g.in_check)
+        g._parse_fen_str('4k3/8/8/8/8/8/4P3/r3K3 b - - 0 1')
+        self.assertFalse(g.in_check)
+
+
+class LegalMovesTests(TestCase):
+    """Tests GameState.legal_moves()"""
+
+    def _moves(self, fen):
+        g = GameState()
+        g._parse_fen_str(fen)
+        return set(g.legal_moves())
+
+    def test_start_position(self):
+        """There should be twenty moves from the starting position."""
+        moves = set(GameState().legal_moves())
+        self.assertEqual(len(moves), 20)
+        self.assertIn('e2e4', moves)
+        self.assertIn('g1f3', moves)
+
+    def test_pinned_piece(self):
+        """A pinned piece may only move along the pin."""
+        moves = self._moves('4k3/4r3/8/8/8/8/4R3/4K3 w - - 0 1')
+        self.assertEqual({m for m in moves if m.startswith('e2')},
+                         {'e2e3', 'e2e4', 'e2e5', 'e2e6', 'e2e7'})
+
+    def test_must_answer_check(self):
+        """When in check, only moves that end the check are legal."""
+        moves = self._moves('4k3/8/8/8/8/8/3PP3/r3K2R w K - 0 1')
+        self.assertEqual(moves, {'e1f2'})
+
+    def test_castling(self):
+        """Castling is legal only through unattacked, empty squares."""
+        moves = self._moves('4k3/8/8/8/8/8/8/R3K2R w KQ - 0 1')
+        self.assertIn('e1g1', moves)
+        self.assertIn('e1c1', moves)
+        moves = self._moves('4k3/8/8/8/8/8/5r2/R3K2R w KQ - 0 1')
+        self.assertNotIn('e1g1', moves)
+
+    def test_en_passant_and_promotion(self):
+        """En passant captures and all four promotions are generated."""
+        moves = self._moves('4k3/1P6/8/3pP3/8/8/8/4K3 w - d6 0 1')
+        self.assertIn('e5d6', moves)
+        self.assertTrue({'b7b8q', 'b7b8r', 'b7b8b', 'b7b8n'} <= moves)
+
+
+class SpecialMoveTests(TestCase):
+    """Tests GameState._make_move() on castling, en passant, promotion."""
+
+    def test_castling_moves_rook(self):
+        g = GameState()
+        g._parse_fen_str('r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1')
+        g._make_move('e8c8')
+        self.assertEqual(g.fen, '2kr3r/8/8/8/8/8/8/R3K2R w KQ - 1 2')
+
+    def test_en_passant_removes_pawn(self):
+        g = GameState()
+        g._parse_fen_str('4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1')
+        g._make_move('e5d6')
+        self.assertEqual(g.fen, '4k3/8/3P4/8/8/8/8/4K3 b - - 0 1')
+
+    def test_promotion(self):
+        g = GameState()
+        g._parse_fen_str('4k3/1P6/8/8/8/8/8/4K3 w - - 0 1')
+        g._make_move('b7b8n')
+        self.assertEqual(g.fen, '1N2k3/8/8/8/8/8/8/4K3 b - - 0 1')
+
+    def test_capturing_rook_ends_castling(self):
+        """Capturing a rook on its starting square removes the right."""
+        g = GameState()
+        g._parse_fen_str('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1')
+        g._make_move('h1h8')
+        self.assertEqual(g.fen, 'r3k2R/8/8/8/8/8/8/R3K3 b Qq - 0 1')
+
+    def test_black_special_moves(self):
+        """
+        Black's en passant captures, double pushes and promotions, with
+        the promotion letter in either case, should work like white's.
+        """
+        g = GameState()
+        g._parse_fen_str('4k3/8/8/8/3Pp3/8/6p1/4K2R b K d3 0 1')
+        g._make_move('e4d3')
+        self.assertEqual(g.fen, '4k3/8/8/8/8/3p4/6p1/4K2R w K - 0 2')
+        g._parse_fen_str('4k3/7p/8/8/8/8/6p1/4K2R b K - 0 1')
+        g._make_move('h7h5')
+        self.assertEqual(g.fen, '4k3/8/8/7p/8/8/6p1/4K2R w K h6 0 2')
+        g._parse_fen_str('4k3/7p/8/8/8/8/6p1/4K2R b K - 0 1')
+        g._make_move('g2h1Q')
+        self.assertEqual(g.fen, '4k3/7p/8/8/8/8/8/4K2q w - - 0 2')
+
+    def test_diagonal_capture_is_not_en_passant(self):
+        """A pawn capturing normally should not remove a second pawn."""
+        g = GameState()
+        g._parse_fen_str('4k3/8/3n4/3pP3/8/8/8/4K3 w - - 0 1')
+        g._make_move('e5d6')
+        self.assertEqual(g.fen, '4k3/8/3P4/3p4/8/8/8/4K3 b - - 0 1')
+
+    def test_hash_after_special_moves(self):
+        for fen, move in [
+                ('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1', 'e1g1'),
+                ('4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1', 'e5d6'),
+                ('4k3/8/8/8/8/8/6p1/4K2R b K - 0 1', 'g2h1q'),
+                ('4k3/8/8/8/8/8/4P3/4K3 w - - 0 1', 'e2e4')]:
+            g = GameState()
+            g._parse_fen_str(fen)
+            g._make_move(move)
+            self.assertEqual(g.zobrist_hash, zobrist.compute_hash(g))
+
+    def test_packed_moves(self):
+        """Packed moves should be made just as their UCI strings are."""
+        for fen in ['r3k2r/8/8/3pP3/8/8/8/R3K2R w KQkq d6 0 1',
+                    '3rk3/2P5/8/8/8/8/8/4K3 w - - 0 1',
+                    '4k3/8/8/8/4p3/8/3P2p1/4K2R w K - 0 1']:
+            g = GameState.from_fen(fen)
+            for move in g.legal_move_codes():
+                packed = g.copy()
+                packed._make_move(move)
+                uci = g.copy()
+                uci._make_move(Move(move).uci)
+                self.assertEqual(packed.fen, uci.fen)
+                self.assertEqual(packed.zobrist_hash, uci.zobrist_hash)
+
+
+class ZobristHashTests(TestCase):
+    """Tests the incrementally updated GameState.zobrist_hash"""
+
+    def test_matches_full_hash_during_random_games(self):
+        """
+        After every move of some random games, the incremental hash
+        should match one worked out from scratch.
+        """
+        rng = random.Random(1)
+        for fen in ['rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+                    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/'
+                    'R3K2R w KQkq - 0 1']:
+            g = GameState()
+            g._parse_fen_str(fen)
+            for _ in range(150):
+                moves = sorted(g.legal_moves())
+                if not moves:
+                    break
+                g._make_move(rng.choice(moves))
+                self.assertEqual(g.zobrist_hash, zobrist.compute_hash(g))
+
+    def test_transpositions_share_hash(self):
+        """
+        The same position reached by different moves should have the
+        same hash, even if the move clocks differ.
+        """
+        g = GameState()
+        start = g.zobrist_hash
+        for move in ['g1f3', 'g8f6', 'f3g1', 'f6g8']:
+            g._make_move(move)
+        self.assertEqual(g.zobrist_hash, start)
+        g._make_move('e2e4')
+        self.assertNotEqual(g.zobrist_hash, start)
+
+    def test_setting_fields_updates_hash(self):
+        """Setting fields directly should keep the hash correct."""
+        g = GameState()
+        g.player = 'b'
+        g.castle_white_queen = False
+        g.en_passant = ('e', '3')
+        g.board['a']['1'] = GameState.EMPTY
+        self.assertEqual(g.zobrist_hash, zobrist.compute_hash(g))
+        g._parse_fen_str(GameState().fen)
+        self.assertEqual(g.zobrist_hash, GameState().zobrist_hash)
+
+
+class PushPopTests(TestCase):
+    """Tests GameState.push() and GameState.pop()"""
+
+    def test_round_trip_random_games(self):
+        """
+        Popping every pushed move of long random games should give back
+        each earlier position exactly, including its hash.
+        """
+        rng = random.Random(7)
+        for fen in ['rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+                    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/'
+                    'R3K2R w KQkq - 0 1',
+                    'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/'
+                    'R2Q1RK1 w kq - 0 1'] * 5:
+            g = GameState()
+            g._parse_fen_str(fen)
+            history = []
+            for _ in range(200):
+                moves = sorted(g.legal_moves())
+                if not moves:
+                    break
+                history.append((g.fen, g.zobrist_hash))
+                g.push(rng.choice(moves))
+            while history:
+                g.pop()
+                self.assertEqual((g.fen, g.zobrist_hash), history.pop())
+
+    def test_pop_returns_move(self):
+        g = GameState()
+        g.push('e2e4')
+        self.assertEqual(g.pop(), 'e2e4')
+        move = Move.from_uci('e2e4')
+        g.push(move)
+        self.assertIs(g.pop(), move)
+
+    def test_special_moves(self):
+        """Castling, en passant and promotion should all be undone."""
+        for fen, move in [
+                ('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 3 9', 'e1c1'),
+                ('4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1', 'e5d6'),
+                ('3rk3/2P5/8/8/8/8/8/4K3 w - - 0 1', 'c7d8q')]:
+            g = GameState()
+            g._parse_fen_str(fen)
+            g.push(move)
+            self.assertNotEqual(g.fen, fen)
+            g.pop()
+            self.assertEqual(g.fen, fen)
+
+
+class ApplyMovesTests(TestCase):
+    """Tests GameState.apply_moves()"""
+
+    def test_positions_yielded(self):
+        g = GameState()
+        moves = ['e2e4', Move.from_uci('c7c5'), 'g1f3']
+        fens = [position.fen for position in g.apply_moves(moves)]
+        self.assertEqual(fens, [
+            'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1',
+            'rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2',
+            'rnbqkbnr/pp1ppppp/8/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2'])
+
+    def test_same_game_state(self):
+        g = GameState()
+        for position in g.apply_moves(['e2e4', 'e7e5']):
+            self.assertIs(position, g)
+
+    def test_lazy(self):
+        """No move should be made before its position is asked for."""
+        g = GameState()
+        positions = g.apply_moves(['e2e4', 'e7e5'])
+        self.assertEqual(g.fen, GameState().fen)
+        next(positions)
+        self.assertEqual(g.player, 'b')
+
+    @patch.object(GameState, '_request_suggested_move')
+    def test_no_move_source(self, request):
+        g = GameState()
+        list(g.apply_moves(['e2e4', 'e7e5', 'e1e2']))
+        request.assert_not_called()
+
+
+class IterFileTests(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'positions.epd')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, *lines):
+        with open(self.path, 'w') as fen_file:
+            fen_file.write('\n'.join(lines) + '\n')
+
+    def test_yields_states(self):
+        start = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+        other = '4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 12'
+        self.write(start, '', other)
+        states = list(GameState.iter_file(self.path))
+        self.assertEqual([g.fen for g in states], [start, other])
+
+    def test_epd(self):
+        self.write('4k3/8/8/8/8/8/4P3/4K3 w - - bm e4; id "test";',
+                   '4k3/8/8/8/8/8/4P3/4K3 b - -')
+        fens = [g.fen for g in GameState.iter_file(self.path)]
+        self.assertEqual(fens, ['4k3/8/8/8/8/8/4P3/4K3 w - - 0 1',
+                                '4k3/8/8/8/8/8/4P3/4K3 b - - 0 1'])
+
+    def test_bad_lines_reported(self):
+        start = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+        self.write(start, 'asdf', start, '4k3/8/8/8/8/8/8/4K3 w')
+        errors = []
+        states = list(GameState.iter_file(
+            self.path, on_error=lambda *args: errors.append(args)))
+        self.assertEqual(len(states), 2)
+        self.assertEqual([(n, line) for n, line, _ in errors],
+                         [(2, 'asdf'), (4, '4k3/8/8/8/8/8/8/4K3 w')])
+
+    def test_bad_clocks_reported(self):
+        """Only EPD records, not broken FEN strings, get new clocks."""
+        self.write('4k3/8/8/8/8/8/8/4K3 w - - 0',
+                   '4k3/8/8/8/8/8/8/4K3 w - - x y',
+                   '4k3/8/8/8/8/8/8/4K3 w - - 0 1 2',
+                   '4k3/8/8/8/8/8/8/4K3 w - - noop; c0 "a; b";')
+        errors = []
+        states = list(GameState.iter_file(
+            self.path, on_error=lambda *args: errors.append(args)))
+        self.assertEqual([n for n, _, _ in errors], [1, 2, 3])
+        self.assertEqual([g.fen for g in states],
+                         ['4k3/8/8/8/8/8/8/4K3 w - - 0 1'])
+        with self.assertRaises(InvalidFENFileError):
+            GameState.from_fen('4k3/8/8/8/8/8/8/4K3 w - - 0')
+
+    def test_bad_lines_warn(self):
+        self.write('asdf')
+        with self.assertWarnsRegex(UserWarning, ':1: invalid FEN'):
+            self.assertEqual(list(GameState.iter_file(self.path)), [])
+
+    def test_lazy(self):
+        """The file should only be read as states are asked for."""
+        self.write('4k3/8/8/8/8/8/8/4K3 w - - 0 1', 'asdf')
+        states = GameState.iter_file(
+            self.path, on_error=lambda *args: self.fail('read too far'))
+        self.assertEqual(next(states).fen, '4k3/8/8/8/8/8/8/4K3 w - - 0 1')
+
+    def test_move_source(self):
+        source = object()
+        self.write('4k3/8/8/8/8/8/8/4K3 w - - 0 1')
+        g, = GameState.iter_file(self.path, move_source=source)
+        self.assertIs(g.move_source, source)
+        self.assertIsNone(g.move_cache)
+
+
+class BinaryRecordTests(TestCase):
+    """Tests `GameState.to_bytes()` and `GameState.from_bytes()`."""
+
+    FENS = ['rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+            'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/'
+            'R3K2R w Kq - 17 250',
+            'rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3',
+            '4k3/8/8/8/3Pp3/8/8/4K3 b - d3 0 1',
+            '8/8/8/8/8/8/8/K6k b - - 65535 65535']
+
+    def test_round_trip(self):
+        for fen in self.FENS:
+            g = GameState()
+            g._parse_fen_str(fen)
+            record = g.to_bytes()
+            self.assertEqual(len(record), gamestate.RECORD_SIZE)
+            self.assertEqual(len(record), 32)
+            other = GameState.from_bytes(record)
+            self.assertEqual(other.fen, fen)
+            self.assertEqual(other.zobrist_hash, g.zobrist_hash)
+            self.assertEqual(other._pieces, g._pieces)
+            self.assertEqual(other._occupied, g._occupied)
+
+    def test_random_games(self):
+        rng = random.Random(11)
+        g = GameState()
+        for _ in range(300):
+            moves = sorted(g.legal_moves())
+            if not moves:
+                break
+            g._make_move(rng.choice(moves))
+            other = GameState.from_bytes(g.to_bytes())
+            self.assertEqual(other.fen, g.fen)
+            self.assertEqual(other.zobrist_hash, zobrist.compute_hash(g))
+
+    def test_offset_in_memoryview(self):
+        """Records should be read in place from a larger buffer."""
+        states = []
+        for fen in self.FENS:
+            g = GameState()
+            g._parse_fen_str(fen)
+            states.append(g)
+        view = memoryview(b''.join(g.to_bytes() for g in states))
+        for index, g in enumerate(states):
+            other = GameState.from_bytes(view, index * gamestate.RECORD_SIZE)
+            self.assertEqual(other.fen, g.fen)
+
+    def test_too_much_to_pack(self):
+        g = GameState()
+        g.halfmove_clock = 65536
+        with self.assertRaises(ValueError):
+            g.to_bytes()
+        g = GameState()
+        g._parse_fen_str('8/8/PPPPPPPP/4k3/4K3/pppppppp/PPPPPPPP/pppppppp '
+                         'w - - 0 1')
+        with self.assertRaisesRegex(ValueError, '32 pieces'):
+            g.to_bytes()
+
+    def test_invalid_record(self):
+        record = bytearray(GameState().to_bytes())
+        record[24] = 0x20
+        with self.assertRaisesRegex(ValueError, 'invalid flags'):
+            GameState.from_bytes(record)
+        record = bytearray(GameState().to_bytes())
+        record[8] = 0xFF
+        with self.assertRaisesRegex(ValueError, 'invalid piece index'):
+            GameState.from_bytes(record)
+        record = bytearray(GameState().to_bytes())
+        record[25] = 20
+        with self.assertRaisesRegex(ValueError, 'invalid en passant'):
+            GameState.from_bytes(record)
+        record[25] = 64
+        with self.assertRaisesRegex(ValueError, 'invalid en passant'):
+            GameState.from_bytes(record)
+        record = bytearray(GameState().to_bytes())
+        record[28] = 0
+        with self.assertRaisesRegex(ValueError, 'invalid fullmove number'):
+            GameState.from_bytes(record)
\ No newline at end of file
@@ -0,0 +1,120 @@
+from unittest import TestCase
+
+from gamestate import GameState
+from move import (Move, NORMAL, PROMOTION, EN_PASSANT, CASTLING, pack,
+                  to_uci, from_uci)
+
+KIWIPETE = ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/'
+            'R3K2R w KQkq - 0 1')
+
+
+class MoveTests(TestCase):
+    """Tests move.Move and the UCI conversions"""
+
+    def test_uci_round_trip(self):
+        for uci in ['e2e4', 'a1h8', 'h7h8q', 'b2a1n', 'e1g1', 'g7g8r']:
+            move = Move.from_uci(uci)
+            self.assertEqual(move.uci, uci)
+            self.assertEqual(str(move), uci)
+            self.assertEqual(to_uci(from_uci(uci)), uci)
+
+    def test_fields(self):
+        move = Move.from_uci('b7a8R')
+        self.assertEqual(move.from_square, 49)
+        self.assertEqual(move.to_square, 56)
+        self.assertEqual(move.kind, PROMOTION)
+        self.assertEqual(move.promotion, 'r')
+        self.assertEqual(move, pack(49, 56, PROMOTION, 2))
+        self.assertLess(move, 1 << 16)
+        self.assertEqual(Move.from_uci('e2e4').promotion, '')
+        self.assertEqual(repr(Move.from_uci('e2e4')), "Move('e2e4')")
+
+    def test_kind_from_game_state(self):
+        """With a GameState, castling and en passant should be marked."""
+        g = GameState.from_fen('r3k2r/8/8/3pP3/8/8/8/R3K2R w KQkq d6 0 1')
+        self.assertEqual(Move.from_uci('e1g1', g).kind, CASTLING)
+        self.assertEqual(Move.from_uci('e1c1', g).kind, CASTLING)
+        self.assertEqual(Move.from_uci('e5d6', g).kind, EN_PASSANT)
+        self.assertEqual(Move.from_uci('e5e6', g).kind, NORMAL)
+        self.assertEqual(Move.from_uci('e1f1', g).kind, NORMAL)
+        self.assertEqual(Move.from_uci('e1g1').kind, NORMAL)
+
+    def test_generated_moves_match_uci(self):
+        g = GameState.from_fen(KIWIPETE)
+        codes = g.legal_move_codes()
+        self.assertEqual(sorted(to_uci(move) for move in codes),
+                         sorted(g.legal_moves()))
+        for move in codes:
+            self.assertEqual(from_uci(to_uci(move), g), move)
+
+    def test_invalid_uci(self):
+        for uci in ['', 'e2', 'e2e9', 'i2e4', 'e7e8k', 'e7e8qq']:
+            with self.assertRaises(ValueError):
+                from_uci(uci)
+
+
+class SANTests(TestCase):
+    """Tests Move.san() and Move.from_san()"""
+
+    def assertSAN(self, fen, uci, san):
+        g = GameState.from_fen(fen)
+        move = Move.from_uci(uci, g)
+        self.assertEqual(move.san(g), san)
+        self.assertEqual(Move.from_san(san, g), move)
+        self.assertEqual(g.fen, fen)
+
+    def test_pieces_and_pawns(self):
+        start = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+        self.assertSAN(start, 'e2e4', 'e4')
+        self.assertSAN(start, 'g1f3', 'Nf3')
+        self.assertSAN(KIWIPETE, 'e5f7', 'Nxf7')
+        self.assertSAN(KIWIPETE, 'd5e6', 'dxe6')
+
+    def test_disambiguation(self):
+        self.assertSAN('4k3/8/8/8/8/5N2/8/1N2K3 w - - 0 1', 'b1d2', 'Nbd2')
+        self.assertSAN('4k3/8/8/R7/8/8/8/R3K3 w - - 0 1', 'a1a3', 'R1a3')
+        self.assertSAN('4k3/8/8/8/8/Q7/8/Q1Q1K3 w - - 0 1', 'a1b2', 'Qa1b2')
+
+    def test_special_moves(self):
+        self.assertSAN(KIWIPETE, 'e1g1', 'O-O')
+        self.assertSAN(KIWIPETE, 'e1c1', 'O-O-O')
+        self.assertSAN('4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1', 'e5d6', 'exd6')
+        self.assertSAN('2r1k3/1P6/8/8/8/8/8/4K3 w - - 0 1', 'b7c8n', 'bxc8=N')
+
+    def test_check_and_mate(self):
+        self.assertSAN('4k3/8/8/8/8/8/8/R3K3 w - - 0 1', 'a1a8', 'Ra8+')
+        self.assertSAN('4k3/R7/8/8/8/8/8/1R2K3 w - - 0 1', 'b1b8', 'Rb8#')
+
+    def test_other_spellings(self):
+        g = GameState.from_fen(KIWIPETE)
+        self.assertEqual(Move.from_san('0-0', g), Move.from_uci('e1g1', g))
+        self.assertEqual(Move.from_san('Nxf7!?', g), Move.from_uci('e5f7'))
+        g = GameState.from_fen('4k3/1P6/8/8/8/8/8/4K3 w - - 0 1')
+        self.assertEqual(Move.from_san('b8Q+', g), Move.from_uci('b7b8q'))
+
+    def test_errors(self):
+        """SAN that matches no legal move, or several, is rejected."""
+        g = GameState.from_fen('4k3/8/8/8/8/5N2/8/1N2K3 w - - 0 1')
+        for san in ['Nd2', 'e4', 'Kf3', 'Nh9', 'b8=K', '', 'O-O']:
+            with self.assertRaises(ValueError):
+                Move.from_san(san, g)
+
+    def test_pawn_files(self):
+        """A pawn capture must give its file, and a push must not."""
+        g = GameState.from_fen('4k3/8/8/4p3/3PP3/8/8/4K3 w - - 0 1')
+        self.assertEqual(Move.from_san('dxe5', g), Move.from_uci('d4e5'))
+        self.assertEqual(Move.from_san('d5', g), Move.from_uci('d4d5'))
+        for san in ['e5', 'xe5', 'dd5', 'dxd5', 'd4d5']:
+            with self.assertRaises(ValueError):
+                Move.from_san(san, g)
+
+    def test_pinned_pieces(self):
+        """A pinned piece should not make the SAN ambiguous or legal."""
+        g = GameState.from_fen('k3r3/8/8/8/2N1N3/8/8/4K3 w - - 0 1')
+        self.assertEqual(Move.from_san('Nd2', g), Move.from_uci('c4d2'))
+        g = GameState.from_fen('k7/8/8/KPp4r/8/8/8/8 w - c6 0 2')
+        with self.assertRaises(ValueError):
+            Move.from_san('bxc6', g)
+        g = GameState.from_fen('k3r3/8/8/8/8/8/8/4K3 w - - 0 1')
+        with self.assertRaises(ValueError):
+            Move.from_san('Ke2', g)
@@ -0,0 +1,127 @@
+from multiprocessing import shared_memory
+from unittest import TestCase
+
+from gamestate import GameState
+from parallel_search import ParallelSearchMoveSource, _combine
+from search import SearchMoveSource, MATE, MATE_BOUND
+from tablebase import TablebaseError
+from transposition import TranspositionTable
+
+KIWIPETE = ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/'
+            'R3K2R w KQkq - 0 1')
+
+
+class ParallelSearchMoveSourceTests(TestCase):
+    """Tests parallel_search.ParallelSearchMoveSource"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.source = ParallelSearchMoveSource(workers=2, time_limit=None,
+                                              max_depth=3,
+                                              table_bytes=1 << 20)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.source.close()
+
+    def test_mate_in_one(self):
+        result = self.source.search(
+            GameState.from_fen('6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1'))
+        self.assertEqual(result.move.uci, 'a1a8')
+        self.assertGreater(result.score, MATE_BOUND)
+
+    def test_mate_stops_workers(self):
+        """
+        Finding a mate in one should stop the worker searching the other
+        moves, instead of letting it run until the deadline.
+        """
+        source = ParallelSearchMoveSource(workers=2, time_limit=10,
+                                          table_bytes=1 << 20)
+        try:
+            result = source.search(
+                GameState.from_fen('6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1'))
+        finally:
+            source.close()
+        self.assertEqual(result.move.uci, 'a1a8')
+        self.assertLess(result.seconds, 2.0)
+
+    def test_wins_material(self):
+        result = self.source.search(
+            GameState.from_fen('4k3/8/8/3q4/8/8/3R4/3K4 w - - 0 1'))
+        self.assertEqual(result.move.uci, 'd2d5')
+
+    def test_same_score_as_single_process(self):
+        """Splitting the root moves should not change the answer's score."""
+        g = GameState.from_fen(KIWIPETE)
+        single = SearchMoveSource(max_depth=3, time_limit=None,
+                                  table=TranspositionTable(1 << 20))
+        expected = single.search(g)
+        result = self.source.search(g)
+        self.assertEqual(result.depth, 3)
+        self.assertEqual(result.score, expected.score)
+        self.assertEqual(g.fen, KIWIPETE)
+
+    def test_table_shared(self):
+        """The workers' results should be in the parent's table."""
+        g = GameState.from_fen(KIWIPETE)
+        self.source.search(g)
+        child = g.copy()
+        child._make_move(next(iter(g.legal_moves())))
+        self.assertIsNotNone(self.source.table.probe(child.zobrist_hash))
+
+    def test_no_moves(self):
+        with self.assertRaises(TablebaseError):
+            self.source.search(
+                GameState.from_fen('R5k1/5ppp/8/8/8/8/8/6K1 b - - 0 1'))
+
+    def test_time_limit(self):
+        source = ParallelSearchMoveSource(workers=2, time_limit=0.3,
+                                          table_bytes=1 << 20)
+        try:
+            result = source.search(GameState.from_fen(KIWIPETE))
+        finally:
+            source.close()
+        self.assertLess(result.seconds, 2.0)
+        self.assertIn(result.move.uci,
+                      set(GameState.from_fen(KIWIPETE).legal_moves()))
+
+    def test_in_process(self):
+        source = ParallelSearchMoveSource(workers=0, time_limit=None,
+                                          max_depth=2, table_bytes=1 << 20)
+        try:
+            self.assertEqual(source.suggest_move(GameState.from_fen(
+                '6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1')), 'a1a8')
+        finally:
+            source.close()
+
+    def test_close_frees_memory(self):
+        source = ParallelSearchMoveSource(workers=0, table_bytes=1 << 16)
+        name = source._memory.name
+        source.close()
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name)
+
+
+class CombineTests(TestCase):
+    """Tests parallel_search._combine()"""
+
+    def test_deepest_common_depth(self):
+        iterations = [[(1, 10, 100), (2, 5, 100), (3, 40, 101)],
+                      [(1, 20, 200), (2, 30, 200)]]
+        self.assertEqual(_combine(iterations, [[100], [200]]), (2, 30, 200))
+
+    def test_mate_taken(self):
+        iterations = [[(1, 10, 100), (2, 5, 100), (3, 40, 101)],
+                      [(1, MATE - 1, 200)]]
+        self.assertEqual(_combine(iterations, [[100], [200]]),
+                         (1, MATE - 1, 200))
+
+    def test_mated_worker_does_not_limit_depth(self):
+        iterations = [[(1, 10, 100), (2, 5, 100), (3, 40, 101)],
+                      [(1, 1 - MATE, 200)]]
+        self.assertEqual(_combine(iterations, [[100], [200]]), (3, 40, 101))
+
+    def test_unfinished_worker(self):
+        iterations = [[], [(1, 20, 200)]]
+        self.assertEqual(_combine(iterations, [[100], [200]]), (1, 20, 200))
+        self.assertEqual(_combine([[]], [[100]]), (0, -MATE_BOUND, 100))
@@ -0,0 +1,48 @@
+from unittest import TestCase
+
+from gamestate import GameState
+from perft import PERFT_POSITIONS, perft, divide
+
+
+class PerftTests(TestCase):
+    """
+    Checks legal move generation and move application against the
+    published perft counts. Deeper runs are left to `python perft.py`.
+    """
+
+    def _check(self, name, depth):
+        for position_name, fen, counts in PERFT_POSITIONS:
+            if position_name == name:
+                g = GameState()
+                g._parse_fen_str(fen)
+                self.assertEqual(perft(g, depth), counts[depth - 1])
+                return
+        self.fail('no perft position named {}'.format(name))
+
+    def test_start(self):
+        self._check('start', 3)
+
+    def test_kiwipete(self):
+        """Castling, pins and en passant in the middle game."""
+        self._check('kiwipete', 2)
+
+    def test_position_3(self):
+        """En passant captures that uncover a check along the rank."""
+        self._check('position 3', 4)
+
+    def test_position_4(self):
+        """Promotions, including capturing promotions, under check."""
+        self._check('position 4', 3)
+
+    def test_position_5(self):
+        self._check('position 5', 2)
+
+    def test_position_6(self):
+        self._check('position 6', 2)
+
+    def test_divide_sums_to_perft(self):
+        """The per-move counts from divide should add up to perft."""
+        g = GameState()
+        counts = divide(g, 2)
+        self.assertEqual(len(counts), 20)
+        self.assertEqual(sum(counts.values()), 400)
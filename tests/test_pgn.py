@@ -0,0 +1,276 @@
+import io
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from gamestate import GameState
+from pgn import (InvalidPGNError, Game, PGNFile, iter_games, index_games,
+                 parse_movetext, start_position, replay, iter_positions,
+                 process_range, iter_results, game_fens, write_positions)
+
+OPERA_GAME = '''[Event "Paris"]
+[White "Morphy, Paul"]
+[Black "Duke Karl / Count Isouard"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 d6 3. d4 Bg4 {This is a weak move already.} 4. dxe5 Bxf3 5.
+Qxf3 dxe5 6. Bc4 Nf6 7. Qb3 Qe7 8. Nc3 c6 9. Bg5 b5 10. Nxb5 cxb5 11. Bxb5+
+Nbd7 12. O-O-O Rd8 13. Rxd7 Rxd7 (13... Nxd7 14. Rd1) 14. Rd1 Qe6 15. Bxd7+
+Nxd7 16. Qb8+ Nxb8 17. Rd8# 1-0
+'''
+# A comment that wraps onto a line starting with '[', as clock
+# annotations often do.
+WRAPPED_COMMENT = ('[Event "One"]\n\n1. e4 {a comment that wraps\n'
+                   '[%clk 0:01:00] here} e5 2. Nf3 1-0\n\n'
+                   '[Event "Two"]\n\n1. d4 *\n')
+OPERA_GAME_END = '1n1Rkb1r/p4ppp/4q3/4p1B1/4P3/8/PPP2PPP/2K5 b k - 1 17'
+CORPUS_PGN = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, 'corpus', 'games.pgn')
+
+
+class PGNFileTestCase(TestCase):
+    """Writes PGN text to a temporary file for the tests to read."""
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, text):
+        path = os.path.join(self.directory.name, 'games.pgn')
+        with open(path, 'w') as pgn_file:
+            pgn_file.write(text)
+        return path
+
+
+class IterGamesTests(PGNFileTestCase):
+    """Tests pgn.iter_games()"""
+
+    def test_games(self):
+        path = self.write(OPERA_GAME + '\n' + '[Event "Two"]\n'
+                          '[Annotator "A \\"quoted\\" name"]\n\n1. d4 *\n')
+        games = list(iter_games(path))
+        self.assertEqual(len(games), 2)
+        tags, movetext = games[0]
+        self.assertEqual(tags['White'], 'Morphy, Paul')
+        self.assertTrue(movetext.startswith('1. e4 e5'))
+        self.assertTrue(movetext.rstrip().endswith('17. Rd8# 1-0'))
+        tags, movetext = games[1]
+        self.assertEqual(tags, {'Event': 'Two',
+                                'Annotator': 'A "quoted" name'})
+        self.assertEqual(movetext.strip(), '1. d4 *')
+
+    def test_games_without_blank_lines(self):
+        path = self.write('[Event "One"]\n1. e4 *\n[Event "Two"]\n1. d4 *')
+        self.assertEqual([movetext.strip() for _, movetext in
+                          iter_games(path)], ['1. e4 *', '1. d4 *'])
+
+    def test_comment_line_not_tags(self):
+        games = list(iter_games(self.write(WRAPPED_COMMENT)))
+        self.assertEqual(len(games), 2)
+        self.assertEqual(parse_movetext(games[0][1]), ['e4', 'e5', 'Nf3'])
+        self.assertEqual(games[1], ({'Event': 'Two'}, '1. d4 *\n'))
+        # a closed comment does not hide the next game's tags
+        path = self.write('1. e4 {done} e5 *\n[Event "Two"]\n1. d4 *\n')
+        self.assertEqual(len(list(iter_games(path))), 2)
+
+    def test_empty_file(self):
+        self.assertEqual(list(iter_games(self.write(''))), [])
+
+
+class ParseMovetextTests(TestCase):
+    """Tests pgn.parse_movetext()"""
+
+    def test_moves_only(self):
+        movetext = ('1. e4 {best by test} e5 $1 2.Nf3 (2. f4 exf4 (2... d5))'
+                    ' 2... Nc6 ; a comment\n3. Bb5 a6 1/2-1/2')
+        self.assertEqual(parse_movetext(movetext),
+                         ['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6'])
+
+    def test_castling_is_not_a_result(self):
+        self.assertEqual(parse_movetext('10. 0-0 0-0-0 0-1'),
+                         ['0-0', '0-0-0'])
+
+
+class ReplayTests(TestCase):
+    """Tests pgn.replay() and pgn.start_position()"""
+
+    def test_opera_game(self):
+        _, movetext = OPERA_GAME.split('\n\n', 1)
+        fens = [game_state.fen for game_state in replay(movetext)]
+        self.assertEqual(len(fens), 33)
+        self.assertEqual(fens[0], 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/'
+                                  'RNBQKBNR b KQkq e3 0 1')
+        self.assertEqual(fens[-1], OPERA_GAME_END)
+
+    def test_start_position(self):
+        self.assertEqual(start_position({}).fen, GameState().fen)
+        fen = '4k3/8/8/8/8/8/4P3/4K3 w - - 0 1'
+        g = start_position({'SetUp': '1', 'FEN': fen})
+        self.assertEqual(g.fen, fen)
+        self.assertEqual([position.fen for position in replay('1. e4', g)],
+                         ['4k3/8/8/8/4P3/8/8/4K3 b - e3 0 1'])
+        with self.assertRaises(InvalidPGNError):
+            start_position({'FEN': 'not a fen'})
+
+    def test_illegal_move(self):
+        """The positions before a bad move should still be yielded."""
+        fens = []
+        with self.assertRaises(InvalidPGNError) as context:
+            for game_state in replay('1. e4 e5 2. Ke3 *'):
+                fens.append(game_state.fen)
+        self.assertEqual(len(fens), 2)
+        self.assertIn('ply 3', str(context.exception))
+
+
+class IterPositionsTests(PGNFileTestCase):
+    """Tests pgn.iter_positions() and pgn.write_positions()"""
+
+    def test_errors_reported(self):
+        path = self.write('[Event "Bad"]\n\n1. e4 Nf6 2. Qh6 *\n\n'
+                          + OPERA_GAME)
+        errors = []
+        positions = list(iter_positions(
+            path, on_error=lambda *args: errors.append(args)))
+        self.assertEqual([number for number, _ in positions],
+                         [1, 1] + [2] * 33)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0][0], 1)
+        with self.assertRaises(InvalidPGNError):
+            list(iter_positions(path))
+
+    def test_write_positions(self):
+        path = self.write(OPERA_GAME + '\n' + OPERA_GAME)
+        output = io.StringIO()
+        self.assertEqual(write_positions(path, output, io.StringIO(),
+                                         workers=0), (66, 0))
+        games = output.getvalue().split('\n\n')
+        self.assertEqual(len(games), 2)
+        self.assertEqual(games[1].splitlines()[-1], OPERA_GAME_END)
+
+    def test_corpus(self):
+        """Every game in the benchmark corpus should replay."""
+        self.assertEqual(sum(1 for _ in iter_positions(CORPUS_PGN)), 1745)
+
+
+def _white(game):
+    """Returns the White tag of a game, for the worker processes."""
+    if game.tags.get('White') == 'Bad':
+        raise InvalidPGNError('bad game')
+    return game.tags.get('White')
+
+
+class IndexGamesTests(TestCase):
+    """Tests pgn.index_games()"""
+
+    def test_offsets(self):
+        data = (b'[Event "One"]\n\n[Site "?"]\n\n1. e4 *\n\n'
+                b'[Event "Two"]\n1. d4 *\n')
+        self.assertEqual(list(index_games(data)),
+                         [0, data.index(b'[Event "Two"]')])
+
+    def test_moves_without_tags(self):
+        self.assertEqual(list(index_games(b'\n1. e4 *\n\n[Event "Two"]\n')),
+                         [0, 10])
+        self.assertEqual(list(index_games(b'1. e4 *')), [0])
+
+    def test_comment_line_not_tags(self):
+        data = WRAPPED_COMMENT.encode()
+        self.assertEqual(list(index_games(data)),
+                         [0, data.index(b'[Event "Two"]')])
+
+    def test_empty(self):
+        self.assertEqual(list(index_games(b'')), [])
+        self.assertEqual(list(index_games(b'\n\n')), [])
+
+
+class PGNFileTests(PGNFileTestCase):
+    """Tests pgn.PGNFile and pgn.Game"""
+
+    def open(self, text):
+        pgn_file = PGNFile(self.write(text))
+        self.addCleanup(pgn_file.close)
+        return pgn_file
+
+    def test_games(self):
+        pgn_file = self.open('[White "A"]\n\n1. e4 *\n\n' + OPERA_GAME
+                             + '\n[White "C"]\n\n1. d4 d5 *\n')
+        self.assertEqual(len(pgn_file), 3)
+        self.assertEqual([game.tags['White'] for game in pgn_file],
+                         ['A', 'Morphy, Paul', 'C'])
+        self.assertEqual(pgn_file[-1].number, 3)
+        self.assertEqual([game.number for game in pgn_file[1:]], [2, 3])
+        with self.assertRaises(IndexError):
+            pgn_file[3]
+
+    def test_lazy(self):
+        """Reading the tags should not parse the movetext."""
+        game = self.open(OPERA_GAME)[0]
+        self.assertEqual(game.tags['Result'], '1-0')
+        self.assertIsNone(game._movetext)
+        self.assertEqual(len(game.moves), 33)
+        self.assertEqual(list(game.positions())[-1].fen, OPERA_GAME_END)
+
+    def test_same_as_iter_games(self):
+        path = CORPUS_PGN
+        pgn_file = PGNFile(path)
+        self.addCleanup(pgn_file.close)
+        self.assertEqual([(game.tags, game.moves) for game in pgn_file],
+                         [(tags, parse_movetext(movetext))
+                          for tags, movetext in iter_games(path)])
+
+    def test_offsets_reused(self):
+        path = self.write(OPERA_GAME + '\n' + OPERA_GAME)
+        first = PGNFile(path)
+        self.addCleanup(first.close)
+        second = PGNFile(path, first.offsets)
+        self.addCleanup(second.close)
+        self.assertEqual(list(second.offsets), list(first.offsets))
+        self.assertEqual(second[1].moves, first[1].moves)
+
+    def test_comment_line_not_tags(self):
+        pgn_file = self.open(WRAPPED_COMMENT)
+        self.assertEqual(len(pgn_file), 2)
+        self.assertEqual(pgn_file[0].moves, ['e4', 'e5', 'Nf3'])
+        self.assertEqual(pgn_file[1].tags, {'Event': 'Two'})
+
+    def test_empty_file(self):
+        pgn_file = self.open('')
+        self.assertEqual(len(pgn_file), 0)
+        self.assertEqual(list(pgn_file), [])
+
+
+class IterResultsTests(PGNFileTestCase):
+    """Tests pgn.iter_results() and pgn.process_range()"""
+
+    def setUp(self):
+        super().setUp()
+        self.path = self.write(''.join(
+            '[White "{}"]\n\n1. e4 *\n\n'.format(name)
+            for name in ['A', 'B', 'Bad', 'D', 'E']))
+
+    def test_in_process(self):
+        self.assertEqual(
+            list(iter_results(self.path, _white, workers=0,
+                              games_per_range=2)),
+            [(1, 'A', None), (2, 'B', None), (3, None, 'bad game'),
+             (4, 'D', None), (5, 'E', None)])
+
+    def test_workers(self):
+        """Worker processes should give the same results, in order."""
+        self.assertEqual(
+            list(iter_results(self.path, _white, workers=2,
+                              games_per_range=2)),
+            list(iter_results(self.path, _white, workers=0)))
+
+    def test_range(self):
+        pgn_file = PGNFile(self.path)
+        self.addCleanup(pgn_file.close)
+        offsets = pgn_file.offsets[3:]
+        offsets.append(pgn_file.size)
+        self.assertEqual(process_range(self.path, 4, offsets, _white),
+                         [(4, 'D', None), (5, 'E', None)])
+
+    def test_game_fens(self):
+        fens, error = game_fens(Game(1, b'1. e4 e5 2. Ke3 *'))
+        self.assertEqual(len(fens), 2)
+        self.assertIn('ply 3', error)
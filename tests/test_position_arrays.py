@@ -0,0 +1,151 @@
+import os
+import random
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipIf
+from unittest.mock import patch
+
+from evaluation import evaluate
+from gamestate import GameState
+import position_arrays
+from position_arrays import (encode_boards, encode_players, load_fen_file,
+                             to_planes, evaluate_batch, features)
+
+KIWIPETE = ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/'
+            'R3K2R w KQkq - 0 1')
+
+
+def _random_positions(count, seed=1):
+    """Returns positions reached by random moves from the start."""
+    rng = random.Random(seed)
+    positions = []
+    g = GameState()
+    while len(positions) < count:
+        moves = list(g.legal_moves())
+        if not moves or g.halfmove_clock >= 100:
+            g = GameState()
+            continue
+        g._make_move(rng.choice(moves))
+        positions.append(g.copy())
+    return positions
+
+
+@skipIf(position_arrays.numpy is None, 'numpy is not installed')
+class EncodeTests(TestCase):
+    """Tests position_arrays.encode_boards() and encode_players()"""
+
+    def test_start(self):
+        boards = encode_boards([GameState()])
+        self.assertEqual(boards.shape, (1, 64))
+        self.assertEqual(boards.dtype, position_arrays.numpy.int8)
+        self.assertEqual(list(boards[0, :8]), [4, 2, 3, 5, 6, 3, 2, 4])
+        self.assertEqual(list(boards[0, 8:16]), [1] * 8)
+        self.assertEqual(list(boards[0, 16:48]), [0] * 32)
+        self.assertEqual(list(boards[0, 48:56]), [-1] * 8)
+        self.assertEqual(list(boards[0, 56:]),
+                         [-4, -2, -3, -5, -6, -3, -2, -4])
+
+    def test_players(self):
+        g = GameState()
+        black = g.copy()
+        black._make_move('e2e4')
+        self.assertEqual(list(encode_players([g, black])), [1, -1])
+
+    def test_empty(self):
+        self.assertEqual(encode_boards([]).shape, (0, 64))
+        self.assertEqual(encode_players([]).shape, (0,))
+
+    def test_planes(self):
+        planes = to_planes(encode_boards([GameState()]))
+        self.assertEqual(planes.shape, (1, 12, 64))
+        self.assertEqual(list(planes[0].sum(axis=1)),
+                         [8, 2, 2, 2, 1, 1] * 2)
+        self.assertEqual(planes[0, 5, 4], 1)
+        self.assertEqual(planes[0, 11, 60], 1)
+
+
+@skipIf(position_arrays.numpy is None, 'numpy is not installed')
+class LoadFenFileTests(TestCase):
+    """Tests position_arrays.load_fen_file()"""
+
+    def test_load(self):
+        errors = []
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'positions.fen')
+            with open(path, 'w') as fen_file:
+                fen_file.write('\n'.join([GameState().fen, 'not a fen',
+                                          KIWIPETE]) + '\n')
+            with patch.object(position_arrays, 'CHUNK_SIZE', 1):
+                boards, players = load_fen_file(
+                    path, on_error=lambda *args: errors.append(args))
+        self.assertEqual(boards.shape, (2, 64))
+        self.assertEqual(list(players), [1, 1])
+        expected = encode_boards([GameState(), GameState.from_fen(KIWIPETE)])
+        self.assertEqual(boards.tolist(), expected.tolist())
+        self.assertEqual(len(errors), 1)
+
+    def test_empty_file(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'empty.fen')
+            open(path, 'w').close()
+            boards, players = load_fen_file(path)
+        self.assertEqual(boards.shape, (0, 64))
+        self.assertEqual(players.shape, (0,))
+
+
+@skipIf(position_arrays.numpy is None, 'numpy is not installed')
+class EvaluateBatchTests(TestCase):
+    """Tests position_arrays.evaluate_batch()"""
+
+    def test_same_as_evaluate(self):
+        positions = [GameState(), GameState.from_fen(KIWIPETE),
+                     GameState.from_fen('4k3/8/8/8/8/8/8/3QK3 b - - 0 1')]
+        positions += _random_positions(200)
+        scores = evaluate_batch(encode_boards(positions),
+                                encode_players(positions))
+        self.assertEqual(scores.tolist(),
+                         [evaluate(g) for g in positions])
+
+
+@skipIf(position_arrays.numpy is None, 'numpy is not installed')
+class FeaturesTests(TestCase):
+    """Tests position_arrays.features()"""
+
+    def features(self, fen):
+        values = features(encode_boards([GameState.from_fen(fen)]))
+        return {name: int(value[0]) for name, value in values.items()}
+
+    def test_start(self):
+        self.assertEqual(self.features(GameState().fen),
+                         {'material': 0, 'mobility': 0, 'doubled_pawns': 0,
+                          'isolated_pawns': 0, 'passed_pawns': 0})
+
+    def test_mobility(self):
+        # knight d4: 8, king e1: 5, against king e8: 5
+        values = self.features('4k3/8/8/8/3N4/8/8/4K3 w - - 0 1')
+        self.assertEqual(values['mobility'], 8)
+        # rook a1 blocked by its own pawn on a4 and the king on e1
+        values = self.features('4k3/8/8/8/P7/8/8/R3K3 w - - 0 1')
+        self.assertEqual(values['mobility'], 5)
+
+    def test_pawns(self):
+        # white: doubled and isolated pawns on the a file, a passed pawn
+        # on e5; black: a pawn on h7 with nothing in front of it
+        values = self.features('4k3/7p/8/4P3/8/P7/P7/4K3 w - - 0 1')
+        self.assertEqual(values['doubled_pawns'], 1)
+        self.assertEqual(values['isolated_pawns'], 3 - 1)
+        self.assertEqual(values['passed_pawns'], 3 - 1)
+        self.assertEqual(values['material'], 200)
+
+    def test_pawn_blocked_from_neighbouring_file(self):
+        values = self.features('4k3/3p4/8/4P3/8/8/8/4K3 w - - 0 1')
+        self.assertEqual(values['passed_pawns'], 0)
+
+
+class NumpyMissingTests(TestCase):
+    """Tests position_arrays without numpy"""
+
+    def test_import_error(self):
+        with patch.object(position_arrays, 'numpy', None):
+            with self.assertRaises(ImportError) as context:
+                encode_boards([GameState()])
+        self.assertIn('pip install numpy', str(context.exception))
@@ -0,0 +1,129 @@
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+from gamestate import GameState
+from position_db import PositionDatabase
+
+
+def first_move(game_state):
+    return min(game_state.legal_moves(), default=None)
+
+
+def random_states(count, seed=3):
+    """Returns the positions of a random game, restarted when it ends."""
+    rng = random.Random(seed)
+    game_state = GameState()
+    states = []
+    while len(states) < count:
+        moves = sorted(game_state.legal_moves())
+        if not moves or game_state.halfmove_clock > 100:
+            game_state = GameState()
+            continue
+        game_state._make_move(rng.choice(moves))
+        states.append(game_state.copy())
+    return states
+
+
+class PositionDatabaseTests(TestCase):
+    """Tests position_db.PositionDatabase"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'positions.db')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_add_and_lookup(self):
+        db = PositionDatabase(self.path)
+        g = GameState()
+        self.assertIsNone(db.lookup(g))
+        self.assertNotIn(g, db)
+        number = db.add(g, move='e2e4', wdl=0)
+        self.assertEqual(db.lookup(g),
+                         {'move': 'e2e4', 'wdl': 0, 'dtz': None})
+        self.assertIn(g, db)
+        # annotations are updated in place and clocks are ignored
+        g.fullmove_number = 9
+        self.assertEqual(db.add(g, dtz=-3), number)
+        self.assertEqual(db.lookup(g),
+                         {'move': 'e2e4', 'wdl': 0, 'dtz': -3})
+        self.assertEqual(len(db), 1)
+        db.close()
+
+    def test_grows_and_persists(self):
+        """
+        Entries should survive being reopened, past the point where both
+        files have had to grow.
+        """
+        states = random_states(3000)
+        db = PositionDatabase(self.path)
+        for g in states:
+            db.add(g, move=first_move(g))
+        count = len(db)
+        self.assertGreater(db.stats['index_slots'], 1024)
+        db.close()
+
+        db = PositionDatabase(self.path)
+        self.assertEqual(len(db), count)
+        for g in states:
+            self.assertEqual(db.lookup(g)['move'], first_move(g))
+        self.assertEqual(db.game_state(0).fen, states[0].fen)
+        db.close()
+
+    def test_rebuilds_lost_index(self):
+        states = random_states(200)
+        db = PositionDatabase(self.path)
+        for g in states:
+            db.add(g)
+        db.close()
+        os.remove(self.path + '.idx')
+        db = PositionDatabase(self.path)
+        self.assertTrue(all(g in db for g in states))
+        db.close()
+
+    def test_hash_collisions(self):
+        """Positions whose hashes collide should be kept apart."""
+        db = PositionDatabase(self.path)
+        first = GameState()
+        second = GameState()
+        second._make_move('e2e4')
+        db.set((42, first.to_bytes()), 'e2e4')
+        db.set((42, second.to_bytes()), 'e7e5')
+        self.assertEqual(db.get((42, first.to_bytes())), 'e2e4')
+        self.assertEqual(db.get((42, second.to_bytes())), 'e7e5')
+        self.assertIsNone(db.get((43, first.to_bytes())))
+        db.close()
+
+    def test_import_file(self):
+        fen_path = os.path.join(self.tmp_dir.name, 'positions.fen')
+        with open(fen_path, 'w') as fen_file:
+            fen_file.write('\n'.join(g.fen for g in random_states(50)))
+            fen_file.write('\nasdf\n')
+        errors = []
+        db = PositionDatabase(self.path)
+        added = db.import_file(fen_path, lambda *args: errors.append(args))
+        self.assertEqual(added, len(db))
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(db.import_file(fen_path, lambda *args: None), 0)
+        db.close()
+
+    def test_move_cache(self):
+        """As a move cache, it should save the move source's answers."""
+        class Source:
+            calls = 0
+
+            def suggest_move(self, game_state):
+                self.calls += 1
+                return 'g1f3'
+
+        source = Source()
+        db = PositionDatabase(self.path)
+        for _ in range(2):
+            g = GameState(move_source=source, move_cache=db)
+            g.take_turn()
+        self.assertEqual(source.calls, 1)
+        self.assertEqual(db.lookup(GameState())['move'], 'g1f3')
+        db.close()
@@ -0,0 +1,159 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from gamestate import GameState
+from search import (SearchMoveSource, FallbackMoveSource, MATE_BOUND,
+                    _is_repetition)
+from tablebase import TablebaseError
+from transposition import TranspositionTable
+
+
+class FakeClock:
+    """A clock that moves on by a fixed step each time it is read."""
+
+    def __init__(self, step):
+        self.step = step
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+class SearchMoveSourceTests(TestCase):
+    """Tests search.SearchMoveSource"""
+
+    def search(self, fen, **kwargs):
+        kwargs.setdefault('time_limit', None)
+        source = SearchMoveSource(table=TranspositionTable(1 << 16),
+                                  **kwargs)
+        return source.search(GameState.from_fen(fen))
+
+    def test_mate_in_one(self):
+        result = self.search('6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1',
+                             max_depth=4)
+        self.assertEqual(result.move.uci, 'a1a8')
+        self.assertGreater(result.score, MATE_BOUND)
+
+    def test_mate_in_two(self):
+        """The quickest mate should be found, and scored as a mate."""
+        result = self.search('k7/8/1K6/8/8/8/8/7R w - - 0 1', max_depth=5)
+        self.assertGreater(result.score, MATE_BOUND)
+        g = GameState.from_fen('k7/8/1K6/8/8/8/8/7R w - - 0 1')
+        g._make_move(result.move)
+        for reply in list(g.legal_moves()):
+            child = g.copy()
+            child._make_move(reply)
+            self.assertGreater(self.search(child.fen, max_depth=3).score,
+                               MATE_BOUND)
+
+    def test_wins_material(self):
+        """A queen left hanging should be taken."""
+        result = self.search('4k3/8/8/3q4/8/8/3R4/3K4 w - - 0 1',
+                             max_depth=3)
+        self.assertEqual(result.move.uci, 'd2d5')
+        self.assertGreater(result.score, 300)
+
+    def test_avoids_losing_material(self):
+        """A capture that loses the queen to a pawn should be avoided."""
+        result = self.search('4k3/2p5/3p4/8/8/8/8/3QK3 w - - 0 1',
+                             max_depth=3)
+        self.assertNotEqual(result.move.uci, 'd1d6')
+
+    def test_node_budget(self):
+        result = self.search(
+            'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/'
+            'R3K2R w KQkq - 0 1', max_nodes=500)
+        self.assertLessEqual(result.nodes, 500)
+        g = GameState.from_fen('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/'
+                               'PPPBBPPP/R3K2R w KQkq - 0 1')
+        self.assertIn(result.move.uci, set(g.legal_moves()))
+
+    def test_time_budget(self):
+        """The search should stop once its time runs out."""
+        clock = FakeClock(0.1)
+        source = SearchMoveSource(time_limit=1.0, clock=clock,
+                                  table=TranspositionTable(1 << 16))
+        result = source.search(GameState())
+        self.assertLess(result.depth, 64)
+        self.assertLessEqual(result.seconds, 1.1)
+
+    def test_single_move_returned_at_once(self):
+        result = self.search('k7/8/8/8/8/8/1Q6/7K b - - 0 1')
+        self.assertEqual(result.move.uci, 'a8a7')
+        self.assertEqual(result.nodes, 0)
+
+    def test_no_moves(self):
+        for fen in ['R5k1/5ppp/8/8/8/8/8/6K1 b - - 0 1',
+                    'k7/2Q5/8/8/8/8/8/7K b - - 0 1']:
+            with self.assertRaises(TablebaseError):
+                self.search(fen)
+
+    def test_state_unchanged(self):
+        g = GameState.from_fen('r3k2r/8/8/3pP3/8/8/8/R3K2R w KQkq d6 0 1')
+        fen = g.fen
+        SearchMoveSource(max_depth=2, time_limit=None).search(g)
+        self.assertEqual(g.fen, fen)
+        self.assertEqual(g._undo, [])
+
+    def test_take_turn(self):
+        """GameState should make the searched move as its own."""
+        g = GameState.from_fen('6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1',
+                               SearchMoveSource(max_depth=2))
+        g.take_turn()
+        self.assertEqual(g.fen, 'R5k1/5ppp/8/8/8/8/8/6K1 b - - 1 1')
+
+    def test_table_shared_with_move_cache(self):
+        """Each turn should be searched, not taken from the last search."""
+        table = TranspositionTable(1 << 16)
+        source = SearchMoveSource(max_depth=4, time_limit=None, table=table)
+        g = GameState(move_source=source, move_cache=table)
+        with patch.object(source, 'suggest_move',
+                          wraps=source.suggest_move) as suggest_move:
+            g.take_turn()
+            g.take_turn()
+        self.assertEqual(suggest_move.call_count, 2)
+
+    def test_repetition(self):
+        g = GameState.from_fen('4k3/8/8/8/8/8/8/4K2R w - - 0 1')
+        for move in ['h1h2', 'e8d8', 'h2h1', 'd8e8']:
+            self.assertFalse(_is_repetition(g))
+            g.push(move)
+        self.assertTrue(_is_repetition(g))
+
+
+class FallbackMoveSourceTests(TestCase):
+    """Tests search.FallbackMoveSource"""
+
+    class Source:
+        def __init__(self, result):
+            self.result = result
+
+        def suggest_move(self, game_state):
+            if isinstance(self.result, Exception):
+                raise self.result
+            return self.result
+
+    def test_first_answer_used(self):
+        source = FallbackMoveSource(self.Source('e2e4'), self.Source('d2d4'))
+        self.assertEqual(source.suggest_move(GameState()), 'e2e4')
+        self.assertEqual(source.fallbacks, 0)
+
+    def test_falls_back(self):
+        for error in [TablebaseError('no moves'), ConnectionError('down')]:
+            source = FallbackMoveSource(self.Source(error),
+                                        self.Source('d2d4'))
+            self.assertEqual(source.suggest_move(GameState()), 'd2d4')
+            self.assertEqual(source.fallbacks, 1)
+
+    def test_last_error_raised(self):
+        source = FallbackMoveSource(self.Source(ConnectionError('down')),
+                                    self.Source(TablebaseError('no moves')))
+        with self.assertRaises(TablebaseError):
+            source.suggest_move(GameState())
+
+    def test_search_as_fallback(self):
+        source = FallbackMoveSource(self.Source(TablebaseError('no moves')),
+                                    SearchMoveSource(max_depth=1))
+        self.assertIn(source.suggest_move(GameState()),
+                      set(GameState().legal_moves()))
@@ -0,0 +1,77 @@
+from unittest import TestCase
+
+from gamestate import GameState
+from syzygy import SyzygyMoveSource, _rank
+from tablebase import TablebaseError
+
+
+class FakeSyzygy(SyzygyMoveSource):
+    """
+    A SyzygyMoveSource that scores positions by a simple rule instead of
+    reading tables: with the white queen on the board, black to move is
+    lost with a DTZ of 5, and otherwise the position is drawn.
+    """
+
+    def _open(self, directory):
+        self.probed = []
+        return None
+
+    def _probe(self, game_state):
+        self.probed.append(game_state.fen)
+        if 'Q' in game_state.fen.split()[0]:
+            return -2, -5
+        return 0, 0
+
+
+class SyzygyMoveSourceTests(TestCase):
+    """Tests syzygy.SyzygyMoveSource"""
+
+    def setUp(self):
+        self.source = FakeSyzygy('tables')
+        self.game = GameState()
+        self.game._parse_fen_str('7k/8/5K2/8/8/8/8/6Q1 w - - 0 1')
+
+    def test_mate_first(self):
+        """A checkmating move should be suggested before any other."""
+        self.assertEqual(self.source.suggest_move(self.game), 'g1g7')
+
+    def test_wins_before_draws(self):
+        """
+        Moves that keep the win should come before a stalemate.
+        """
+        moves = self.source.get_moves(self.game)
+        self.assertEqual(len(moves), len(list(self.game.legal_moves())))
+        results = [details['wdl'] for details in moves.values()]
+        self.assertEqual(results, sorted(results, reverse=True))
+        self.assertEqual(moves['g1g6'], {'wdl': 0, 'dtz': 0})
+        self.assertEqual(list(moves)[-1], 'g1g6')
+
+    def test_too_many_pieces(self):
+        """Positions with too many pieces should not be probed."""
+        with self.assertRaises(TablebaseError):
+            self.source.suggest_move(GameState())
+        self.assertEqual(self.source.probed, [])
+
+    def test_injected_into_game_state(self):
+        """take_turn() should be able to use the local tables."""
+        self.game.move_source = self.source
+        self.game.take_turn()
+        self.assertEqual(self.game.fen, '7k/6Q1/5K2/8/8/8/8/8 b - - 1 1')
+
+
+class RankTests(TestCase):
+    """Tests the move ordering used by SyzygyMoveSource."""
+
+    def test_zeroing_wins_first(self):
+        """A winning capture or pawn move beats a faster plain win."""
+        self.assertLess(_rank(2, 9, False, True), _rank(2, 1, False, False))
+
+    def test_fastest_win_and_slowest_loss(self):
+        self.assertLess(_rank(2, 3, False, False), _rank(2, 7, False, False))
+        self.assertLess(_rank(-2, -9, False, False),
+                        _rank(-2, -3, False, False))
+
+    def test_cursed_win_after_win(self):
+        """A win spoiled by the 50-move rule ranks below a real win."""
+        self.assertLess(_rank(2, 90, False, False), _rank(1, 3, False, False))
+        self.assertLess(_rank(1, 3, False, False), _rank(0, 0, False, False))
@@ -0,0 +1,266 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from urllib.parse import urlparse, parse_qs
+
+from gamestate import GameState, play_many
+from search import FallbackMoveSource
+from tablebase import TablebaseClient, TablebaseError
+
+# Black has mated White, so the API has no moves to suggest.
+FOOLS_MATE = ('rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR '
+              'w KQkq - 1 3')
+
+
+class StubTablebase:
+    """
+    A local HTTP server standing in for the tablebase API. Each request
+    is answered with the next (status, moves) pair from `responses`,
+    repeating the last one when they run out. Moves given as a string
+    are sent as the body as they are.
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.connections = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                stub.requests.append(query['fen'][0])
+                stub.connections.add(self.client_address)
+                status, moves = (stub.responses.pop(0)
+                                 if len(stub.responses) > 1
+                                 else stub.responses[0])
+                if isinstance(moves, str):
+                    body = moves.encode()
+                else:
+                    body = json.dumps({'moves': moves}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        port = self.server.server_address[1]
+        self.url = 'http://127.0.0.1:{}/api/v2'.format(port)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={'poll_interval': 0.01},
+                                       daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class AsyncStubTablebase:
+    """
+    An asyncio HTTP server standing in for the tablebase API. It waits
+    `delay` seconds before answering each request with the first legal
+    move in alphabetical order, and records how many requests it was
+    handling at once.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.request_count = 0
+        self.writers = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = 'http://127.0.0.1:{}/api/v2'.format(port)
+
+    async def _handle(self, reader, writer):
+        self.writers.add(writer)
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            while (await reader.readline()).strip():
+                pass
+            self.request_count += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(self.delay)
+            self.in_flight -= 1
+
+            path = request_line.split()[1].decode()
+            g = GameState()
+            g._parse_fen_str(parse_qs(urlparse(path).query)['fen'][0])
+            moves = sorted(g.legal_moves())
+            body = json.dumps({'moves': _moves(*moves[:1])})
+            writer.write('HTTP/1.1 200 OK\r\n'
+                         'Content-Type: application/json\r\n'
+                         'Content-Length: {}\r\n\r\n{}'
+                         .format(len(body), body).encode())
+            await writer.drain()
+        writer.close()
+
+    async def close(self):
+        for writer in self.writers:
+            writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def _moves(*ucis):
+    # the API lists moves as a JSON object in best-first order
+    return {uci: {'uci': uci} for uci in ucis}
+
+
+class TablebaseClientTests(TestCase):
+    """Tests tablebase.TablebaseClient against a local stub server."""
+
+    def _stub(self, responses):
+        stub = StubTablebase(responses)
+        self.addCleanup(stub.close)
+        return stub
+
+    def test_suggests_first_move(self):
+        """Should suggest the first move in the API's ordering."""
+        stub = self._stub([(200, _moves('h7h5', 'a7a5', 'b7b6'))])
+        client = TablebaseClient(stub.url)
+        self.assertEqual(client.suggest_move(GameState()), 'h7h5')
+        self.assertEqual(stub.requests, [GameState().fen])
+
+    def test_reuses_connection(self):
+        """Requests should share one kept-alive connection."""
+        stub = self._stub([(200, _moves('e2e4'))])
+        client = TablebaseClient(stub.url)
+        for _ in range(5):
+            client.suggest_move(GameState())
+        self.assertEqual(len(stub.requests), 5)
+        self.assertEqual(len(stub.connections), 1)
+
+    def test_retries_server_errors(self):
+        """Should retry on 429 and 5xx responses before giving up."""
+        stub = self._stub([(503, {}), (429, {}), (200, _moves('d2d4'))])
+        client = TablebaseClient(stub.url, backoff_factor=0)
+        self.assertEqual(client.suggest_move(GameState()), 'd2d4')
+        self.assertEqual(len(stub.requests), 3)
+
+    def test_no_moves(self):
+        """Should raise TablebaseError when no move is suggested."""
+        stub = self._stub([(200, {})])
+        client = TablebaseClient(stub.url)
+        with self.assertRaises(TablebaseError):
+            client.suggest_move(GameState())
+
+    def test_invalid_body(self):
+        """Should raise TablebaseError when the body is not JSON."""
+        for body in ['<html>Bad gateway</html>', '[]']:
+            stub = self._stub([(200, body)])
+            client = TablebaseClient(stub.url)
+            with self.assertRaises(TablebaseError):
+                client.suggest_move(GameState())
+
+    def test_invalid_body_falls_back(self):
+        stub = self._stub([(200, '<html>Bad gateway</html>')])
+        fallback = self._stub([(200, _moves('c2c4'))])
+        source = FallbackMoveSource(TablebaseClient(stub.url),
+                                    TablebaseClient(fallback.url))
+        self.assertEqual(source.suggest_move(GameState()), 'c2c4')
+        self.assertEqual(source.fallbacks, 1)
+
+    def test_injected_into_game_state(self):
+        """take_turn() should use the client the GameState was given."""
+        stub = self._stub([(200, _moves('g1f3'))])
+        g = GameState(move_source=TablebaseClient(stub.url))
+        g.take_turn()
+        self.assertEqual(g.fen,
+                         'rnbqkbnr/pppppppp/8/8/8/5N2/PPPPPPPP/RNBQKB1R '
+                         'b KQkq - 1 1')
+
+
+class PlayManyTests(TestCase):
+    """Tests GameState.take_turn_async() and play_many()"""
+
+    def _play(self, game_count, concurrency, plies, delay=0.1, fens=(),
+              on_error=None):
+        async def run():
+            stub = AsyncStubTablebase(delay)
+            await stub.start()
+            client = TablebaseClient(stub.url, pool_size=concurrency)
+            states = [GameState(move_source=client)
+                      for _ in range(game_count)]
+            for fen in fens:
+                states.append(GameState(move_source=client))
+                states[-1]._parse_fen_str(fen)
+            start = time.perf_counter()
+            try:
+                await play_many(states, concurrency=concurrency,
+                                plies=plies, on_error=on_error)
+                elapsed = time.perf_counter() - start
+            finally:
+                client.close()
+                await stub.close()
+            return stub, states, elapsed
+
+        return asyncio.run(run())
+
+    def test_lookups_overlap(self):
+        """
+        With enough concurrency, each ply should take about one round
+        trip across all games, instead of one per game.
+        """
+        stub, states, elapsed = self._play(8, 8, 2)
+        self.assertEqual(stub.request_count, 16)
+        self.assertGreater(stub.max_in_flight, 1)
+        self.assertLess(elapsed, 16 * 0.1 / 2)
+        for g in states:
+            # a2a3 then a7a5 are the alphabetically first legal moves
+            self.assertEqual(g.fen, 'rnbqkbnr/1ppppppp/8/p7/8/P7/'
+                                    '1PPPPPPP/RNBQKBNR w KQkq a6 0 2')
+
+    def test_concurrency_is_bounded(self):
+        """No more than `concurrency` lookups should run at once."""
+        stub, _, _ = self._play(6, 2, 1, delay=0.05)
+        self.assertEqual(stub.request_count, 6)
+        self.assertLessEqual(stub.max_in_flight, 2)
+
+    def test_error_stops_one_game(self):
+        """A game with no moves should not stop the others."""
+        errors = []
+        stub, states, _ = self._play(
+            3, 2, 2, delay=0, fens=[FOOLS_MATE],
+            on_error=lambda *args: errors.append(args))
+        self.assertEqual(stub.request_count, 3 * 2 + 1)
+        self.assertEqual(len(errors), 1)
+        self.assertIs(errors[0][0], states[3])
+        self.assertIsInstance(errors[0][1], TablebaseError)
+        self.assertEqual(states[3].fen, FOOLS_MATE)
+        for g in states[:3]:
+            self.assertEqual(g.fullmove_number, 2)
+
+    def test_error_raised_after_all_games(self):
+        with self.assertRaises(TablebaseError):
+            self._play(2, 2, 2, delay=0, fens=[FOOLS_MATE])
+
+    def test_take_turn_async(self):
+        """A single game should be playable from a coroutine."""
+        async def run():
+            stub = AsyncStubTablebase(0)
+            await stub.start()
+            g = GameState(move_source=TablebaseClient(stub.url))
+            await g.take_turn_async()
+            g.move_source.close()
+            await stub.close()
+            return g
+
+        g = asyncio.run(run())
+        self.assertEqual(g._get_piece('a', '3'), 'P')
@@ -0,0 +1,102 @@
+import random
+from unittest import TestCase
+from unittest.mock import patch
+
+from gamestate import GameState
+from transposition import (TranspositionTable, encode_move, decode_move,
+                           BOUND_EXACT, BOUND_LOWER, BOUND_UPPER, ENTRY_SIZE)
+
+
+class MoveEncodingTests(TestCase):
+    """Tests encode_move() and decode_move()"""
+
+    def test_round_trip(self):
+        for move in ['e2e4', 'a1h8', 'h7h8q', 'b2a1n', 'e1g1']:
+            self.assertEqual(decode_move(encode_move(move)), move)
+
+    def test_fits_in_16_bits(self):
+        self.assertLess(encode_move('h7h8q'), 1 << 16)
+
+
+class TranspositionTableTests(TestCase):
+    """Tests transposition.TranspositionTable"""
+
+    def test_memory_limit(self):
+        """The table should never use more than the given memory."""
+        for max_bytes in [1000, 4096, 1 << 20, (1 << 20) + 5000]:
+            table = TranspositionTable(max_bytes)
+            self.assertLessEqual(table.memory_bytes, max_bytes)
+            self.assertGreater(table.memory_bytes, max_bytes // 2)
+            self.assertEqual(table.memory_bytes,
+                             table.capacity * ENTRY_SIZE)
+
+    def test_save_and_probe(self):
+        table = TranspositionTable(4096)
+        key = random.Random(0).getrandbits(64)
+        self.assertIsNone(table.probe(key))
+        table.save(key, encode_move('e2e4'), -35, 6, BOUND_LOWER)
+        self.assertEqual(table.probe(key),
+                         (encode_move('e2e4'), -35, 6, BOUND_LOWER))
+        self.assertEqual(table.stats['probes'], 2)
+        self.assertEqual(table.stats['hits'], 1)
+
+    def test_replace_by_depth(self):
+        """
+        A shallow result should not push a deeper one out of a bucket,
+        but a deeper one pushes out the oldest shallow one.
+        """
+        table = TranspositionTable(ENTRY_SIZE * 2)  # a single bucket
+        table.save(1, 0, 10, 8, BOUND_EXACT)
+        table.save(2, 0, 20, 2, BOUND_EXACT)
+        table.save(3, 0, 30, 1, BOUND_EXACT)
+        self.assertIsNotNone(table.probe(1))
+        self.assertIsNone(table.probe(2))
+        self.assertIsNotNone(table.probe(3))
+        self.assertEqual(table.stats['collisions'], 1)
+        table.save(4, 0, 40, 9, BOUND_UPPER)
+        self.assertIsNotNone(table.probe(4))
+        self.assertIsNotNone(table.probe(1))
+        self.assertIsNone(table.probe(3))
+
+    def test_replace_by_age(self):
+        """Entries from an earlier search should be replaced first."""
+        table = TranspositionTable(ENTRY_SIZE * 2)
+        table.save(1, 0, 10, 8, BOUND_EXACT)
+        table.new_search()
+        table.save(2, 0, 20, 1, BOUND_EXACT)
+        table.save(3, 0, 30, 1, BOUND_EXACT)
+        self.assertIsNone(table.probe(1))
+        self.assertIsNotNone(table.probe(2))
+        self.assertIsNotNone(table.probe(3))
+
+    def test_many_positions(self):
+        """Should keep working, within its size, as it fills up."""
+        table = TranspositionTable(1 << 12)
+        rng = random.Random(2)
+        keys = [rng.getrandbits(64) for _ in range(2000)]
+        for index, key in enumerate(keys):
+            table.save(key, 0, index, 1, BOUND_EXACT)
+        for index, key in enumerate(keys):
+            entry = table.probe(key)
+            if entry is not None:
+                self.assertEqual(entry[1], index)
+        self.assertEqual(table.hashfull(), 1000)
+
+    @patch.object(GameState, '_request_suggested_move', return_value='e2e4')
+    def test_as_move_cache(self, mocked):
+        """GameState should be able to cache suggested moves in it."""
+        table = TranspositionTable(4096)
+        GameState(move_cache=table).take_turn()
+        g = GameState(move_cache=table)
+        g.take_turn()
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(g._get_piece('e', '4'), 'P')
+
+    def test_search_entries_not_cached_moves(self):
+        """Moves saved during a search should not be given as answers."""
+        table = TranspositionTable(4096)
+        key = GameState().zobrist_hash
+        table.save(key, encode_move('d2d4'), 0, 3, BOUND_EXACT)
+        self.assertIsNone(table.get(key))
+        table.set(key, 'e2e4')
+        self.assertEqual(table.get(key), 'e2e4')
@@ -0,0 +1,209 @@
+"""
+Fixed-size transposition table keyed by Zobrist hash.
+
+The table is a preallocated array of 64-bit words that never grows, so
+a long-running worker has a hard memory limit no matter how many
+positions it sees. Each entry is two words: the hash XORed with the
+data, and the data itself, which packs a move, a score, a search depth,
+a bound type and an age. Storing the hash XORed with the data means an
+entry that was torn by a concurrent writer fails its key check instead
+of giving back another position's data.
+
+Entries live in buckets of two. The first slot of a bucket keeps the
+deepest result, unless it is from an older search, and the second slot
+always takes the newest result that does not fit in the first.
+"""
+
+from array import array
+
+from move import from_uci, to_uci
+
+# Bound types, telling how a stored score relates to the true score.
+BOUND_EXACT = 1
+BOUND_LOWER = 2
+BOUND_UPPER = 3
+
+# The depth stored for results that come from a move source, such as
+# the tablebase, and so are as good as a search of any depth.
+MAX_DEPTH = 255
+
+ENTRY_SIZE = 16
+BUCKET_SIZE = 2
+
+_SCORE_OFFSET = 1 << 31
+
+
+def encode_move(move_str):
+    """
+    Packs a UCI move string into a 16-bit integer, as by the `move`
+    module. Moves packed by move generation can be stored as they are.
+    """
+    return from_uci(move_str)
+
+
+def decode_move(code):
+    """Unpacks a move packed by `encode_move()` into a UCI string."""
+    return to_uci(code)
+
+
+class TranspositionTable:
+    """
+    Bounded table of search and move source results.
+
+    Search code uses `probe()` and `save()` with Zobrist hashes. The
+    table can also be given to GameState as its `move_cache`, through
+    `key_for()`, `get()` and `set()`, to remember suggested moves.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, buffer=None):
+        """
+        Constructor for TranspositionTable class
+
+        Arguments:
+        max_bytes -- the most memory the entries may use. The table
+        holds the largest power of two number of buckets that fits.
+        buffer -- optionally, a writable buffer to keep the entries in,
+        such as shared memory, instead of allocating them. It must hold
+        at least `max_bytes` bytes, and starts out zeroed.
+        """
+        buckets = max(1, max_bytes // (ENTRY_SIZE * BUCKET_SIZE))
+        buckets = 1 << (buckets.bit_length() - 1)
+        self._mask = buckets - 1
+        words = buckets * BUCKET_SIZE * 2
+        if buffer is None:
+            self._words = array('Q', bytes(words * 8))
+        else:
+            self._words = memoryview(buffer).cast('B')[:words * 8].cast('Q')
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+        self.stores = 0
+
+    @property
+    def capacity(self):
+        """Property. The number of entries the table can hold."""
+        return (self._mask + 1) * BUCKET_SIZE
+
+    @property
+    def memory_bytes(self):
+        """Property. The number of bytes used by the entries."""
+        return self.capacity * ENTRY_SIZE
+
+    def new_search(self):
+        """
+        Marks the start of a new search, so that entries left from
+        earlier ones are replaced first.
+        """
+        self.age = (self.age + 1) & 63
+
+    def clear(self):
+        """Empties the table."""
+        words = self._words
+        for index in range(len(words)):
+            words[index] = 0
+
+    def probe(self, key):
+        """
+        Looks up the position with the given Zobrist hash. Returns a
+        (move, score, depth, bound) tuple, where move is packed as by
+        `encode_move()` or 0 for none, or None if the position is not
+        in the table.
+        """
+        self.probes += 1
+        words = self._words
+        index = (key & self._mask) * BUCKET_SIZE * 2
+        occupied = False
+        for slot in range(index, index + BUCKET_SIZE * 2, 2):
+            data = words[slot + 1]
+            if data:
+                if words[slot] ^ data == key:
+                    self.hits += 1
+                    return (data & 0xFFFF, (data >> 32) - _SCORE_OFFSET,
+                            data >> 16 & 0xFF, data >> 24 & 3)
+                occupied = True
+        if occupied:
+            self.collisions += 1
+        return None
+
+    def save(self, key, move, score, depth, bound):
+        """
+        Stores a result for the position with the given Zobrist hash.
+
+        Arguments:
+        key -- the Zobrist hash of the position.
+        move -- the best move, packed as by `encode_move()`, or 0.
+        score -- the score, which must fit in 32 bits.
+        depth -- the depth searched, clamped to 0 to `MAX_DEPTH`.
+        bound -- one of `BOUND_EXACT`, `BOUND_LOWER` or `BOUND_UPPER`.
+        """
+        self.stores += 1
+        data = (move | max(0, min(depth, MAX_DEPTH)) << 16 | bound << 24
+                | self.age << 26 | (score + _SCORE_OFFSET) << 32)
+        words = self._words
+        index = (key & self._mask) * BUCKET_SIZE * 2
+        first = words[index + 1]
+        second_key = words[index + 2] ^ words[index + 3]
+        if (not first or words[index] ^ first == key
+                or first >> 26 & 63 != self.age
+                or depth >= first >> 16 & 0xFF):
+            if second_key == key:
+                # the position moves up to the depth-preferred slot
+                words[index + 2] = words[index + 3] = 0
+            if first and words[index] ^ first != key:
+                # demote the old entry rather than lose it
+                words[index + 2] = words[index]
+                words[index + 3] = first
+            words[index] = key ^ data
+            words[index + 1] = data
+        else:
+            words[index + 2] = key ^ data
+            words[index + 3] = data
+
+    def key_for(self, game_state):
+        """Returns the key a GameState is stored under: its hash."""
+        return game_state.zobrist_hash
+
+    def get(self, key):
+        """
+        Returns the move, as a UCI string, stored by `set()` for the
+        position with the given Zobrist hash, or None. Moves saved by a
+        search, which may only be the best found at a shallow depth,
+        are not returned.
+        """
+        entry = self.probe(key)
+        if entry is None or not entry[0] or entry[2] != MAX_DEPTH:
+            return None
+        return decode_move(entry[0])
+
+    def set(self, key, move):
+        """
+        Stores a move suggested by a move source, as a UCI string, for
+        the position with the given Zobrist hash.
+        """
+        self.save(key, encode_move(move), 0, MAX_DEPTH, BOUND_EXACT)
+
+    def hashfull(self, sample=1000):
+        """
+        Returns how full the table is, in permille, estimated from the
+        first `sample` entries.
+        """
+        words = self._words
+        count = min(sample, self.capacity)
+        used = sum(1 for entry in range(count) if words[entry * 2 + 1])
+        return used * 1000 // count
+
+    @property
+    def stats(self):
+        """
+        Property. A dict of the probe, hit, collision and store counts,
+        along with the table's size.
+        """
+        return {
+            'probes': self.probes,
+            'hits': self.hits,
+            'collisions': self.collisions,
+            'stores': self.stores,
+            'capacity': self.capacity,
+            'memory_bytes': self.memory_bytes,
+        }
@@ -0,0 +1,48 @@
+"""
+Zobrist hashing of GameState positions.
+
+A position's hash is the XOR of one random 64-bit key for each piece on
+each square, one for the castling rights, one for the file of the en
+passant square, if there is one, and one more when it is black's turn.
+Because XOR undoes itself, GameState keeps the hash up to date as it
+changes by XORing keys in and out, instead of hashing the whole
+position again. The keys come from a fixed seed, so hashes are the same
+in every process and can be stored.
+"""
+
+import random
+
+from bitboards import iter_squares
+
+_random = random.Random(0x5A0B1157)
+
+# PIECE_KEYS[index * 64 + square] is the key for the piece with the given
+# bitboard index on the given square.
+PIECE_KEYS = [_random.getrandbits(64) for _ in range(12 * 64)]
+# CASTLING_KEYS[rights] is the key for a set of castling rights, given as
+# a bitmask of the GameState `CASTLE_*` bits.
+CASTLING_KEYS = [0] + [_random.getrandbits(64) for _ in range(15)]
+# EN_PASSANT_KEYS[file] is the key for an en passant square on the given
+# file, counting from 0 for the a-file.
+EN_PASSANT_KEYS = [_random.getrandbits(64) for _ in range(8)]
+BLACK_TO_MOVE_KEY = _random.getrandbits(64)
+
+del _random
+
+
+def compute_hash(game_state):
+    """
+    Returns the Zobrist hash of the given GameState, worked out from
+    scratch. GameState keeps its own hash up to date, so this is mostly
+    useful for checking it.
+    """
+    ret = 0
+    for index, bitboard in enumerate(game_state._pieces):
+        for square in iter_squares(bitboard):
+            ret ^= PIECE_KEYS[index * 64 + square]
+    ret ^= CASTLING_KEYS[game_state._castling]
+    if game_state.en_passant:
+        ret ^= EN_PASSANT_KEYS[ord(game_state.en_passant[0]) - 97]
+    if game_state.player == 'b':
+        ret ^= BLACK_TO_MOVE_KEY
+    return ret